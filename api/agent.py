@@ -1,7 +1,10 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from typing import Optional
-from joao import AsyncAgent
+from typing import TYPE_CHECKING, Optional
+from webapp.provider_sdk import provider_sdk
+
+if TYPE_CHECKING:
+    from joao import AsyncAgent
 
 """
 For details about the joao API check:
@@ -12,18 +15,18 @@ For details about the joao API check:
 router = APIRouter(prefix="/api/agent")
 
 # Store the agent instance
-agent: Optional[AsyncAgent] = None
+agent: Optional["AsyncAgent"] = None
 
 def get_agent():
     return agent
 
-def set_agent(new_agent: AsyncAgent):
+def set_agent(new_agent: "AsyncAgent"):
     global agent
     agent = new_agent
 
 def initialize_agent(api_key: str, provider: str):
     global agent
-    agent = AsyncAgent(
+    agent = provider_sdk.agent_class()(
         "You are an expert software developer",
         api_key=api_key
     )
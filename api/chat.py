@@ -1,153 +1,195 @@
-from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
-from typing import List, Optional
-from joao import AsyncAgent
-from .models import Message, AIConfig
-from .config import load_config, SYSTEM_PROMPT
+import asyncio
+import json
+from contextlib import aclosing
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from webapp import settings
+from webapp.agent_pool import hash_api_key
+from webapp.config import config_service, get_provider_info, SYSTEM_PROMPT
+from webapp.providers import provider_router
+from webapp.response_cache import response_cache
+from webapp.validation import key_validator
+from webapp.ws.scheduler import scheduler, QueueFull
+from .models import Message, AIConfig, BatchRequest
 import traceback
 
 router = APIRouter(prefix="/api")
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-
-    async def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
+# Streamed HTTP responses are NDJSON, or Server-Sent Events when the client accepts them
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+SSE_MEDIA_TYPE = "text/event-stream"
+
+BUSY_MESSAGE = "Server is busy, please try again later"
+
+def wants_sse(request: Request) -> bool:
+    return SSE_MEDIA_TYPE in request.headers.get("accept", "")
+
+def encode_event(event: Dict, sse: bool) -> str:
+    """One NDJSON line, or one SSE event named after the event type."""
+    data = json.dumps(event, separators=(",", ":"))
+    if sse:
+        return f"event: {event['type']}\ndata: {data}\n\n"
+    return data + "\n"
+
+def streaming_response(events: AsyncIterator[str], sse: bool) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type=SSE_MEDIA_TYPE if sse else NDJSON_MEDIA_TYPE,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def chat_cache_key(config: Dict, content: str) -> str:
+    model = get_provider_info(config["provider"], config["api_key"])["model"]
+    return response_cache.make_key(config["provider"], model, SYSTEM_PROMPT, content)
+
+async def ask_provider(config: Dict, content: str, requester: object) -> str:
+    """Get a whole answer from the routed provider backends.
+
+    Waits for a slot in the scheduler shared with WebSocket traffic;
+    requester is the scheduler's per-connection key. Raises QueueFull when
+    too many requests are already waiting.
+    """
+    async with scheduler.slot(requester, hash_api_key(config["api_key"])):
+        return await provider_router.complete(config, SYSTEM_PROMPT, content)
+
+async def complete(config: Dict, content: str, requester: object) -> Tuple[str, bool]:
+    """Answer a message from the response cache or the provider; returns (response, cached)."""
+    cache_key = chat_cache_key(config, content)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached, True
+    response = await ask_provider(config, content, requester)
+    response_cache.put(cache_key, response)
+    return response, False
+
+async def stream_chat(config: Dict, content: str, sse: bool, requester: object) -> AsyncIterator[str]:
+    """Stream one answer as chunk events, ending with an end or error event."""
+    cache_key = chat_cache_key(config, content)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        yield encode_event({"type": "chunk", "content": cached, "cached": True}, sse)
+        yield encode_event({"type": "end"}, sse)
+        return
+
+    response_parts = []
+    try:
+        async with scheduler.slot(requester, hash_api_key(config["api_key"])):
+            # A client disconnect cancels this generator, which closes the provider stream
+            async with aclosing(await provider_router.open_stream(config, SYSTEM_PROMPT, content)) as stream:
+                async for token in stream:
+                    response_parts.append(token)
+                    yield encode_event({"type": "chunk", "content": token}, sse)
+    except QueueFull:
+        yield encode_event({"type": "error", "content": BUSY_MESSAGE}, sse)
+        return
+    except Exception as e:
+        yield encode_event({"type": "error", "content": f"Agent error: {str(e)}"}, sse)
+        return
+    response_cache.put(cache_key, "".join(response_parts))
+    yield encode_event({"type": "end"}, sse)
+
+async def run_batch(config: Dict, messages: List[Message], concurrency: int, sse: bool) -> AsyncIterator[str]:
+    """Answer messages on a fixed number of workers, yielding each result as it finishes."""
+    pending = iter(enumerate(messages))
+    results: asyncio.Queue = asyncio.Queue()
+
+    async def worker():
+        # Each worker runs one message at a time, so it counts as one connection in the scheduler
+        requester = asyncio.current_task()
+        for index, message in pending:
+            try:
+                response, cached = await complete(config, message.content, requester)
+                results.put_nowait({"type": "result", "index": index, "content": response, "cached": cached})
+            except QueueFull:
+                results.put_nowait({"type": "error", "index": index, "content": BUSY_MESSAGE})
+            except Exception as e:
+                results.put_nowait({"type": "error", "index": index, "content": f"Agent error: {str(e)}"})
 
-manager = ConnectionManager()
+    workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(messages)))]
+    errors = 0
+    try:
+        for _ in range(len(messages)):
+            result = await results.get()
+            errors += result["type"] == "error"
+            yield encode_event(result, sse)
+        yield encode_event({"type": "end", "count": len(messages), "errors": errors}, sse)
+    finally:
+        # Stop answering once the client is gone
+        for task in workers:
+            task.cancel()
 
 @router.post("/chat")
-async def chat(message: Message):
-    config = load_config()
+async def chat(message: Message, request: Request):
+    config = await config_service.snapshot()
     if not config:
         raise HTTPException(status_code=400, detail="AI not configured")
 
+    if message.stream:
+        sse = wants_sse(request)
+        return streaming_response(stream_chat(config, message.content, sse, request), sse)
+
     try:
-        agent = AsyncAgent(
-            SYSTEM_PROMPT,
-            api_key=config["api_key"],
-            tenant_prefix=config["provider"].upper()
-        )
-        response = await agent.request(message.content)
+        response, _ = await complete(config, message.content, request)
         return {"response": response}
+    except QueueFull:
+        raise HTTPException(status_code=503, detail=BUSY_MESSAGE)
     except Exception as e:
         error_detail = f"Agent error: {str(e)}\nTraceback:\n{traceback.format_exc()}"
         raise HTTPException(status_code=500, detail=error_detail)
 
+@router.post("/chat/batch")
+async def chat_batch(batch: BatchRequest, request: Request):
+    config = await config_service.snapshot()
+    if not config:
+        raise HTTPException(status_code=400, detail="AI not configured")
+    if not batch.messages:
+        raise HTTPException(status_code=400, detail="No messages")
+    if len(batch.messages) > settings.BATCH_MAX_MESSAGES:
+        raise HTTPException(status_code=413, detail=f"At most {settings.BATCH_MAX_MESSAGES} messages per batch")
+
+    concurrency = max(1, min(batch.concurrency or settings.BATCH_CONCURRENCY, settings.BATCH_CONCURRENCY))
+    sse = wants_sse(request)
+    return streaming_response(run_batch(config, batch.messages, concurrency, sse), sse)
+
 @router.post("/hello")
-async def hello(config: Optional[AIConfig] = None):
+async def hello(request: Request, config: Optional[AIConfig] = None):
     # If config is provided, use it for testing
     if config:
         test_config = config.dict()
     else:
-        test_config = load_config()
+        test_config = await config_service.snapshot()
         
     if not test_config:
         raise HTTPException(status_code=400, detail="AI not configured")
 
+    if config:
+        # A key already known to be bad fails fast; otherwise the request below is the check
+        known = key_validator.cached(test_config["provider"], test_config["api_key"])
+        if known is not None and not known[0]:
+            raise HTTPException(status_code=400, detail=f"Invalid configuration: {known[1]}")
+
+    prompt = "Hello! Please introduce yourself briefly."
+    model = get_provider_info(test_config["provider"], test_config["api_key"])["model"]
+    cache_key = response_cache.make_key(test_config["provider"], model, SYSTEM_PROMPT, prompt)
+    cached = response_cache.get(cache_key)
+    # The cache can't vouch for a key that hasn't been checked yet
+    if cached is not None and (not config or known is not None):
+        return {"response": cached}
+
     try:
-        agent = AsyncAgent(
-            SYSTEM_PROMPT,
-            api_key=test_config["api_key"],
-            tenant_prefix=test_config["provider"].upper()
-        )
-        response = await agent.request("Hello! Please introduce yourself briefly.")
-        return {"response": response}
+        response = await ask_provider(test_config, prompt, request)
+    except QueueFull:
+        raise HTTPException(status_code=503, detail=BUSY_MESSAGE)
     except Exception as e:
+        if config:
+            # Same verdict a separate validation request would have given
+            key_validator.record(test_config["provider"], test_config["api_key"], False, str(e))
+            raise HTTPException(status_code=400, detail=f"Invalid configuration: {str(e)}")
         error_detail = f"Agent error: {str(e)}\nTraceback:\n{traceback.format_exc()}"
         raise HTTPException(status_code=500, detail=error_detail)
 
-@router.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
-    try:
-        config = load_config()
-        if not config:
-            await websocket.send_json({
-                "type": "error",
-                "content": "AI not configured",
-                "metadata": {"error_type": "configuration"}
-            })
-            await manager.disconnect(websocket)
-            return
-
-        agent = AsyncAgent(
-            SYSTEM_PROMPT,
-            api_key=config["api_key"],
-            tenant_prefix=config["provider"].upper()
-        )
-
-        while True:
-            # Receive message from client
-            data = await websocket.receive_json()
-            
-            try:
-                # Process the message
-                if data["type"] == "message":
-                    # Get metadata
-                    metadata = data.get("metadata", {})
-                    user_input_id = metadata.get("user_input_id")
-
-                    # Send acknowledgment that message was received
-                    await websocket.send_json({
-                        "type": "status",
-                        "content": "processing",
-                        "metadata": {"user_input_id": user_input_id}
-                    })
-
-                    # Get response from agent with streaming
-                    response_stream = await agent.request(data["content"], stream=True)
-                    async for chunk in response_stream:
-                        await websocket.send_json({
-                            "type": "chunk",
-                            "content": chunk,
-                            "metadata": {"user_input_id": user_input_id}
-                        })
-
-                    # Send completion message
-                    await websocket.send_json({
-                        "type": "status",
-                        "content": "complete",
-                        "metadata": {"user_input_id": user_input_id}
-                    })
-                else:
-                    await websocket.send_json({
-                        "type": "error",
-                        "content": "Unknown message type",
-                        "metadata": {"error_type": "invalid_message"}
-                    })
-
-            except Exception as e:
-                error_detail = f"Agent error: {str(e)}"
-                await websocket.send_json({
-                    "type": "error",
-                    "content": error_detail,
-                    "metadata": {
-                        "error_type": "agent_error",
-                        "user_input_id": metadata.get("user_input_id") if "metadata" in data else None
-                    }
-                })
-
-    except WebSocketDisconnect:
-        await manager.disconnect(websocket)
-    except Exception as e:
-        error_detail = f"WebSocket error: {str(e)}"
-        try:
-            await websocket.send_json({
-                "type": "error",
-                "content": error_detail,
-                "metadata": {"error_type": "websocket_error"}
-            })
-        except:
-            pass  # Connection might be already closed
-        finally:
-            await manager.disconnect(websocket)
+    if config:
+        key_validator.record(test_config["provider"], test_config["api_key"], True)
+    response_cache.put(cache_key, response)
+    return {"response": response}
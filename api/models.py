@@ -1,4 +1,5 @@
 from pydantic import BaseModel
+from typing import List, Optional
 
 class AIConfig(BaseModel):
     provider: str
@@ -7,3 +8,7 @@ class AIConfig(BaseModel):
 class Message(BaseModel):
     content: str
     stream: bool = False
+
+class BatchRequest(BaseModel):
+    messages: List[Message]
+    concurrency: Optional[int] = None
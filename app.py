@@ -1,10 +1,15 @@
 import logging
 from pathlib import Path
 from fastapi import Request
-from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 
+from api.chat import router as chat_router
 from webapp import app
+from webapp.assets import asset_manifest
+from webapp.config import load_config
+from webapp.diagnostics import diagnostics, router as diagnostics_router
+from webapp.pages import CachedPage
+from webapp.ws.codec import CODECS, MSGPACK_SUBPROTOCOL
 from webapp.ws.routes import websocket_endpoint
 
 # Configure logging
@@ -15,17 +20,27 @@ logging.basicConfig(
 
 # Setup templates
 templates = Jinja2Templates(directory="templates")
+templates.env.globals["asset_url"] = asset_manifest.url
+# The page only loads the MessagePack decoder if the server can speak it
+templates.env.globals["msgpack_enabled"] = MSGPACK_SUBPROTOCOL in CODECS
+
+# The index page has no per-request content, so it is rendered once
+index_page = CachedPage(templates, "index.html", Path("templates"), asset_manifest)
 
 # Register WebSocket endpoint
 app.add_api_websocket_route("/ws", websocket_endpoint)
 
+# Register HTTP API
+app.include_router(chat_router)
+
+# Opt-in event loop monitor and profiler endpoints
+if diagnostics.configure(load_config()):
+    app.include_router(diagnostics_router)
+
 @app.get("/")
 async def get_index(request: Request):
     """Serve the main index page."""
-    return templates.TemplateResponse(
-        "index.html",
-        {"request": request}
-    )
+    return index_page.response(request)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,60 @@
+"""
+Compare WebSocket frame codecs: encode cost and bytes on the wire.
+
+Usage:
+    python -m benchmarks.codec_bench [--frames N]
+"""
+import argparse
+import json
+import time
+from webapp.ws.codec import JsonCodec, MsgpackCodec, msgpack
+
+
+def starlette_send_json(frame: dict) -> str:
+    """What websocket.send_json does for every frame."""
+    return json.dumps(frame, separators=(",", ":"), ensure_ascii=False)
+
+def sample_frames(count: int):
+    """A typical stream: ack, many chunk frames, end_stream."""
+    user_input_id = "msg-1718000000000-abcdef"
+    frames = [{"type": "ack", "metadata": {"user_input_id": user_input_id}}]
+    words = ["Hello", " world", ",", " this", " is", " a", " streamed", " answer", " with", " `code`", " and", " ünïcödé", ".\n"]
+    for i in range(count):
+        frames.append({
+            "type": "chunk",
+            "content": words[i % len(words)],
+            "metadata": {"user_input_id": user_input_id}
+        })
+    frames.append({"type": "end_stream", "metadata": {"user_input_id": user_input_id}})
+    return frames
+
+def wire_bytes(data) -> bytes:
+    return data.encode() if isinstance(data, str) else data
+
+def measure(name: str, encode, frames, repeat: int = 5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for frame in frames:
+            encode(frame)
+        best = min(best, time.perf_counter() - start)
+    size = sum(len(wire_bytes(encode(frame))) for frame in frames)
+    per_frame_us = best / len(frames) * 1e6
+    print(f"{name:<22} {per_frame_us:>10.3f} {size:>12} {size / len(frames):>10.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=100000, help="chunk frames per run")
+    args = parser.parse_args()
+
+    frames = sample_frames(args.frames)
+    print(f"{'codec':<22} {'us/frame':>10} {'bytes':>12} {'B/frame':>10}")
+    measure("send_json (baseline)", starlette_send_json, frames)
+    measure("json (pre-encoded)", JsonCodec().encode, frames)
+    if msgpack is not None:
+        measure("msgpack", MsgpackCodec().encode, frames)
+    else:
+        print("msgpack                (not installed)")
+
+if __name__ == "__main__":
+    main()
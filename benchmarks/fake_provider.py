@@ -0,0 +1,49 @@
+"""
+Local stand-in for joao.AsyncAgent, for running the server without a provider.
+
+Streams a fixed number of tokens after a configurable time-to-first-token,
+with a configurable delay (and jitter) between tokens.
+"""
+import asyncio
+import random
+from dataclasses import dataclass
+from webapp.agent_pool import AgentPool
+
+
+@dataclass
+class FakeProviderProfile:
+    tokens: int = 200
+    ttft: float = 0.05
+    token_delay: float = 0.005
+    jitter: float = 0.0
+    token_text: str = "lorem "
+
+class FakeAgent:
+    """Implements the subset of the AsyncAgent API the server uses."""
+
+    def __init__(self, system_prompt: str, api_key: str, provider: str, profile: FakeProviderProfile):
+        self.system_prompt = system_prompt
+        self.profile = profile
+
+    def _delay(self, base: float) -> float:
+        if not self.profile.jitter:
+            return base
+        return max(0.0, base + random.uniform(-self.profile.jitter, self.profile.jitter))
+
+    async def _stream(self):
+        profile = self.profile
+        await asyncio.sleep(self._delay(profile.ttft))
+        for i in range(profile.tokens):
+            if i:
+                await asyncio.sleep(self._delay(profile.token_delay))
+            yield profile.token_text
+
+    async def request(self, message: str, stream: bool = False):
+        if stream:
+            return self._stream()
+        return "".join([token async for token in self._stream()])
+
+def install(pool: AgentPool, profile: FakeProviderProfile):
+    """Make an agent pool build fake agents instead of provider clients."""
+    pool.factory = lambda system_prompt, api_key, provider: FakeAgent(system_prompt, api_key, provider, profile)
+    pool.clear()
@@ -0,0 +1,305 @@
+"""
+Load test for the streaming path, fully offline.
+
+Runs app:app in a child process with the fake provider from
+benchmarks.fake_provider, drives N concurrent clients against /ws (or
+/api/chat) and reports throughput, time-to-first-token percentiles,
+event-loop lag, memory per connection and CPU per token.
+
+Usage:
+    python -m benchmarks.load_test [--clients 50] [--messages 5] [--tokens 200]
+                                   [--ttft 0.05] [--token-delay 0.005] [--jitter 0]
+                                   [--coalesce] [--endpoint ws|chat] [--json]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import socket
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+HOST = "127.0.0.1"
+LAG_INTERVAL = 0.01
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # Peak RSS; kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+# --- server side (child process) ---
+
+class LoopLagMonitor:
+    """Measures how late a periodic sleep wakes up on the server's event loop."""
+
+    def __init__(self, interval: float = LAG_INTERVAL):
+        self.interval = interval
+        self.samples: List[float] = []
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - start - self.interval))
+
+def serve(port: int, profile: Dict, env: Dict[str, str]):
+    os.chdir(ROOT)
+    os.environ.update(env)
+
+    import uvicorn
+    from app import app
+    from benchmarks.fake_provider import FakeProviderProfile, install
+    from webapp.agent_pool import agent_pool
+    from webapp.config import config_service, save_config
+
+    config_path = Path(tempfile.mkdtemp(prefix="simplex-bench-")) / "config.json"
+    save_config({"provider": "bench", "api_key": "bench-key"}, config_path)
+    config_service.path = config_path
+    config_service.invalidate()
+    install(agent_pool, FakeProviderProfile(**profile))
+    # Per-stream INFO logs would dominate the CPU profile
+    logging.getLogger().setLevel(logging.WARNING)
+
+    monitor = LoopLagMonitor()
+    monitor_task = None
+
+    @app.get("/_bench/stats")
+    async def bench_stats(reset: bool = False):
+        nonlocal monitor_task
+        if monitor_task is None:
+            # The harness polls this endpoint until the server is up
+            monitor_task = asyncio.create_task(monitor.run())
+        samples = monitor.samples
+        if reset:
+            monitor.samples = []
+        return {"rss": rss_bytes(), "cpu": cpu_seconds(), "lag": samples}
+
+    uvicorn.run(app, host=HOST, port=port, log_level="warning")
+
+# --- client side ---
+
+async def http_request(port: int, method: str, path: str, body: bytes = b"") -> bytes:
+    """Minimal HTTP/1.1 client; keeps the harness free of extra dependencies."""
+    reader, writer = await asyncio.open_connection(HOST, port)
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: {HOST}\r\nConnection: close\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b"\r\n\r\n")
+    if not head.split(b" ", 2)[1].startswith(b"2"):
+        raise RuntimeError(f"{method} {path} failed: {head.splitlines()[0].decode()}")
+    return payload
+
+async def server_stats(port: int, reset: bool = False) -> Dict:
+    return json.loads(await http_request(port, "GET", f"/_bench/stats?reset={str(reset).lower()}"))
+
+async def wait_for_server(port: int, process: multiprocessing.Process, timeout: float = 20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not process.is_alive():
+            raise RuntimeError("server process exited during startup")
+        try:
+            await server_stats(port)
+            return
+        except (OSError, RuntimeError, IndexError):
+            await asyncio.sleep(0.1)
+    raise RuntimeError("server did not start in time")
+
+class Results:
+    def __init__(self):
+        self.ttft: List[float] = []
+        self.latency: List[float] = []
+        self.tokens = 0
+        self.frames = 0
+        self.messages = 0
+        self.errors = 0
+
+async def ws_client(websocket, client_id: int, messages: int, coalesce: bool, results: Results):
+    for n in range(messages):
+        user_input_id = f"bench-{client_id}-{n}"
+        start = time.perf_counter()
+        first = None
+        await websocket.send(json.dumps({
+            "type": "message",
+            "content": f"Benchmark prompt {client_id}/{n}",
+            "metadata": {"user_input_id": user_input_id, "coalesce": coalesce}
+        }))
+        while True:
+            frame = json.loads(await websocket.recv())
+            kind = frame.get("type")
+            if kind == "chunk":
+                if first is None:
+                    first = time.perf_counter()
+                results.frames += 1
+                results.tokens += frame["metadata"].get("tokens", 1)
+            elif kind == "end_stream":
+                break
+            elif kind == "error":
+                results.errors += 1
+                break
+        if first is not None:
+            results.ttft.append(first - start)
+        results.latency.append(time.perf_counter() - start)
+        results.messages += 1
+
+async def chat_client(port: int, client_id: int, messages: int, results: Results):
+    for n in range(messages):
+        start = time.perf_counter()
+        body = json.dumps({"content": f"Benchmark prompt {client_id}/{n}"}).encode()
+        try:
+            payload = json.loads(await http_request(port, "POST", "/api/chat", body))
+        except RuntimeError:
+            results.errors += 1
+            continue
+        elapsed = time.perf_counter() - start
+        # Non-streaming: the first token arrives with the whole response
+        results.ttft.append(elapsed)
+        results.latency.append(elapsed)
+        results.tokens += len(payload["response"].split())
+        results.frames += 1
+        results.messages += 1
+
+async def run_ws(port: int, args) -> Dict:
+    import websockets
+
+    baseline = await server_stats(port, reset=True)
+    connections = []
+    for _ in range(args.clients):
+        websocket = await websockets.connect(f"ws://{HOST}:{port}/ws", max_size=None)
+        await websocket.recv()  # session frame
+        connections.append(websocket)
+    connected = await server_stats(port, reset=True)
+
+    results = Results()
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        ws_client(websocket, i, args.messages, args.coalesce, results)
+        for i, websocket in enumerate(connections)
+    ))
+    elapsed = time.perf_counter() - start
+    finished = await server_stats(port)
+
+    for websocket in connections:
+        await websocket.close()
+    return report(args, results, elapsed, connected, finished,
+                  memory_per_connection=(connected["rss"] - baseline["rss"]) / args.clients)
+
+async def run_chat(port: int, args) -> Dict:
+    started = await server_stats(port, reset=True)
+    results = Results()
+    start = time.perf_counter()
+    await asyncio.gather(*(chat_client(port, i, args.messages, results) for i in range(args.clients)))
+    elapsed = time.perf_counter() - start
+    finished = await server_stats(port)
+    return report(args, results, elapsed, started, finished, memory_per_connection=None)
+
+def report(args, results: Results, elapsed: float, before: Dict, after: Dict, memory_per_connection) -> Dict:
+    cpu = after["cpu"] - before["cpu"]
+    lag = after["lag"]
+    return {
+        "endpoint": args.endpoint,
+        "clients": args.clients,
+        "messages": results.messages,
+        "errors": results.errors,
+        "elapsed_s": elapsed,
+        "tokens_per_s": results.tokens / elapsed if elapsed else 0.0,
+        "messages_per_s": results.messages / elapsed if elapsed else 0.0,
+        "tokens_per_frame": results.tokens / results.frames if results.frames else 0.0,
+        "ttft_ms": {p: percentile(results.ttft, p) * 1000 for p in (50, 90, 99)},
+        "latency_ms": {p: percentile(results.latency, p) * 1000 for p in (50, 90, 99)},
+        "loop_lag_ms": {
+            "p50": percentile(lag, 50) * 1000,
+            "p99": percentile(lag, 99) * 1000,
+            "max": max(lag, default=0.0) * 1000
+        },
+        "memory_per_connection_kb": memory_per_connection / 1024 if memory_per_connection is not None else None,
+        "cpu_s": cpu,
+        "cpu_us_per_token": cpu / results.tokens * 1e6 if results.tokens else 0.0
+    }
+
+def print_report(result: Dict):
+    print(f"{result['endpoint']}: {result['clients']} clients, {result['messages']} messages "
+          f"in {result['elapsed_s']:.2f}s ({result['errors']} errors)")
+    print(f"  throughput      {result['tokens_per_s']:10.0f} tokens/s {result['messages_per_s']:8.1f} msg/s"
+          f"  ({result['tokens_per_frame']:.1f} tokens/frame)")
+    for name in ("ttft_ms", "latency_ms"):
+        values = result[name]
+        print(f"  {name[:-3]:<15} p50 {values[50]:8.1f} ms  p90 {values[90]:8.1f} ms  p99 {values[99]:8.1f} ms")
+    lag = result["loop_lag_ms"]
+    print(f"  loop lag        p50 {lag['p50']:8.2f} ms  p99 {lag['p99']:8.2f} ms  max {lag['max']:8.2f} ms")
+    if result["memory_per_connection_kb"] is not None:
+        print(f"  memory          {result['memory_per_connection_kb']:10.1f} KiB/connection")
+    print(f"  cpu             {result['cpu_s']:10.2f} s total {result['cpu_us_per_token']:8.1f} us/token")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=5, help="messages sent by each client, one after another")
+    parser.add_argument("--tokens", type=int, default=200, help="tokens per fake response")
+    parser.add_argument("--ttft", type=float, default=0.05, help="fake provider time to first token (s)")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="fake provider delay between tokens (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random +/- jitter on every delay (s)")
+    parser.add_argument("--coalesce", action="store_true", help="ask the server to coalesce chunk frames")
+    parser.add_argument("--endpoint", choices=("ws", "chat"), default="ws")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    profile = {"tokens": args.tokens, "ttft": args.ttft, "token_delay": args.token_delay, "jitter": args.jitter}
+    # Keep the prompts' responses from being served by the cache or the scheduler queue,
+    # and the synthetic conversations out of the real transcript database
+    env = {
+        "SIMPLEX_RESPONSE_CACHE": "0",
+        "SIMPLEX_SCHEDULER_MAX_CONCURRENT": str(max(args.clients, 64)),
+        "SIMPLEX_TRANSCRIPT_PATH": ""
+    }
+    port = free_port()
+    process = multiprocessing.get_context("spawn").Process(target=serve, args=(port, profile, env), daemon=True)
+    process.start()
+    try:
+        async def run():
+            await wait_for_server(port, process)
+            if args.endpoint == "ws":
+                return await run_ws(port, args)
+            return await run_chat(port, args)
+        result = asyncio.run(run())
+    finally:
+        process.terminate()
+        process.join()
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+
+if __name__ == "__main__":
+    main()
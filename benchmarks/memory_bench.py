@@ -0,0 +1,153 @@
+"""
+Memory held by the WebSocket connection manager.
+
+Builds connection and stream state in-process against stub sockets and
+measures it with tracemalloc: bytes per idle connection, bytes per running
+stream, and what is still allocated after connect/stream/disconnect cycles
+in which some clients skip their cleanup or reuse a user_input_id. The
+retained figure should stay flat from one cycle to the next.
+
+Usage:
+    python -m benchmarks.memory_bench [--connections 1000] [--cycles 10] [--json]
+"""
+import argparse
+import asyncio
+import gc
+import json
+import tracemalloc
+from typing import Dict, List
+from starlette.websockets import WebSocketState
+from webapp.ws.connection import ConnectionManager
+
+
+class StubWebSocket:
+    """Just enough of a WebSocket for the manager and its send queue."""
+
+    def __init__(self):
+        self.client_state = WebSocketState.CONNECTED
+
+    async def send_text(self, data: str):
+        pass
+
+    async def send_bytes(self, data: bytes):
+        pass
+
+    async def close(self, code: int = 1000):
+        self.client_state = WebSocketState.DISCONNECTED
+
+def allocated() -> int:
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+def allocated_outside_benchmark() -> int:
+    """Allocated bytes, leaving out the benchmark's own bookkeeping."""
+    gc.collect()
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, tracemalloc.__file__)
+    ])
+    return sum(stat.size for stat in snapshot.statistics("filename"))
+
+async def run_stream(manager: ConnectionManager, websocket: StubWebSocket, user_input_id: str, done: asyncio.Event, clean: bool):
+    """A chat stream task; an unclean one exits without end_stream, like a handler bug would."""
+    record = manager.start_stream(websocket, manager.get_session_id(websocket), user_input_id)
+    await done.wait()
+    if clean:
+        manager.end_stream(record)
+
+async def open_streams(manager: ConnectionManager, sockets: List[StubWebSocket], done: asyncio.Event, prefix: str, clean: bool = True) -> List[asyncio.Task]:
+    tasks = []
+    for i, websocket in enumerate(sockets):
+        # Every tenth client reuses the same ID
+        user_input_id = f"{prefix}-shared" if i % 10 == 0 else f"{prefix}-{i}"
+        task = asyncio.create_task(run_stream(manager, websocket, user_input_id, done, clean or i % 2 == 0))
+        manager.add_task(websocket, task)
+        tasks.append(task)
+    await asyncio.sleep(0)  # Let every stream register
+    return tasks
+
+async def churn(manager: ConnectionManager, connections: int, prefix: str) -> Dict[str, int]:
+    """One cycle in which half the streams skip end_stream and half the clients vanish without remove_connection."""
+    sockets = [StubWebSocket() for _ in range(connections)]
+    for websocket in sockets:
+        manager.add_connection(websocket)
+    done = asyncio.Event()
+    tasks = await open_streams(manager, sockets, done, prefix, clean=False)
+    done.set()
+    await asyncio.gather(*tasks)
+    for i, websocket in enumerate(sockets):
+        if i % 2 == 0:
+            manager.remove_connection(websocket)
+        else:
+            websocket.client_state = WebSocketState.DISCONNECTED
+    del sockets, tasks, done
+    swept = manager.sweep()
+    await asyncio.sleep(0)  # Let the cancelled send queue writers finish
+    return swept
+
+async def measure(connections: int, cycles: int) -> Dict:
+    manager = ConnectionManager(sweep_interval=0)
+    tracemalloc.start()
+    results = {}
+
+    # Idle connections
+    base = allocated()
+    sockets = [StubWebSocket() for _ in range(connections)]
+    for websocket in sockets:
+        manager.add_connection(websocket)
+    await asyncio.sleep(0)  # Let the send queue writers start
+    idle = allocated()
+    results["bytes_per_connection"] = round((idle - base) / connections)
+
+    # One running stream each
+    done = asyncio.Event()
+    tasks = await open_streams(manager, sockets, done, "idle")
+    results["bytes_per_stream"] = round((allocated() - idle) / connections)
+    done.set()
+    await asyncio.gather(*tasks)
+    for websocket in sockets:
+        manager.remove_connection(websocket)
+    del sockets, tasks
+    await asyncio.sleep(0)
+
+    # Churn, after a warm-up cycle that fills one-off caches
+    await churn(manager, connections, "warmup")
+    retained = []
+    # Running totals, so the results only hold objects allocated in this file
+    swept = {"connections": 0, "tasks": 0, "streams": 0}
+    start = allocated_outside_benchmark()
+    for cycle in range(cycles):
+        for kind, count in (await churn(manager, connections, f"cycle{cycle}")).items():
+            swept[kind] += count
+        retained.append({
+            "cycle": cycle + 1,
+            "retained_bytes": allocated_outside_benchmark() - start,
+            "connections": len(manager.connections),
+            "streams": manager.in_flight,
+            "swept": dict(swept)
+        })
+    tracemalloc.stop()
+    results["churn"] = retained
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--connections", type=int, default=1000, help="connections opened at once")
+    parser.add_argument("--cycles", type=int, default=10, help="connect/stream/disconnect cycles")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(measure(args.connections, args.cycles))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"idle connection: {results['bytes_per_connection']} B (incl. send queue and writer task)")
+    print(f"running stream:  {results['bytes_per_stream']} B (incl. its task)")
+    print(f"{'cycle':>5} {'retained B':>12} {'connections':>12} {'streams':>8}  swept so far")
+    for row in results["churn"]:
+        swept = ", ".join(f"{kind} {count}" for kind, count in row["swept"].items())
+        print(f"{row['cycle']:>5} {row['retained_bytes']:>12} {row['connections']:>12} {row['streams']:>8}  {swept}")
+
+if __name__ == "__main__":
+    main()
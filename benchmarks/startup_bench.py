@@ -0,0 +1,116 @@
+"""
+Cold start profile of a worker.
+
+Reports where `import app` spends its time (from `python -X importtime`) and
+how long a fresh uvicorn process takes to accept connections and to report
+ready on /healthz, averaged over several runs.
+
+Usage:
+    python -m benchmarks.startup_bench [--runs 5] [--top 15] [--json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional, Tuple
+from benchmarks.load_test import HOST, ROOT, free_port, percentile
+
+
+def import_profile(env: Dict[str, str]) -> List[Tuple[str, int]]:
+    """(module, self us) for every module `import app` loads."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import app failed:\n{result.stderr[-2000:]}")
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        modules.append((name.strip(), int(self_us)))
+    return modules
+
+def by_package(modules: List[Tuple[str, int]]) -> List[Tuple[str, int]]:
+    """Import time summed per top-level package, slowest first."""
+    totals: Dict[str, int] = {}
+    for name, self_us in modules:
+        package = name.split(".")[0]
+        totals[package] = totals.get(package, 0) + self_us
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+def health(port: int) -> Optional[Dict]:
+    """The /healthz report, or None while nothing is listening."""
+    try:
+        with urllib.request.urlopen(f"http://{HOST}:{port}/healthz", timeout=1) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return json.loads(e.read())
+    except OSError:
+        return None
+
+def cold_start(env: Dict[str, str], timeout: float = 30) -> Tuple[float, float]:
+    """Seconds until a new server process answers, and until it reports ready."""
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", HOST, "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    listening = None
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError("server process exited during startup")
+            report = health(port)
+            if report is not None and listening is None:
+                listening = time.perf_counter() - started
+            if report is not None and report["status"] == "ready":
+                return listening, time.perf_counter() - started
+            if report is not None and report["status"] == "unavailable":
+                raise RuntimeError(f"server will not become ready: {report['sdk']['error']}")
+            time.sleep(0.005)
+        raise RuntimeError(f"server did not report ready within {timeout}s")
+    finally:
+        process.terminate()
+        process.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5, help="cold starts to measure")
+    parser.add_argument("--top", type=int, default=15, help="slowest packages to list")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(ROOT), os.environ.get("PYTHONPATH")])))
+    modules = import_profile(env)
+    packages = by_package(modules)[:args.top]
+    starts = [cold_start(env) for _ in range(args.runs)]
+    listening = [start[0] for start in starts]
+    ready = [start[1] for start in starts]
+    results = {
+        "import_ms": round(sum(m[1] for m in modules) / 1000, 1),
+        "modules": len(modules),
+        "sdk_imported": any(m[0] == "joao" for m in modules),
+        "slowest_packages": [{"package": name, "ms": round(self_us / 1000, 1)} for name, self_us in packages],
+        "listening_ms": {"p50": round(percentile(listening, 50) * 1000, 1), "max": round(max(listening) * 1000, 1)},
+        "ready_ms": {"p50": round(percentile(ready, 50) * 1000, 1), "max": round(max(ready) * 1000, 1)}
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"import app: {results['import_ms']:.1f} ms over {results['modules']} modules "
+          f"(provider SDK {'imported' if results['sdk_imported'] else 'deferred'})")
+    for item in results["slowest_packages"]:
+        print(f"  {item['ms']:9.1f} ms  {item['package']}")
+    print(f"cold start ({args.runs} runs): listening p50 {results['listening_ms']['p50']:.1f} ms, "
+          f"ready p50 {results['ready_ms']['p50']:.1f} ms (max {results['ready_ms']['max']:.1f} ms)")
+
+if __name__ == "__main__":
+    main()
@@ -111,6 +111,7 @@ export class CommandManager {
 
     handleReset() {
         messageManager.chatBox.clearMessages();
+        messageManager.resetSession();
         return `# Chat Reset\nAll messages have been cleared.\n\n*Type \`/help\` to see available commands.*`;
     }
 
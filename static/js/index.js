@@ -72,6 +72,10 @@ document.addEventListener('DOMContentLoaded', async () => {
         
         // Share WebSocket with config manager
         configManager.setWebSocket(messageManager.webSocketManager.connection);
+        // Reconnects open a new socket
+        document.addEventListener('websocket-connected', () => {
+            configManager.setWebSocket(messageManager.webSocketManager.connection);
+        });
 
         // Check initial configuration
         try {
@@ -2,6 +2,31 @@ import { WebSocketManager } from './websocket-manager.js';
 import { MessageState } from './message-state.js';
 import { StreamProcessor } from './stream-processor.js';
 
+// Survives page reloads within the tab, so the conversation can be restored
+const SESSION_STORAGE_KEY = 'simplex.sessionId';
+
+// Reconnect backoff after the connection drops
+const RECONNECT_MIN_DELAY = 1000;
+const RECONNECT_MAX_DELAY = 15000;
+
+function newSessionId() {
+    // crypto.randomUUID only exists in secure contexts (https or localhost)
+    if (window.crypto?.randomUUID) {
+        return crypto.randomUUID().replace(/-/g, '');
+    }
+    const bytes = new Uint8Array(16);
+    crypto.getRandomValues(bytes);
+    return Array.from(bytes, (byte) => byte.toString(16).padStart(2, '0')).join('');
+}
+
+function loadSessionId() {
+    try {
+        return sessionStorage.getItem(SESSION_STORAGE_KEY);
+    } catch (error) {
+        return null;
+    }
+}
+
 export class MessageManager extends EventTarget {
     constructor(chatBox = null) {
         super();
@@ -11,6 +36,14 @@ export class MessageManager extends EventTarget {
         this.processor = new StreamProcessor();
         this.isStreaming = false;
         this.ignoredIds = new Set();
+        this.sessionId = loadSessionId();
+        // Only a session restored from storage has history to fetch
+        this.historyRequested = !this.sessionId;
+        // Streams still running on the server: user input ID -> last chunk seq received
+        this.activeStreams = new Map();
+        this.hasConnected = false;
+        this.reconnectTimer = null;
+        this.reconnectDelay = RECONNECT_MIN_DELAY;
 
         // Setup WebSocket event handlers
         this.websocket.addEventListener('message', (event) => this.handleMessage(event.detail));
@@ -20,6 +53,9 @@ export class MessageManager extends EventTarget {
             if (this.chatBox) {
                 this.chatBox.setInputEnabled(connected);
             }
+            if (!connected && this.hasConnected) {
+                this.scheduleReconnect();
+            }
             this.dispatchEvent(new CustomEvent('connection-status', { detail: { connected } }));
         });
     }
@@ -53,7 +89,7 @@ export class MessageManager extends EventTarget {
                             });
 
                             // Send cancellation to server
-                            this.websocket.send('cancel_stream', '', { user_input_id: userInputId });
+                            this.websocket.send('cancel_stream', '', { user_input_id: userInputId, session_id: this.sessionId });
 
                             // Stop streaming and clear processor state
                             this.chatBox?.messageHandler?.setMessageStreaming(messageId, false);
@@ -74,6 +110,8 @@ export class MessageManager extends EventTarget {
     async connect() {
         try {
             await this.webSocketManager.connect();
+            this.hasConnected = true;
+            this.reconnectDelay = RECONNECT_MIN_DELAY;
             
             // Dispatch websocket connected event
             document.dispatchEvent(new CustomEvent('websocket-connected'));
@@ -100,20 +138,56 @@ export class MessageManager extends EventTarget {
     handleMessage(data) {
         try {
             if (data.type === 'error') {
+                const erroredId = data.metadata?.user_input_id;
+                if (erroredId) {
+                    this.activeStreams.delete(erroredId);
+                    if (data.metadata.error_type === 'resume') {
+                        this.handleEndStream(erroredId);
+                    }
+                }
                 this.handleError(new Error(data.content));
                 return;
             }
 
+            if (data.type === 'session') {
+                // Keep the first session so a reconnect continues the same conversation
+                if (!this.sessionId) {
+                    this.setSessionId(data.content.session_id);
+                } else if (!this.historyRequested) {
+                    // Restored after a page reload: fetch the conversation so far
+                    this.historyRequested = true;
+                    this.websocket.send('history', '', { session_id: this.sessionId });
+                }
+                this.resumeStreams();
+                return;
+            }
+
+            if (data.type === 'history') {
+                this.handleHistory(data.content);
+                return;
+            }
+
             const userInputId = data.metadata?.user_input_id;
 
             if (data.type === 'chunk') {
+                if (typeof data.metadata?.seq === 'number' && this.activeStreams.has(userInputId)) {
+                    this.activeStreams.set(userInputId, data.metadata.seq);
+                }
                 // Don't process chunks for ignored messages
                 if (!this.ignoredIds.has(userInputId)) {
                     this.handleChunk(data.content, userInputId);
                 }
+            } else if (data.type === 'queued') {
+                // Show the queue position in the placeholder until the first chunk arrives
+                const responseId = this.state.getResponseId(userInputId);
+                if (responseId && !this.ignoredIds.has(userInputId)) {
+                    this.chatBox?.updateMessage(responseId, `Queued (position ${data.content.position})...`);
+                }
             } else if (data.type === 'end_stream') {
+                this.activeStreams.delete(userInputId);
                 this.handleEndStream(userInputId);
             } else if (data.type === 'stream_cancelled') {
+                this.activeStreams.delete(userInputId);
                 console.log('[MessageManager] Received cancellation confirmation for:', userInputId);
                 // The server has confirmed the cancellation, we can clean up
                 if (this.state.hasResponse(userInputId)) {
@@ -133,6 +207,64 @@ export class MessageManager extends EventTarget {
         }
     }
 
+    setSessionId(sessionId) {
+        this.sessionId = sessionId;
+        try {
+            sessionStorage.setItem(SESSION_STORAGE_KEY, sessionId);
+        } catch (error) {
+            console.warn('[MessageManager] Could not persist session ID:', error);
+        }
+    }
+
+    resetSession() {
+        // Start a new conversation; the old transcript stays on the server
+        this.setSessionId(newSessionId());
+        this.historyRequested = true;
+    }
+
+    scheduleReconnect() {
+        if (this.reconnectTimer) {
+            return;
+        }
+        console.log(`[MessageManager] Connection lost, reconnecting in ${this.reconnectDelay}ms`);
+        this.reconnectTimer = setTimeout(async () => {
+            this.reconnectTimer = null;
+            if (!await this.connect()) {
+                this.reconnectDelay = Math.min(this.reconnectDelay * 2, RECONNECT_MAX_DELAY);
+                this.scheduleReconnect();
+            }
+        }, this.reconnectDelay);
+    }
+
+    resumeStreams() {
+        // Pick up answers that kept streaming on the server while we were away
+        for (const [userInputId, lastSeq] of this.activeStreams) {
+            console.log('[MessageManager] Resuming stream:', userInputId, 'after seq', lastSeq);
+            this.websocket.send('resume', '', {
+                user_input_id: userInputId,
+                session_id: this.sessionId,
+                last_seq: lastSeq
+            });
+        }
+    }
+
+    handleHistory({ session_id, entries }) {
+        if (session_id !== this.sessionId || !this.chatBox) {
+            return;
+        }
+        for (const entry of entries) {
+            const metadata = {
+                id: this.chatBox.messageHandler?.generateId() || `history-${entry.id ?? entry.created}`,
+                timestamp: new Date(entry.created * 1000).toISOString()
+            };
+            if (entry.role === 'user') {
+                this.chatBox.addMessage({ content: entry.content, type: 'sent', metadata });
+            } else {
+                this.chatBox.addMessageMD({ content: entry.content, type: 'received', metadata });
+            }
+        }
+    }
+
     handleChunk(content, userInputId) {
         console.log('[MessageManager] Handling chunk for user input:', userInputId);
         
@@ -274,8 +406,16 @@ export class MessageManager extends EventTarget {
             className: 'placeholder'  // Add class for styling
         });
 
-        // Send the message
-        await this.websocket.send('message', content, metadata);
+        if (metadata.user_input_id) {
+            this.activeStreams.set(metadata.user_input_id, 0);
+        }
+
+        // Send the message, opting in to coalesced chunk frames
+        await this.websocket.send('message', content, {
+            ...metadata,
+            session_id: this.sessionId,
+            coalesce: true
+        });
     }
 }
 
@@ -1,3 +1,6 @@
+const JSON_SUBPROTOCOL = 'simplex.json';
+const MSGPACK_SUBPROTOCOL = 'simplex.msgpack';
+
 export class WebSocketManager extends EventTarget {
     constructor() {
         super();
@@ -19,7 +22,12 @@ export class WebSocketManager extends EventTarget {
 
             const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
             const host = window.location.hostname + (window.location.port ? ':' + window.location.port : '');
-            this.ws = new WebSocket(`${protocol}//${host}/ws`);
+            // Prefer the binary MessagePack subprotocol when its decoder is loaded
+            const subprotocols = window.MessagePack
+                ? [MSGPACK_SUBPROTOCOL, JSON_SUBPROTOCOL]
+                : [JSON_SUBPROTOCOL];
+            this.ws = new WebSocket(`${protocol}//${host}/ws`, subprotocols);
+            this.ws.binaryType = 'arraybuffer';
             
             await this.setupHandlers();
             return this.ws;
@@ -54,7 +62,7 @@ export class WebSocketManager extends EventTarget {
 
             this.ws.onmessage = (event) => {
                 try {
-                    const data = JSON.parse(event.data);
+                    const data = this.decode(event.data);
                     this.dispatchEvent(new CustomEvent('message', { detail: data }));
                 } catch (error) {
                     this.handleError(error);
@@ -69,6 +77,25 @@ export class WebSocketManager extends EventTarget {
         });
     }
 
+    get isBinary() {
+        return this.ws?.protocol === MSGPACK_SUBPROTOCOL;
+    }
+
+    decode(data) {
+        // Text frames are always JSON, binary frames are MessagePack
+        if (typeof data === 'string') {
+            return JSON.parse(data);
+        }
+        return window.MessagePack.decode(new Uint8Array(data));
+    }
+
+    encode(message) {
+        if (this.isBinary) {
+            return window.MessagePack.encode(message);
+        }
+        return JSON.stringify(message);
+    }
+
     handleError(error) {
         this.dispatchEvent(new CustomEvent('error', {
             detail: { error }
@@ -80,7 +107,7 @@ export class WebSocketManager extends EventTarget {
             throw new Error('WebSocket not connected');
         }
 
-        this.ws.send(JSON.stringify({
+        this.ws.send(this.encode({
             type,
             content,
             metadata
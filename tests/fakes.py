@@ -0,0 +1,34 @@
+import asyncio
+import json
+from typing import List, Optional
+from starlette.websockets import WebSocketState
+
+class FakeWebSocket:
+    """Records the frames a connection's send queue writes to it.
+
+    While `gate` is cleared, writes block, like a client that stopped reading.
+    """
+
+    def __init__(self):
+        self.client_state = WebSocketState.CONNECTED
+        self.sent: List[dict] = []
+        self.close_code: Optional[int] = None
+        self.gate = asyncio.Event()
+        self.gate.set()
+
+    async def send_text(self, data: str):
+        await self.gate.wait()
+        self.sent.append(json.loads(data))
+
+    async def send_bytes(self, data: bytes):
+        await self.gate.wait()
+        self.sent.append(data)
+
+    async def close(self, code: int = 1000):
+        self.close_code = code
+        self.client_state = WebSocketState.DISCONNECTED
+
+async def drain(times: int = 5):
+    """Let queued frames reach their sockets."""
+    for _ in range(times):
+        await asyncio.sleep(0)
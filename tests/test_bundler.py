@@ -0,0 +1,159 @@
+import shutil
+import subprocess
+from pathlib import Path
+import pytest
+from webapp.assets import STATIC_DIR
+from webapp.bundler import BundleError, bundle_modules, mask, minify_css, minify_js, tokenize
+
+NODE = shutil.which("node")
+needs_node = pytest.mark.skipif(NODE is None, reason="node is not installed")
+
+JS_FILES = sorted((STATIC_DIR / "js").rglob("*.js"))
+
+def kinds(source: str):
+    return [(token.kind, token.text) for token in tokenize(source) if token.kind != "space"]
+
+def regexes(source: str):
+    return [token.text for token in tokenize(source) if token.kind == "regex"]
+
+def run_node(script: str) -> str:
+    result = subprocess.run([NODE, "-e", script], capture_output=True, text=True, timeout=30)
+    assert result.returncode == 0, result.stderr
+    return result.stdout
+
+def node_check(path: Path):
+    result = subprocess.run([NODE, "--check", str(path)], capture_output=True, text=True, timeout=30)
+    assert result.returncode == 0, result.stderr
+
+@pytest.mark.parametrize("source, expected", [
+    ("a / b / c", []),
+    ("x = /ab+c/g.test(s)", ["/ab+c/g"]),
+    ("(a + b) / 2", []),
+    ("items[0] / 2", []),
+    ("i++ / 2", []),
+    ("i-- / 2 / j", []),
+    ("n = 1 / 2", []),
+    ("'a' / 2", []),
+    ("return /x/.test(s)", ["/x/"]),
+    ("f(/[/]/, 1)", ["/[/]/"]),
+    ("a = [/a/, /b/]", ["/a/", "/b/"]),
+    ("if (ok) /x/.test(s)", ["/x/"]),
+    ("while (f(a) / 2) /y/.exec(s)", ["/y/"]),
+    ("function f() {}\n/z/.test(s)", ["/z/"]),
+    ("x = {a: 1} / 2", []),
+    ("x = a ? /t/ : /f/", ["/t/", "/f/"]),
+    ("x = !/re/.test(s)", ["/re/"]),
+    ("x = typeof /re/", ["/re/"]),
+])
+def test_regex_versus_division(source, expected):
+    assert regexes(source) == expected
+
+@pytest.mark.parametrize("source", [
+    "const s = `plain`;",
+    "const s = `a ${b} c`;",
+    "const s = `a ${`nested ${c}`} d`;",
+    "const s = `${ {a: 1}.a } // not a comment`;",
+    "const s = `${x / 2} and ${/re/.source}`;",
+    "const s = `line\nbreak \\` escaped`;",
+])
+def test_template_literal_is_one_token(source):
+    tokens = kinds(source)
+    templates = [text for kind, text in tokens if kind == "template"]
+    assert len(templates) == 1
+    assert templates[0] == source[source.index("`"):source.rindex("`") + 1]
+
+@pytest.mark.parametrize("source", [
+    "const a = \"// not a comment\";",
+    "const a = '/* not a comment */';",
+    "const a = \"it's\" + 'say \"hi\"';",
+    "const a = 'escaped \\' // quote';",
+])
+def test_comments_inside_strings_are_kept(source):
+    tokens = kinds(source)
+    assert not [text for kind, text in tokens if kind == "comment"]
+    assert kinds(minify_js(source)) == tokens
+
+def test_tokens_cover_the_source():
+    for path in JS_FILES:
+        source = path.read_text(encoding="utf-8")
+        assert "".join(token.text for token in tokenize(source)) == source, path
+
+def test_mask_hides_module_syntax_in_literals():
+    source = "const s = 'import x from \"./y.js\"'; // export const z = 1\n"
+    masked = mask(source)
+    assert len(masked) == len(source)
+    assert "import" not in masked and "export" not in masked
+
+def test_minify_js_keeps_tokens_apart():
+    assert minify_js("a - -b") == "a- -b\n"
+    assert minify_js("a + +b") == "a+ +b\n"
+    assert minify_js("a++ + b") == "a++ +b\n"
+    assert minify_js("1 .toString()") == "1 .toString()\n"
+
+def test_minify_js_keeps_line_breaks_for_asi():
+    assert minify_js("return\nvalue") == "return\nvalue\n"
+    assert minify_js("a = b\n(c)") == "a=b\n(c)\n"
+    assert minify_js("a = 1 /* note */ + 2 // end\n") == "a=1+2\n"
+
+def test_minify_css():
+    source = "/* header */\n.a > .b ,\n.c {\n  color: red;\n  content: \"a  /* b */ ; }\";\n}\n"
+    assert minify_css(source) == ".a>.b,.c{color: red;content: \"a  /* b */ ; }\"}\n"
+    assert minify_css(".a { width: calc(100% - 2px); }") == ".a{width: calc(100% - 2px)}\n"
+
+def test_unterminated_literals_fail():
+    for source in ("'abc", "`abc ${x", "/* abc", "x = /abc"):
+        with pytest.raises(BundleError):
+            tokenize(source)
+
+def test_bundle_rejects_unsupported_syntax(tmp_path):
+    (tmp_path / "main.js").write_text("import x from './other.js';\n")
+    with pytest.raises(BundleError, match="unsupported module syntax"):
+        bundle_modules(tmp_path, "main.js")
+
+def test_bundle_rejects_mutable_exports(tmp_path):
+    (tmp_path / "main.js").write_text("export let count = 0;\n")
+    with pytest.raises(BundleError, match="unsupported module syntax"):
+        bundle_modules(tmp_path, "main.js")
+
+def test_bundle_rejects_circular_imports(tmp_path):
+    (tmp_path / "a.js").write_text("import './b.js';\n")
+    (tmp_path / "b.js").write_text("import './a.js';\n")
+    with pytest.raises(BundleError, match="Circular import"):
+        bundle_modules(tmp_path, "a.js")
+
+@needs_node
+def test_bundle_runs(tmp_path):
+    (tmp_path / "lib").mkdir()
+    (tmp_path / "lib" / "math.js").write_text(
+        "export const stats = { calls: 0 };\n"
+        "export function half(n) { stats.calls++; return n / 2; }\n"
+    )
+    (tmp_path / "lib" / "index.js").write_text("export * from './math.js';\nexport const name = 'lib';\n")
+    (tmp_path / "main.js").write_text(
+        "import { half, stats as counters, name } from './lib/index.js';\n"
+        "// import { nothing } from './missing.js';\n"
+        "const text = `${name}: ${half(8)} / ${counters.calls}`;\n"
+        "console.log(text, /\\d+/.exec('a42')[0]);\n"
+    )
+    script, sources = bundle_modules(tmp_path, "main.js")
+    assert {path.name for path in sources} == {"main.js", "index.js", "math.js"}
+    assert run_node(script) == "lib: 4 / 1 42\n"
+    assert run_node(minify_js(script)) == "lib: 4 / 1 42\n"
+
+@needs_node
+@pytest.mark.parametrize("path", JS_FILES, ids=lambda path: str(path.relative_to(STATIC_DIR)))
+def test_minified_module_parses(path, tmp_path):
+    source = path.read_text(encoding="utf-8")
+    script = minify_js(source)
+    # Same tokens, less the comments
+    assert kinds(script) == [token for token in kinds(source) if token[0] != "comment"]
+    minified = tmp_path / "module.mjs"
+    minified.write_text(script, encoding="utf-8")
+    node_check(minified)
+
+@needs_node
+def test_minified_bundle_parses(tmp_path):
+    script, _ = bundle_modules(STATIC_DIR / "js", "index.js")
+    bundle = tmp_path / "bundle.js"
+    bundle.write_text(minify_js(script), encoding="utf-8")
+    node_check(bundle)
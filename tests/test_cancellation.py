@@ -0,0 +1,122 @@
+import asyncio
+import pytest
+import time
+from types import SimpleNamespace
+from fakes import FakeWebSocket, drain
+from webapp.transcripts import TranscriptStore
+from webapp.ws import handlers
+from webapp.ws.cancellation import cancellable_stream
+from webapp.ws.connection import manager
+from webapp.ws.protocol import ChatFrame
+
+class FakeUpstream:
+    """A provider stream that records when it is closed."""
+
+    def __init__(self, events: list, token_delay: float = 0.01):
+        self.events = events
+        self.token_delay = token_delay
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        await asyncio.sleep(self.token_delay)
+        return "token "
+
+    async def aclose(self):
+        self.closed = True
+        self.events.append("upstream closed")
+
+def test_cancel_closes_the_upstream_stream_while_waiting_for_a_token():
+    async def main():
+        upstream = FakeUpstream([], token_delay=60)
+        cancel = asyncio.Event()
+
+        async def open_stream():
+            return upstream
+
+        async def consume():
+            return [token async for token in cancellable_stream(open_stream, cancel)]
+
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0.01)
+        started = time.monotonic()
+        cancel.set()
+        assert await task == []
+        assert upstream.closed
+        assert time.monotonic() - started < 1
+
+    asyncio.run(main())
+
+def test_cancel_while_opening_the_stream():
+    async def main():
+        cancel = asyncio.Event()
+        opened = asyncio.Event()
+
+        async def open_stream():
+            opened.set()
+            await asyncio.sleep(60)
+
+        async def consume():
+            return [token async for token in cancellable_stream(open_stream, cancel)]
+
+        task = asyncio.create_task(consume())
+        await opened.wait()
+        cancel.set()
+        assert await asyncio.wait_for(task, 1) == []
+
+    asyncio.run(main())
+
+def test_closing_the_stream_closes_upstream():
+    async def main():
+        upstream = FakeUpstream([])
+
+        async def open_stream():
+            return upstream
+
+        stream = cancellable_stream(open_stream, asyncio.Event())
+        assert await stream.__anext__() == "token "
+        await stream.aclose()
+        assert upstream.closed
+
+    asyncio.run(main())
+
+@pytest.mark.parametrize("coalesce", [True, False])
+def test_handler_closes_upstream_before_returning_when_the_client_is_gone(monkeypatch, coalesce):
+    events = []
+    upstream = FakeUpstream(events)
+
+    async def open_stream(config, system_prompt, prompt, on_selected=None):
+        return upstream
+
+    async def snapshot():
+        return {"provider": "gemini", "api_key": "key"}
+
+    monkeypatch.setattr(handlers, "provider_router", SimpleNamespace(open_stream=open_stream))
+    monkeypatch.setattr(handlers, "config_service", SimpleNamespace(snapshot=snapshot))
+    monkeypatch.setattr(handlers, "transcript_store", TranscriptStore(None))
+    # Not resumable: the stream must stop as soon as the client is gone
+    monkeypatch.setattr(handlers.resumable_streams, "grace_period", 0)
+
+    async def main():
+        websocket = FakeWebSocket()
+        manager.add_connection(websocket)
+        frame = ChatFrame(type="message", content="hello", metadata={"user_input_id": "u1", "coalesce": coalesce})
+
+        async def handle():
+            await handlers.handle_chat_message(websocket, frame)
+            events.append("handler returned")
+
+        task = asyncio.create_task(handle())
+        while not any(sent["type"] == "chunk" for sent in websocket.sent):
+            await asyncio.sleep(0.005)
+        # The client stops taking frames, so the next send fails
+        manager.connections[websocket].send_queue.close()
+        await asyncio.wait_for(task, 1)
+        assert events == ["upstream closed", "handler returned"]
+        assert manager.find_stream(websocket, "u1") is None
+        manager.remove_connection(websocket)
+        await drain()
+
+    asyncio.run(main())
@@ -0,0 +1,59 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+from api import chat
+from api.models import AIConfig
+from webapp.response_cache import ResponseCache
+from webapp.validation import KeyValidator
+from webapp.ws.scheduler import RequestScheduler
+
+def request() -> Request:
+    return Request({"type": "http", "method": "POST", "path": "/api/hello", "headers": []})
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    scheduler = RequestScheduler(max_concurrent=1, max_per_connection=1, max_queued=0, weights={})
+    monkeypatch.setattr(chat, "scheduler", scheduler)
+    monkeypatch.setattr(chat, "response_cache", ResponseCache(enabled=False))
+    monkeypatch.setattr(chat, "key_validator", KeyValidator())
+    return scheduler
+
+def test_hello_runs_in_a_scheduler_slot_through_the_router(monkeypatch, scheduler):
+    calls = []
+
+    async def complete(config, system_prompt, prompt):
+        calls.append((config["provider"], scheduler.running))
+        return "Hi!"
+
+    monkeypatch.setattr(chat, "provider_router", SimpleNamespace(complete=complete))
+    result = asyncio.run(chat.hello(request(), AIConfig(provider="gemini", api_key="key")))
+    assert result == {"response": "Hi!"}
+    assert calls == [("gemini", 1)]
+    assert chat.key_validator.cached("gemini", "key") == (True, "")
+
+def test_hello_is_rejected_when_the_scheduler_is_full(monkeypatch, scheduler):
+    async def complete(config, system_prompt, prompt):
+        raise AssertionError("should not reach the provider")
+
+    monkeypatch.setattr(chat, "provider_router", SimpleNamespace(complete=complete))
+
+    async def main():
+        release = asyncio.Event()
+
+        async def busy():
+            async with scheduler.slot("other", chat.hash_api_key("key")):
+                await release.wait()
+
+        holder = asyncio.create_task(busy())
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as error:
+            await chat.hello(request(), AIConfig(provider="gemini", api_key="key"))
+        assert error.value.status_code == 503
+        # A busy server says nothing about the key
+        assert chat.key_validator.cached("gemini", "key") is None
+        release.set()
+        await holder
+
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+import asyncio
+from webapp.ws.coalescer import ChunkCoalescer
+
+async def tokens(items, delay: float = 0.0):
+    for item in items:
+        if delay:
+            await asyncio.sleep(delay)
+        yield item
+
+async def collect(coalescer: ChunkCoalescer, stream):
+    return [batch async for batch in coalescer.batches(stream)]
+
+def test_disabled_passes_tokens_through():
+    coalescer = ChunkCoalescer(enabled=False)
+    assert asyncio.run(collect(coalescer, tokens(["a", "b", "c"]))) == [("a", 1), ("b", 1), ("c", 1)]
+
+def test_flushes_at_max_bytes_in_order():
+    coalescer = ChunkCoalescer(max_bytes=4, max_delay=60)
+    batches = asyncio.run(collect(coalescer, tokens(["ab", "cd", "ef", "g", "hij", "k"])))
+    assert batches == [("ab", 1), ("cdef", 2), ("ghij", 2), ("k", 1)]
+
+def test_flushes_the_rest_at_end_of_stream():
+    coalescer = ChunkCoalescer(max_bytes=1000, max_delay=60)
+    batches = asyncio.run(collect(coalescer, tokens(["w", "x", "y", "z"])))
+    assert batches == [("w", 1), ("xyz", 3)]
+
+def test_empty_stream():
+    assert asyncio.run(collect(ChunkCoalescer(), tokens([]))) == []
+
+def test_first_token_is_not_delayed():
+    async def main():
+        coalescer = ChunkCoalescer(max_bytes=1000, max_delay=60)
+        batches = coalescer.batches(tokens(["a", "b", "c"]))
+        # Well before max_delay, even though more tokens follow at once
+        assert await asyncio.wait_for(batches.__anext__(), 1) == ("a", 1)
+        assert [batch async for batch in batches] == [("bc", 2)]
+
+    asyncio.run(main())
+
+def test_flushes_when_the_delay_elapses():
+    coalescer = ChunkCoalescer(max_bytes=1000, max_delay=0.01)
+    # Each token arrives after the previous one's window has closed
+    batches = asyncio.run(collect(coalescer, tokens(["a", "b", "c"], delay=0.05)))
+    assert batches == [("a", 1), ("b", 1), ("c", 1)]
+
+def test_keeps_order_and_text_under_mixed_flushes():
+    async def stream():
+        for i in range(50):
+            yield f"{i},"
+            await asyncio.sleep(0.002 if i % 7 else 0.02)
+
+    coalescer = ChunkCoalescer(max_bytes=8, max_delay=0.01)
+    batches = asyncio.run(collect(coalescer, stream()))
+    assert "".join(text for text, _ in batches) == "".join(f"{i}," for i in range(50))
+    assert sum(count for _, count in batches) == 50
+    assert len(batches) < 50
+
+def test_close_cancels_the_pending_read():
+    closed = []
+
+    async def stream():
+        try:
+            yield "a"
+            yield "b"
+            await asyncio.Event().wait()  # Never produces another token
+            yield "c"
+        except asyncio.CancelledError:
+            closed.append(True)
+            raise
+
+    async def main():
+        batches = ChunkCoalescer(max_bytes=1000, max_delay=0.01).batches(stream())
+        assert await batches.__anext__() == ("a", 1)
+        # Flushed by the time window while the next read is pending
+        assert await batches.__anext__() == ("b", 1)
+        await batches.aclose()
+
+    asyncio.run(main())
+    assert closed == [True]
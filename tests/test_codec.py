@@ -0,0 +1,52 @@
+import json
+import pytest
+from webapp.ws.codec import CODECS, JSON_CODEC, JSON_SUBPROTOCOL, MSGPACK_SUBPROTOCOL, negotiate
+
+FRAMES = [
+    {"type": "chunk", "content": "hello", "metadata": {"user_input_id": "u1"}},
+    {"type": "chunk", "content": "naïve \"quoted\" \\ 🚀\n", "metadata": {"user_input_id": "u1", "tokens": 3, "seq": 7}},
+    {"type": "chunk", "content": "", "metadata": {"user_input_id": None, "seq": 0}},
+    {"type": "chunk", "content": "x", "metadata": {"user_input_id": 42, "tokens": 1}},
+    {"type": "chunk", "content": "x", "metadata": {"user_input_id": "u1", "other": True}},
+    {"type": "end_stream", "metadata": {"user_input_id": "u1"}},
+    {"type": "error", "content": "boom", "metadata": {"user_input_id": "u1"}},
+    {"type": "config", "config": {"provider": "gemini", "backends": [{"weight": 1.5}]}},
+]
+
+needs_msgpack = pytest.mark.skipif(MSGPACK_SUBPROTOCOL not in CODECS, reason="msgpack is not installed")
+
+@pytest.mark.parametrize("frame", FRAMES)
+def test_json_round_trip(frame):
+    encoded = JSON_CODEC.encode(frame)
+    assert isinstance(encoded, str)
+    assert JSON_CODEC.decode(encoded) == frame
+
+@pytest.mark.parametrize("frame", FRAMES)
+def test_json_matches_standard_encoding(frame):
+    # The chunk fast path must produce exactly what json.dumps would
+    assert JSON_CODEC.encode(frame) == json.dumps(frame, ensure_ascii=False, separators=(",", ":"))
+
+@needs_msgpack
+@pytest.mark.parametrize("frame", FRAMES)
+def test_msgpack_round_trip(frame):
+    codec = CODECS[MSGPACK_SUBPROTOCOL]
+    encoded = codec.encode(frame)
+    assert isinstance(encoded, bytes)
+    assert codec.decode(encoded) == frame
+
+@needs_msgpack
+def test_msgpack_decodes_text_frames_as_json():
+    assert CODECS[MSGPACK_SUBPROTOCOL].decode('{"type":"get_config"}') == {"type": "get_config"}
+
+def test_negotiate_without_supported_offer():
+    assert negotiate([]) == (JSON_CODEC, None)
+    assert negotiate(["chat", "v2"]) == (JSON_CODEC, None)
+
+def test_negotiate_accepts_the_first_supported_offer():
+    assert negotiate(["chat", JSON_SUBPROTOCOL]) == (JSON_CODEC, JSON_SUBPROTOCOL)
+
+@needs_msgpack
+def test_negotiate_msgpack():
+    codec, subprotocol = negotiate([MSGPACK_SUBPROTOCOL, JSON_SUBPROTOCOL])
+    assert subprotocol == MSGPACK_SUBPROTOCOL and codec.binary
+    assert negotiate([JSON_SUBPROTOCOL, MSGPACK_SUBPROTOCOL]) == (JSON_CODEC, JSON_SUBPROTOCOL)
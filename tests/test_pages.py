@@ -0,0 +1,87 @@
+import gzip
+import json
+import os
+from fastapi.templating import Jinja2Templates
+from starlette.requests import Request
+from webapp.assets import AssetManifest
+from webapp.pages import CachedPage, etag_matches
+
+def request(**headers) -> Request:
+    raw = [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw})
+
+def write(path, text: str):
+    """Write a file and move its mtime on, so the change shows even on coarse clocks."""
+    mtime = path.stat().st_mtime_ns if path.exists() else 0
+    path.write_text(text, encoding="utf-8")
+    os.utime(path, ns=(mtime + 10 ** 9, mtime + 10 ** 9))
+
+def write_manifest(manifest: AssetManifest, script: str):
+    manifest.dist_dir.mkdir(parents=True, exist_ok=True)
+    write(manifest.path, json.dumps({"files": {"js/index.js": f"dist/{script}"}, "sources": {}}))
+
+def make_page(tmp_path, check_interval: float = 0):
+    templates_dir = tmp_path / "templates"
+    templates_dir.mkdir()
+    write(templates_dir / "index.html", '<script src="{{ asset_url("js/index.js") }}"></script>')
+    manifest = AssetManifest(tmp_path / "static", enabled=True)
+    write_manifest(manifest, "index.1111.js")
+    templates = Jinja2Templates(directory=str(templates_dir))
+    templates.env.globals["asset_url"] = manifest.url
+    page = CachedPage(templates, "index.html", templates_dir, manifest, check_interval=check_interval)
+    return page, templates_dir / "index.html", manifest
+
+def test_etag_matches():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('W/"abc"', '"abc"')
+    assert etag_matches('"x", "abc"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches("", '"abc"')
+    assert not etag_matches('"abcd"', '"abc"')
+
+def test_serves_the_rendered_page_and_revalidates_with_304(tmp_path):
+    page, _, _ = make_page(tmp_path)
+    response = page.response(request())
+    assert response.status_code == 200
+    assert response.body == b'<script src="/static/dist/index.1111.js"></script>'
+    etag = response.headers["etag"]
+    assert response.headers["cache-control"] == "no-cache"
+
+    revalidated = page.response(request(if_none_match=etag))
+    assert revalidated.status_code == 304
+    assert revalidated.body == b""
+    assert revalidated.headers["etag"] == etag
+
+    assert page.response(request(if_none_match='"stale"')).status_code == 200
+
+def test_gzip_when_accepted(tmp_path):
+    page, _, _ = make_page(tmp_path)
+    response = page.response(request(accept_encoding="gzip, br"))
+    assert response.headers["content-encoding"] == "gzip"
+    assert gzip.decompress(response.body) == page.body
+    assert "content-encoding" not in page.response(request(accept_encoding="gzip;q=0")).headers
+
+def test_rerenders_when_the_template_changes(tmp_path):
+    page, template, _ = make_page(tmp_path)
+    etag = page.response(request()).headers["etag"]
+    write(template, '<main></main><script src="{{ asset_url("js/index.js") }}"></script>')
+    response = page.response(request(if_none_match=etag))
+    assert response.status_code == 200
+    assert response.body.startswith(b"<main></main>")
+    assert response.headers["etag"] != etag
+
+def test_rerenders_when_the_manifest_changes(tmp_path):
+    page, _, manifest = make_page(tmp_path)
+    etag = page.response(request()).headers["etag"]
+    write_manifest(manifest, "index.22222222.js")
+    response = page.response(request(if_none_match=etag))
+    assert response.status_code == 200
+    assert response.body == b'<script src="/static/dist/index.22222222.js"></script>'
+
+def test_checks_files_at_most_once_per_interval(tmp_path):
+    page, template, _ = make_page(tmp_path, check_interval=60)
+    body = page.response(request()).body
+    write(template, "changed")
+    assert page.response(request()).body == body
+    page._checked_at = None
+    assert page.response(request()).body == b"changed"
@@ -0,0 +1,135 @@
+import asyncio
+import json
+from fakes import FakeWebSocket, drain
+from starlette.websockets import WebSocketState
+from webapp.ws.connection import manager
+from webapp.ws.protocol import ChatFrame, Frame, MessageRouter
+from webapp.ws.routes import websocket_endpoint
+
+def errors(websocket: FakeWebSocket):
+    return [frame for frame in websocket.sent if frame["type"] == "error"]
+
+async def connect() -> FakeWebSocket:
+    websocket = FakeWebSocket()
+    manager.add_connection(websocket)
+    return websocket
+
+def test_dispatch_runs_the_registered_handler_with_a_typed_frame():
+    async def main():
+        router = MessageRouter()
+        received = []
+
+        @router.register("message", ChatFrame)
+        async def handle(websocket, frame):
+            received.append(frame)
+
+        websocket = await connect()
+        await router.dispatch(websocket, {"type": "message", "content": "hi", "metadata": {"coalesce": True}})
+        assert len(received) == 1
+        assert isinstance(received[0], ChatFrame)
+        assert received[0].content == "hi" and received[0].metadata.coalesce
+        manager.remove_connection(websocket)
+
+    asyncio.run(main())
+
+def test_unknown_type_is_rejected():
+    async def main():
+        router = MessageRouter()
+        websocket = await connect()
+        for data in ({"type": "nope"}, {"content": "no type"}, ["not", "a", "dict"]):
+            await router.dispatch(websocket, data)
+        await drain()
+        assert [frame["content"] for frame in errors(websocket)] == ["Unknown message type"] * 3
+        assert all(frame["metadata"]["error_type"] == "invalid_message" for frame in errors(websocket))
+        manager.remove_connection(websocket)
+
+    asyncio.run(main())
+
+def test_schema_error_is_rejected_without_running_the_handler():
+    async def main():
+        router = MessageRouter()
+        received = []
+
+        @router.register("message", ChatFrame)
+        async def handle(websocket, frame):
+            received.append(frame)
+
+        websocket = await connect()
+        await router.dispatch(websocket, {"type": "message", "content": 42, "metadata": {"user_input_id": "u1"}})
+        await drain()
+        assert received == []
+        [error] = errors(websocket)
+        assert error["content"].startswith("Invalid message frame")
+        assert error["metadata"] == {"error_type": "invalid_message", "user_input_id": "u1"}
+        manager.remove_connection(websocket)
+
+    asyncio.run(main())
+
+def test_background_handler_runs_in_a_tracked_task():
+    async def main():
+        router = MessageRouter()
+        release = asyncio.Event()
+        finished = []
+
+        @router.register("slow", Frame, background=True)
+        async def handle(websocket, frame):
+            await release.wait()
+            finished.append(frame.type)
+
+        websocket = await connect()
+        # Returns before the handler finishes, so the receive loop is free
+        await router.dispatch(websocket, {"type": "slow"})
+        [task] = manager.connections[websocket].tasks
+        assert not task.done()
+        release.set()
+        await task
+        await drain()
+        assert finished == ["slow"]
+        assert manager.connections[websocket].tasks == set()
+        manager.remove_connection(websocket)
+
+    asyncio.run(main())
+
+def test_handler_error_is_reported():
+    async def main():
+        router = MessageRouter()
+
+        @router.register("boom")
+        async def handle(websocket, frame):
+            raise RuntimeError("failed")
+
+        websocket = await connect()
+        await router.dispatch(websocket, {"type": "boom"})
+        await drain()
+        assert errors(websocket) == [{"type": "error", "content": "failed", "metadata": {"error_type": "processing"}}]
+        manager.remove_connection(websocket)
+
+    asyncio.run(main())
+
+class ScriptedWebSocket(FakeWebSocket):
+    """A client that sends the given text messages, then disconnects."""
+
+    def __init__(self, messages):
+        super().__init__()
+        self.scope = {"subprotocols": []}
+        self.messages = list(messages)
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def receive(self):
+        await drain()
+        if not self.messages:
+            return {"type": "websocket.disconnect", "code": 1000}
+        return {"type": "websocket.receive", "text": self.messages.pop(0)}
+
+def test_malformed_message_keeps_the_connection_open():
+    async def main():
+        websocket = ScriptedWebSocket(["{not json", json.dumps({"type": "nope"})])
+        await websocket_endpoint(websocket)
+        assert [frame["type"] for frame in websocket.sent] == ["session", "error", "error"]
+        assert [frame["content"] for frame in errors(websocket)] == ["Malformed message", "Unknown message type"]
+        assert websocket.client_state == WebSocketState.CONNECTED
+        assert websocket not in manager.connections
+
+    asyncio.run(main())
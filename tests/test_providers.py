@@ -0,0 +1,125 @@
+import asyncio
+from contextlib import aclosing
+import pytest
+import time
+from webapp.agent_pool import AgentPool
+from webapp.providers import ProviderRouter
+
+class FakeAgent:
+    """Streams `tokens` after `ttft` seconds, or fails with `error` instead."""
+
+    def __init__(self, provider: str, ttft: float = 0.0, tokens=("hello", " world"), error: Exception = None):
+        self.provider = provider
+        self.ttft = ttft
+        self.tokens = tokens
+        self.error = error
+        self.closed = 0
+
+    async def _stream(self):
+        try:
+            await asyncio.sleep(self.ttft)
+            if self.error is not None:
+                raise self.error
+            for token in self.tokens:
+                yield token
+        finally:
+            self.closed += 1
+
+    async def request(self, message: str, stream: bool = False):
+        return self._stream()
+
+def make_router(agents, hedge_delay: float = 0.0):
+    """A router whose pool builds each provider's fake agent."""
+    by_provider = {agent.provider: agent for agent in agents}
+    pool = AgentPool(factory=lambda system_prompt, api_key, provider: by_provider[provider])
+    return ProviderRouter(pool=pool, policy="failover", hedge_delay=hedge_delay, error_cooldown=60), pool
+
+def config(*providers) -> dict:
+    primary, *others = providers
+    return {
+        "provider": primary, "api_key": f"{primary}-key",
+        "backends": [{"provider": provider, "api_key": f"{provider}-key"} for provider in others]
+    }
+
+async def read(router: ProviderRouter, config: dict, selected: list = None):
+    on_selected = selected.append if selected is not None else None
+    stream = await router.open_stream(config, "system", "prompt", on_selected)
+    async with aclosing(stream):
+        return [token async for token in stream]
+
+def test_single_backend_streams_and_returns_its_agent():
+    async def main():
+        agent = FakeAgent("a")
+        router, pool = make_router([agent])
+        assert await read(router, config("a")) == ["hello", " world"]
+        assert agent.closed == 1
+        assert pool.leased == 0 and pool.idle_count == 1
+
+    asyncio.run(main())
+
+def test_fails_over_when_the_first_backend_raises():
+    async def main():
+        failing = FakeAgent("a", error=RuntimeError("down"))
+        working = FakeAgent("b", tokens=("from b",))
+        router, pool = make_router([failing, working])
+        selected = []
+        assert await read(router, config("a", "b"), selected) == ["from b"]
+        assert [backend.provider for backend in selected] == ["b"]
+        backend = router.backends[selected[0].name]
+        assert backend.ttft is not None
+        # The failed backend is cooling down and its agent was discarded
+        failed = next(backend for backend in router.backends.values() if backend.provider == "a")
+        assert failed.errors == 1 and not failed.available(time.monotonic())
+        assert pool.leased == 0 and pool.idle_count == 1
+        # Next time the healthy backend is tried first
+        assert router.plan(router.resolve(config("a", "b")), "failover")[0].provider == "b"
+
+    asyncio.run(main())
+
+def test_hedge_fires_after_the_delay_and_the_loser_is_kept_healthy():
+    async def main():
+        slow = FakeAgent("a", ttft=60)
+        fast = FakeAgent("b", ttft=0.01, tokens=("fast",))
+        router, pool = make_router([slow, fast], hedge_delay=0.02)
+        selected = []
+        started = asyncio.get_running_loop().time()
+        assert await read(router, config("a", "b"), selected) == ["fast"]
+        assert asyncio.get_running_loop().time() - started < 1
+        assert [backend.provider for backend in selected] == ["b"]
+        # The slow backend's stream was closed and its agent went back to the pool
+        assert slow.closed == 1 and fast.closed == 1
+        assert pool.leased == 0 and pool.idle_count == 2
+        assert all(backend.errors == 0 for backend in router.backends.values())
+
+    asyncio.run(main())
+
+def test_no_hedge_when_the_first_token_arrives_in_time():
+    async def main():
+        first = FakeAgent("a", ttft=0.01)
+        second = FakeAgent("b")
+        router, pool = make_router([first, second], hedge_delay=0.5)
+        assert await read(router, config("a", "b")) == ["hello", " world"]
+        assert second.closed == 0 and pool.created == 1
+
+    asyncio.run(main())
+
+def test_raises_the_last_error_when_every_backend_fails():
+    async def main():
+        router, pool = make_router([
+            FakeAgent("a", error=RuntimeError("first")),
+            FakeAgent("b", error=RuntimeError("second"))
+        ])
+        with pytest.raises(RuntimeError, match="second"):
+            await router.open_stream(config("a", "b"), "system", "prompt")
+        assert pool.leased == 0 and pool.idle_count == 0
+        assert all(backend.errors == 1 for backend in router.backends.values())
+
+    asyncio.run(main())
+
+def test_no_backend_configured():
+    async def main():
+        router, _ = make_router([])
+        with pytest.raises(ValueError):
+            await router.open_stream({"provider": "a"}, "system", "prompt")
+
+    asyncio.run(main())
@@ -0,0 +1,138 @@
+import asyncio
+from fakes import FakeWebSocket, drain
+from webapp.ws.connection import manager
+from webapp.ws.resume import ResumableStreams
+
+def chunk(text: str) -> dict:
+    return {"type": "chunk", "content": text, "metadata": {"user_input_id": "u1"}}
+
+def contents(websocket: FakeWebSocket):
+    return [(frame["content"], frame["metadata"].get("seq")) for frame in websocket.sent if frame["type"] == "chunk"]
+
+async def start(streams: ResumableStreams, frames: int):
+    """A connection with one stream that has sent some chunks, then drops."""
+    websocket = FakeWebSocket()
+    manager.add_connection(websocket)
+    session_id = manager.get_session_id(websocket)
+    record = manager.start_stream(websocket, session_id, "u1")
+    buffer = streams.open(websocket, record)
+    for i in range(1, frames + 1):
+        assert await streams.send(buffer, chunk(f"t{i}"))
+    await drain()
+    manager.remove_connection(websocket)
+    return websocket, session_id, record, buffer
+
+def reconnect() -> FakeWebSocket:
+    websocket = FakeWebSocket()
+    manager.add_connection(websocket)
+    return websocket
+
+def test_resume_replays_missed_frames_then_goes_live():
+    async def main():
+        streams = ResumableStreams(grace_period=5, max_frames=10)
+        old, session_id, record, buffer = await start(streams, 3)
+        assert contents(old) == [("t1", 1), ("t2", 2), ("t3", 3)]
+        # Produced while no client was attached
+        assert await streams.send(buffer, chunk("t4"))
+
+        websocket = reconnect()
+        assert await streams.resume(websocket, "u1", session_id, last_seq=2)
+        assert await streams.send(buffer, chunk("t5"))
+        await streams.finish(buffer, {"type": "end_stream", "metadata": {"user_input_id": "u1"}})
+        await drain()
+        assert contents(websocket) == [("t3", 3), ("t4", 4), ("t5", 5)]
+        assert websocket.sent[-1]["type"] == "end_stream"
+        assert manager.find_stream(websocket, "u1") is record
+        manager.end_stream(record)
+        streams.release(buffer)
+        assert streams.buffers == {}
+        manager.remove_connection(websocket)
+
+    asyncio.run(main())
+
+def test_resume_after_the_stream_finished():
+    async def main():
+        streams = ResumableStreams(grace_period=5, max_frames=10)
+        _, session_id, record, buffer = await start(streams, 2)
+        await streams.finish(buffer, {"type": "end_stream", "metadata": {"user_input_id": "u1"}})
+        manager.end_stream(record)
+        streams.release(buffer)
+        assert streams.buffers  # Kept for a late resume
+
+        websocket = reconnect()
+        assert await streams.resume(websocket, "u1", session_id, last_seq=1)
+        await drain()
+        assert contents(websocket) == [("t2", 2)]
+        assert websocket.sent[-1]["type"] == "end_stream"
+        assert streams.buffers == {}
+        manager.remove_connection(websocket)
+
+    asyncio.run(main())
+
+def test_resume_fails_once_missed_frames_were_evicted():
+    async def main():
+        streams = ResumableStreams(grace_period=5, max_frames=3)
+        _, session_id, record, buffer = await start(streams, 6)
+
+        websocket = reconnect()
+        assert not await streams.resume(websocket, "u1", session_id, last_seq=1)
+        await drain()
+        assert contents(websocket) == []
+        # The stream cannot be caught up, so it is cancelled
+        assert record.cancel_event.is_set()
+        assert buffer.abandoned and streams.buffers == {}
+        assert not await streams.send(buffer, chunk("t7"))
+        manager.end_stream(record)
+        manager.remove_connection(websocket)
+
+    asyncio.run(main())
+
+def test_grace_period_expiry_cancels_the_stream():
+    async def main():
+        streams = ResumableStreams(grace_period=0.05, max_frames=10)
+        _, session_id, record, buffer = await start(streams, 2)
+        assert not record.cancel_event.is_set()
+        await asyncio.sleep(0.1)
+        assert record.cancel_event.is_set()
+        assert buffer.abandoned and streams.buffers == {}
+
+        websocket = reconnect()
+        assert not await streams.resume(websocket, "u1", session_id, last_seq=2)
+        manager.end_stream(record)
+        manager.remove_connection(websocket)
+
+    asyncio.run(main())
+
+def test_no_grace_period_abandons_on_disconnect():
+    async def main():
+        streams = ResumableStreams(grace_period=0, max_frames=10)
+        _, _, record, buffer = await start(streams, 1)
+        assert buffer.abandoned and streams.buffers == {}
+        assert not await streams.send(buffer, chunk("t2"))
+        manager.end_stream(record)
+
+    asyncio.run(main())
+
+def test_resume_from_another_session_is_rejected():
+    async def main():
+        streams = ResumableStreams(grace_period=5, max_frames=10)
+        _, session_id, record, buffer = await start(streams, 2)
+
+        intruder = FakeWebSocket()
+        manager.add_connection(intruder)
+        assert not await streams.resume(intruder, "u1", manager.get_session_id(intruder), last_seq=0)
+        await drain()
+        assert intruder.sent == []
+        # Still resumable by its own session
+        assert not record.cancel_event.is_set()
+        websocket = reconnect()
+        assert await streams.resume(websocket, "u1", session_id, last_seq=0)
+        await drain()
+        assert contents(websocket) == [("t1", 1), ("t2", 2)]
+
+        manager.end_stream(record)
+        streams.release(buffer)
+        for connection in (intruder, websocket):
+            manager.remove_connection(connection)
+
+    asyncio.run(main())
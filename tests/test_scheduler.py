@@ -0,0 +1,179 @@
+import asyncio
+import pytest
+from webapp.ws.scheduler import QueueCancelled, QueueFull, RequestScheduler, parse_weights
+
+def make_scheduler(**kwargs) -> RequestScheduler:
+    options = {"max_concurrent": 1, "max_per_connection": 10, "max_queued": 100, "weights": {}}
+    options.update(kwargs)
+    return RequestScheduler(**options)
+
+async def grant_order(scheduler: RequestScheduler, requests):
+    """Queue (connection, key) requests behind a held slot and return the keys in the order they run."""
+    order = []
+    release = asyncio.Event()
+
+    async def blocker():
+        async with scheduler.slot("blocker", "blocker"):
+            await release.wait()
+
+    async def request(connection, key):
+        async with scheduler.slot(connection, key):
+            order.append(key)
+            await asyncio.sleep(0)
+
+    holder = asyncio.create_task(blocker())
+    await asyncio.sleep(0)
+    tasks = []
+    for connection, key in requests:
+        tasks.append(asyncio.create_task(request(connection, key)))
+        await asyncio.sleep(0)  # Queue in submission order
+    release.set()
+    await asyncio.gather(holder, *tasks)
+    return order
+
+def test_parse_weights():
+    assert parse_weights("a:2, b:1,c:0,d:x,:3,e") == {"a": 2, "b": 1}
+
+def test_global_cap():
+    async def main():
+        scheduler = make_scheduler(max_concurrent=3)
+        running = peak = 0
+
+        async def request(i):
+            nonlocal running, peak
+            async with scheduler.slot(i, f"key{i % 2}"):
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        await asyncio.gather(*(request(i) for i in range(12)))
+        assert peak == 3
+        assert scheduler.running == 0 and scheduler.queued == 0
+        assert scheduler.running_per_connection == {}
+
+    asyncio.run(main())
+
+def test_per_connection_cap():
+    async def main():
+        scheduler = make_scheduler(max_concurrent=10, max_per_connection=2)
+        running = {"a": 0, "b": 0}
+        peak = {"a": 0, "b": 0}
+
+        async def request(connection):
+            async with scheduler.slot(connection, "key"):
+                running[connection] += 1
+                peak[connection] = max(peak[connection], running[connection])
+                await asyncio.sleep(0.01)
+                running[connection] -= 1
+
+        await asyncio.gather(*(request(connection) for connection in "aaaaab"))
+        assert peak == {"a": 2, "b": 1}
+
+    asyncio.run(main())
+
+def test_blocked_connection_does_not_block_others():
+    async def main():
+        scheduler = make_scheduler(max_concurrent=2, max_per_connection=1)
+        release = asyncio.Event()
+        started = []
+
+        async def request(connection):
+            async with scheduler.slot(connection, "key"):
+                started.append(connection)
+                await release.wait()
+
+        tasks = [asyncio.create_task(request(connection)) for connection in ("busy", "busy", "other")]
+        await asyncio.sleep(0.01)
+        # "other" is not stuck behind the queued second "busy" request
+        assert started == ["busy", "other"]
+        assert scheduler.queued == 1
+        release.set()
+        await asyncio.gather(*tasks)
+        assert started == ["busy", "other", "busy"]
+
+    asyncio.run(main())
+
+def test_round_robin_between_keys():
+    async def main():
+        scheduler = make_scheduler()
+        requests = [(i, "a") for i in range(4)] + [(10 + i, "b") for i in range(2)]
+        assert await grant_order(scheduler, requests) == ["a", "b", "a", "b", "a", "a"]
+
+    asyncio.run(main())
+
+def test_weighted_round_robin():
+    async def main():
+        scheduler = make_scheduler(weights={"a": 2})
+        requests = [(i, "a") for i in range(4)] + [(10 + i, "b") for i in range(3)]
+        assert await grant_order(scheduler, requests) == ["a", "a", "b", "a", "a", "b", "b"]
+
+    asyncio.run(main())
+
+def test_queue_full():
+    async def main():
+        scheduler = make_scheduler(max_queued=2)
+        release = asyncio.Event()
+
+        async def request(i):
+            async with scheduler.slot(i, "key"):
+                await release.wait()
+
+        tasks = [asyncio.create_task(request(i)) for i in range(3)]
+        await asyncio.sleep(0)
+        assert scheduler.running == 1 and scheduler.queued == 2
+        with pytest.raises(QueueFull):
+            async with scheduler.slot(99, "key"):
+                pass
+        assert scheduler.queued == 2
+        release.set()
+        await asyncio.gather(*tasks)
+        # Room again once the queue drains
+        async with scheduler.slot(99, "key"):
+            pass
+
+    asyncio.run(main())
+
+def test_queue_positions_and_cancel():
+    async def main():
+        scheduler = make_scheduler()
+        release = asyncio.Event()
+        cancel = asyncio.Event()
+        positions = []
+
+        async def on_queued(position, queued):
+            positions.append((position, queued))
+
+        async def holder():
+            async with scheduler.slot("holder", "key"):
+                await release.wait()
+
+        async def waiting(i):
+            async with scheduler.slot(i, "key"):
+                pass
+
+        async def tracked():
+            async with scheduler.slot("tracked", "key", on_queued=on_queued, cancel_event=cancel):
+                pass
+
+        hold = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        first = asyncio.create_task(waiting(1))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(tracked())
+        await asyncio.sleep(0)
+        assert positions == [(2, 2)]
+
+        first.cancel()
+        await asyncio.sleep(0.01)
+        assert positions[-1] == (1, 1)
+
+        cancel.set()
+        with pytest.raises(QueueCancelled):
+            await second
+        assert scheduler.queued == 0 and scheduler.queues == {}
+        release.set()
+        await hold
+        assert scheduler.running == 0
+
+    asyncio.run(main())
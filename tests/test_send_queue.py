@@ -0,0 +1,111 @@
+import asyncio
+import pytest
+from fakes import FakeWebSocket, drain
+from webapp.ws.send_queue import POLICY_COALESCE, POLICY_DROP, POLICY_PAUSE, SLOW_CLIENT_CLOSE_CODE, SendQueue, merge_chunks
+
+def chunk(text: str, user_input_id: str = "u1", **metadata) -> dict:
+    return {"type": "chunk", "content": text, "metadata": {"user_input_id": user_input_id, **metadata}}
+
+async def stalled(policy: str, max_size: int = 2):
+    """A queue whose client stopped reading, with one frame stuck in the write."""
+    websocket = FakeWebSocket()
+    websocket.gate.clear()
+    queue = SendQueue(websocket, max_size=max_size, policy=policy)
+    assert await queue.send({"type": "ack"})
+    await drain()
+    return websocket, queue
+
+def test_merge_chunks():
+    merged = merge_chunks(chunk("a", tokens=2, seq=1), chunk("b", seq=2))
+    assert merged == chunk("ab", tokens=3, seq=2)
+    assert merge_chunks(chunk("a"), chunk("b")) == chunk("ab")
+    assert merge_chunks(chunk("a"), chunk("b", user_input_id="u2")) is None
+    assert merge_chunks({"type": "ack"}, chunk("b")) is None
+
+def test_unknown_policy():
+    async def main():
+        with pytest.raises(ValueError):
+            SendQueue(FakeWebSocket(), policy="nope")
+
+    asyncio.run(main())
+
+def test_frames_are_written_in_order():
+    async def main():
+        websocket = FakeWebSocket()
+        queue = SendQueue(websocket, max_size=4, policy=POLICY_PAUSE)
+        for i in range(10):
+            assert await queue.send(chunk(str(i)))
+        await drain(20)
+        assert [frame["content"] for frame in websocket.sent] == [str(i) for i in range(10)]
+        queue.close()
+
+    asyncio.run(main())
+
+def test_coalesce_merges_chunks_in_order_when_full():
+    async def main():
+        websocket, queue = await stalled(POLICY_COALESCE)
+        for i in range(6):
+            assert await queue.send(chunk(str(i), seq=i + 1))
+        assert len(queue) == 2 and queue.coalesced == 4
+        websocket.gate.set()
+        await drain()
+        assert websocket.sent == [{"type": "ack"}, chunk("0", seq=1), chunk("12345", seq=6)]
+        queue.close()
+
+    asyncio.run(main())
+
+def test_coalesce_waits_for_frames_it_cannot_merge():
+    async def main():
+        websocket, queue = await stalled(POLICY_COALESCE)
+        assert await queue.send(chunk("a"))
+        assert await queue.send({"type": "end_stream", "metadata": {"user_input_id": "u1"}})
+        blocked = asyncio.create_task(queue.send(chunk("b", user_input_id="u2")))
+        await drain()
+        assert not blocked.done()
+        websocket.gate.set()
+        assert await blocked
+        await drain()
+        assert [frame["type"] for frame in websocket.sent] == ["ack", "chunk", "end_stream", "chunk"]
+        queue.close()
+
+    asyncio.run(main())
+
+def test_drop_closes_a_slow_client():
+    async def main():
+        websocket, queue = await stalled(POLICY_DROP)
+        assert await queue.send(chunk("a"))
+        assert await queue.send(chunk("b"))
+        assert not await queue.send(chunk("c"))
+        assert websocket.close_code == SLOW_CLIENT_CLOSE_CODE
+        assert queue.closed and len(queue) == 0
+        assert not await queue.send(chunk("d"))
+
+    asyncio.run(main())
+
+def test_pause_blocks_the_sender_until_there_is_room():
+    async def main():
+        websocket, queue = await stalled(POLICY_PAUSE)
+        assert await queue.send(chunk("a"))
+        assert await queue.send(chunk("b"))
+        blocked = asyncio.create_task(queue.send(chunk("c")))
+        await drain()
+        # Not merged or dropped: the sender waits
+        assert not blocked.done() and len(queue) == 2 and queue.coalesced == 0
+        websocket.gate.set()
+        assert await blocked
+        await drain()
+        assert [frame.get("content") for frame in websocket.sent] == [None, "a", "b", "c"]
+        queue.close()
+
+    asyncio.run(main())
+
+def test_close_releases_a_paused_sender():
+    async def main():
+        _, queue = await stalled(POLICY_PAUSE, max_size=1)
+        assert await queue.send(chunk("a"))
+        blocked = asyncio.create_task(queue.send(chunk("b")))
+        await drain()
+        queue.close()
+        assert not await blocked
+
+    asyncio.run(main())
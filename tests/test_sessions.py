@@ -0,0 +1,159 @@
+import asyncio
+import pytest
+from webapp import sessions
+from webapp.sessions import ASSISTANT, USER, Session, SessionStore
+from webapp.state import BrokerStateBackend, MemoryStateBackend
+from webapp.transcripts import ROLE_ASSISTANT, ROLE_USER, TranscriptStore
+
+@pytest.fixture
+def memory_backend(monkeypatch):
+    monkeypatch.setattr(sessions, "state_backend", MemoryStateBackend())
+
+@pytest.fixture
+def no_transcripts(monkeypatch):
+    monkeypatch.setattr(sessions, "transcript_store", TranscriptStore(None))
+
+def make_store(**kwargs) -> SessionStore:
+    options = {"max_sessions": 100, "memory_limit": 1 << 20, "token_budget": 1000, "summary_chars": 200}
+    options.update(kwargs)
+    return SessionStore(**options)
+
+def test_render_prompt_prefixes_the_history():
+    session = Session("s1")
+    assert session.render_prompt("hi") == "hi"
+    session.add_turn(USER, "What is 2 + 2?", 1000, 200)
+    session.add_turn(ASSISTANT, "4", 1000, 200)
+    assert session.render_prompt("And 3 + 3?") == (
+        f"{USER}: What is 2 + 2?\n{ASSISTANT}: 4\n{USER}: And 3 + 3?\n{ASSISTANT}:"
+    )
+
+def test_session_dict_round_trip():
+    session = Session("s1")
+    session.add_turn(USER, "What is a monad?", 1000, 200)
+    session.add_turn(ASSISTANT, "A monoid in the category of endofunctors.", 1000, 200)
+    session.summary = "earlier topic"
+    restored = Session.from_dict("s1", session.to_dict())
+    assert list(restored.turns) == list(session.turns)
+    assert (restored.tokens, restored.size, restored.memory) == (session.tokens, session.size, session.memory)
+    assert restored.history_hash() == session.history_hash()
+    assert restored.render_prompt("And then?") == session.render_prompt("And then?")
+
+def test_budget_folds_old_prompts_into_the_summary():
+    session = Session("s1")
+    for i in range(10):
+        session.add_turn(USER, f"question {i} " + "x" * 40, 40, 200)
+        session.add_turn(ASSISTANT, "answer " + "y" * 40, 40, 200)
+    assert session.tokens <= 40
+    # Dropped prompts are summarised, keeping the most recent topics
+    assert len(session.summary) <= 200
+    assert session.summary.endswith("; question 8 " + "x" * 40)
+    assert "question 0" not in session.summary
+    assert [role for role, _, _ in session.turns] == [ASSISTANT, USER, ASSISTANT]
+    assert session.render_prompt("next").startswith("(Earlier topics: ")
+
+def test_store_evicts_least_recently_used(memory_backend):
+    async def main():
+        await store.add_exchange("a", "hi", "hello")
+        await store.add_exchange("b", "hi", "hello")
+        store.get("a")
+        await store.add_exchange("c", "hi", "hello")
+
+    store = make_store(max_sessions=2)
+    asyncio.run(main())
+    assert list(store.sessions) == ["a", "c"]
+    assert store.evicted == 1
+    assert store.memory == sum(session.memory for session in store.sessions.values())
+
+def test_store_evicts_over_memory_limit(memory_backend):
+    async def main():
+        await store.add_exchange("a", "x" * 60, "")
+        await store.add_exchange("b", "y" * 60, "")
+
+    store = make_store(memory_limit=100)
+    asyncio.run(main())
+    assert list(store.sessions) == ["b"]
+    assert store.memory == 60
+
+def test_load_shares_sessions_through_the_broker(tmp_path, monkeypatch, no_transcripts):
+    async def main():
+        path = tmp_path / "state.sock"
+        owner, other = BrokerStateBackend(path), BrokerStateBackend(path)
+        await owner.start()
+        await other.start()
+        try:
+            monkeypatch.setattr(sessions, "state_backend", owner)
+            first = make_store()
+            await first.add_exchange("s1", "What is 2 + 2?", "4")
+
+            monkeypatch.setattr(sessions, "state_backend", other)
+            second = make_store()
+            session = await second.load("s1")
+            assert session.to_dict() == first.find("s1").to_dict()
+            assert second.memory == session.memory
+            # A session the server just minted is not looked up
+            assert not (await second.load("s2", new=True)).turns
+        finally:
+            await other.stop()
+            await owner.stop()
+
+    asyncio.run(main())
+
+def test_workers_interleaving_turns_keep_them_all(tmp_path, monkeypatch, no_transcripts):
+    async def main():
+        path = tmp_path / "state.sock"
+        backends = [BrokerStateBackend(path), BrokerStateBackend(path)]
+        for backend in backends:
+            await backend.start()
+        stores = [make_store(), make_store()]
+        try:
+            async def exchange(worker: int, text: str, load: bool = True):
+                monkeypatch.setattr(sessions, "state_backend", backends[worker])
+                if load:
+                    await stores[worker].load("s1")
+                await stores[worker].add_exchange("s1", text, f"re: {text}")
+
+            # Each worker holds the session in memory after its first turn
+            await exchange(0, "one")
+            await exchange(1, "two")
+            await exchange(0, "three")
+            # Worker 1 saves from a stale copy, without loading first
+            await exchange(1, "four", load=False)
+
+            expected = [[role, text] for message in ("one", "two", "three", "four") for role, text in ((USER, message), (ASSISTANT, f"re: {message}"))]
+            data, _ = await backends[0].load_session("s1")
+            assert data["turns"] == expected
+            for worker in (0, 1):
+                monkeypatch.setattr(sessions, "state_backend", backends[worker])
+                session = await stores[worker].load("s1")
+                assert session.to_dict()["turns"] == expected
+                assert stores[worker].memory == session.memory
+        finally:
+            for backend in reversed(backends):
+                await backend.stop()
+
+    asyncio.run(main())
+
+def test_load_rebuilds_from_the_transcript(tmp_path, monkeypatch, memory_backend):
+    async def main():
+        transcripts = TranscriptStore(tmp_path / "transcripts.db", flush_interval=0)
+        monkeypatch.setattr(sessions, "transcript_store", transcripts)
+        await transcripts.start()
+        try:
+            transcripts.append("s1", "u1", ROLE_USER, "What is 2 + 2?")
+            transcripts.append("s1", "u1", ROLE_ASSISTANT, "4", "complete")
+            transcripts.append("s1", "u2", ROLE_ASSISTANT, "", "cancelled")
+            transcripts.append("s2", "u3", ROLE_USER, "Someone else")
+            await transcripts.flush()
+
+            store = make_store()
+            session = await store.load("s1")
+            assert session.to_dict() == {"summary": "", "turns": [[USER, "What is 2 + 2?"], [ASSISTANT, "4"]]}
+            assert store.memory == session.memory
+            # Loading again keeps the session in memory instead of rebuilding it
+            session.add_turn(USER, "Thanks", store.token_budget, store.summary_chars)
+            assert await store.load("s1") is session
+            assert not (await store.load("s1-new", new=True)).turns
+        finally:
+            await transcripts.stop()
+
+    asyncio.run(main())
@@ -0,0 +1,114 @@
+import asyncio
+import sqlite3
+from webapp.transcripts import ROLE_ASSISTANT, ROLE_USER, TranscriptStore
+
+def contents(entries):
+    return [entry["content"] for entry in entries]
+
+def count_rows(path) -> int:
+    with sqlite3.connect(str(path)) as db:
+        return db.execute("SELECT COUNT(*) FROM transcript").fetchone()[0]
+
+def test_disabled_without_a_path():
+    async def main():
+        store = TranscriptStore(None)
+        await store.start()
+        assert not store.enabled
+        store.append("s1", "u1", ROLE_USER, "hello")
+        assert store.pending == []
+        assert await store.page("s1") == ([], None)
+        await store.flush()
+        await store.stop()
+
+    asyncio.run(main())
+
+def test_page_cursor_walks_back_through_the_history(tmp_path):
+    async def main():
+        store = TranscriptStore(tmp_path / "transcripts.db", flush_interval=0)
+        await store.start()
+        try:
+            for i in range(7):
+                store.append("s1", f"u{i}", ROLE_USER, f"m{i}")
+                store.append("other", None, ROLE_USER, "elsewhere")
+            await store.flush()
+
+            entries, cursor = await store.page("s1", limit=3)
+            assert contents(entries) == ["m4", "m5", "m6"]
+            assert cursor == entries[0]["id"]
+            entries, cursor = await store.page("s1", before=cursor, limit=3)
+            assert contents(entries) == ["m1", "m2", "m3"]
+            entries, cursor = await store.page("s1", before=cursor, limit=3)
+            assert contents(entries) == ["m0"]
+            assert cursor is None
+            assert entries[0]["user_input_id"] == "u0" and entries[0]["role"] == ROLE_USER
+        finally:
+            await store.stop()
+
+    asyncio.run(main())
+
+def test_newest_page_includes_unwritten_entries(tmp_path):
+    async def main():
+        store = TranscriptStore(tmp_path / "transcripts.db", flush_interval=0.2)
+        await store.start()
+        try:
+            store.append("s1", "u1", ROLE_USER, "question")
+            store.append("s1", "u1", ROLE_ASSISTANT, "answer", "complete")
+            await asyncio.sleep(0)
+            entries, cursor = await store.page("s1")
+            assert contents(entries) == ["question", "answer"]
+            assert [entry["id"] for entry in entries] == [None, None]
+            assert entries[1]["status"] == "complete"
+            assert cursor is None
+        finally:
+            await store.stop()
+
+    asyncio.run(main())
+
+def test_entries_are_written_in_batches(tmp_path):
+    async def main():
+        path = tmp_path / "transcripts.db"
+        store = TranscriptStore(path, batch_size=4, flush_interval=0.05)
+        await store.start()
+        batches = []
+        write = store._write
+
+        def record_write(batch):
+            batches.append(len(batch))
+            write(batch)
+
+        store._write = record_write
+        try:
+            for i in range(10):
+                store.append("s1", None, ROLE_USER, f"m{i}")
+            await store.flush()
+            # Full batches go out at once, the rest after the flush interval
+            assert batches == [4, 4, 2]
+            assert count_rows(path) == 10
+            assert store.committed == store.appended == 10
+
+            store.append("s1", None, ROLE_USER, "late")
+            await asyncio.sleep(0.01)
+            assert batches == [4, 4, 2]  # Waiting for more entries to join
+            await store.flush()
+            assert batches == [4, 4, 2, 1]
+        finally:
+            await store.stop()
+
+    asyncio.run(main())
+
+def test_entries_beyond_max_pending_are_dropped(tmp_path):
+    async def main():
+        path = tmp_path / "transcripts.db"
+        store = TranscriptStore(path, flush_interval=0.2, max_pending=3)
+        await store.start()
+        try:
+            for i in range(5):
+                store.append("s1", None, ROLE_USER, f"m{i}")
+            assert len(store.pending) == 3 and store.dropped == 2
+            await store.flush()
+            entries, _ = await store.page("s1")
+            assert contents(entries) == ["m0", "m1", "m2"]
+        finally:
+            await store.stop()
+
+    asyncio.run(main())
@@ -0,0 +1,130 @@
+import asyncio
+from types import SimpleNamespace
+from fakes import FakeWebSocket, drain
+from webapp.validation import KeyValidator
+from webapp.ws import handlers
+from webapp.ws.connection import manager
+from webapp.ws.protocol import ConfigFrame, Frame
+
+class FakeCheck:
+    """Counts provider checks; keys starting with "good" are valid."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self, provider: str, api_key: str):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if api_key.startswith("good"):
+            return True, ""
+        return False, "invalid key"
+
+def test_concurrent_validations_share_one_check():
+    async def main():
+        check = FakeCheck(delay=0.01)
+        validator = KeyValidator(check=check)
+        results = await asyncio.gather(*(validator.validate("gemini", "good-key") for _ in range(20)))
+        assert results == [(True, "")] * 20
+        assert check.calls == 1
+        assert validator.in_flight == {}
+
+    asyncio.run(main())
+
+def test_cancelled_caller_does_not_cancel_the_shared_check():
+    async def main():
+        check = FakeCheck(delay=0.01)
+        validator = KeyValidator(check=check)
+        first = asyncio.create_task(validator.validate("gemini", "good-key"))
+        second = asyncio.create_task(validator.validate("gemini", "good-key"))
+        await asyncio.sleep(0)
+        first.cancel()
+        assert await second == (True, "")
+        assert check.calls == 1
+
+    asyncio.run(main())
+
+def test_results_are_cached_for_their_ttl():
+    async def main():
+        check = FakeCheck()
+        validator = KeyValidator(ttl=0.05, negative_ttl=0.01, check=check)
+        assert await validator.validate("gemini", "good-key") == (True, "")
+        assert await validator.validate("Gemini", "good-key") == (True, "")
+        assert await validator.validate("gemini", "bad-key") == (False, "invalid key")
+        assert await validator.validate("gemini", "bad-key") == (False, "invalid key")
+        assert check.calls == 2
+
+        # The failure expires first
+        await asyncio.sleep(0.02)
+        assert validator.cached("gemini", "good-key") == (True, "")
+        assert validator.cached("gemini", "bad-key") is None
+        await validator.validate("gemini", "bad-key")
+        assert check.calls == 3
+
+        await asyncio.sleep(0.05)
+        assert validator.cached("gemini", "good-key") is None
+        await validator.validate("gemini", "good-key")
+        assert check.calls == 4
+
+    asyncio.run(main())
+
+def test_record_and_invalidate():
+    async def main():
+        check = FakeCheck()
+        validator = KeyValidator(check=check)
+        validator.record("gemini", "bad-key", True)
+        assert await validator.validate("gemini", "bad-key") == (True, "")
+        assert check.calls == 0
+        validator.invalidate("gemini", "bad-key")
+        assert await validator.validate("gemini", "bad-key") == (False, "invalid key")
+        assert check.calls == 1
+
+    asyncio.run(main())
+
+def test_max_entries():
+    validator = KeyValidator(max_entries=3, check=FakeCheck())
+    for i in range(10):
+        validator.record("gemini", f"key{i}", True)
+    assert len(validator.results) == 3
+    assert validator.cached("gemini", "key9") == (True, "")
+
+def test_saving_a_new_key_invalidates_the_old_one(monkeypatch):
+    stored = {"provider": "gemini", "api_key": "good-old"}
+
+    async def snapshot():
+        return dict(stored)
+
+    async def save(config):
+        stored.clear()
+        stored.update(config)
+        return True
+
+    async def delete():
+        stored.clear()
+
+    validator = KeyValidator(check=FakeCheck())
+    monkeypatch.setattr(handlers, "key_validator", validator)
+    monkeypatch.setattr(handlers, "config_service", SimpleNamespace(snapshot=snapshot, save=save, delete=delete))
+
+    async def main():
+        websocket = FakeWebSocket()
+        manager.add_connection(websocket)
+        validator.record("gemini", "good-old", True)
+        validator.record("gemini", "good-new", True)
+
+        frame = ConfigFrame(type="set_config", content={"provider": "gemini", "api_key": "good-new"})
+        await handlers.handle_set_config(websocket, frame)
+        assert validator.cached("gemini", "good-old") is None
+        assert validator.cached("gemini", "good-new") == (True, "")
+
+        # Saving the same key again keeps its result
+        await handlers.handle_set_config(websocket, frame)
+        assert validator.cached("gemini", "good-new") == (True, "")
+
+        await handlers.handle_delete_config(websocket, Frame(type="delete_config"))
+        assert validator.cached("gemini", "good-new") is None
+        await drain()
+        assert [frame["type"] for frame in websocket.sent] == ["config_set", "config_set", "config_deleted"]
+        manager.remove_connection(websocket)
+
+    asyncio.run(main())
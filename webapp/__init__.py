@@ -1,9 +1,36 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
-from pathlib import Path
+from .assets import AssetFiles, STATIC_DIR, asset_manifest
+from .diagnostics import diagnostics
+from .health import readiness, router as health_router
+from .metrics import router as metrics_router
+from .state import state_backend
+from .transcripts import transcript_store
+from .ws.connection import manager
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop process-wide services."""
+    await diagnostics.start()
+    # Import the provider SDK and build agents while the rest starts up
+    readiness.start()
+    await asyncio.to_thread(asset_manifest.ensure_built)
+    await state_backend.start()
+    await transcript_store.start()
+    await manager.start()
+    try:
+        yield
+    finally:
+        await manager.stop()
+        await transcript_store.stop()
+        await state_backend.stop()
+        await diagnostics.stop()
+        await readiness.stop()
+
+app = FastAPI(lifespan=lifespan)
+app.include_router(metrics_router)
+app.include_router(health_router)
 
 # Mount static files
-static_path = Path(__file__).parent.parent / "static"
-app.mount("/static", StaticFiles(directory=str(static_path)), name="static")
+app.mount("/static", AssetFiles(directory=str(STATIC_DIR)), name="static")
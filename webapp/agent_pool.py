@@ -0,0 +1,177 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+from . import settings
+from .provider_sdk import provider_sdk
+
+if TYPE_CHECKING:
+    from joao import AsyncAgent
+
+logger = logging.getLogger(__name__)
+
+PoolKey = Tuple[str, str, str]
+
+def hash_api_key(api_key: str) -> str:
+    """Return a short, non-reversible fingerprint of an API key."""
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+def make_agent(system_prompt: str, api_key: str, provider: str) -> "AsyncAgent":
+    """Build a new provider agent, importing the provider SDK on first use."""
+    return provider_sdk.agent_class()(
+        system_prompt,
+        api_key=api_key,
+        tenant_prefix=provider.upper()
+    )
+
+class PooledAgent:
+    __slots__ = ("agent", "key", "created_at", "last_used", "healthy")
+
+    def __init__(self, agent: "AsyncAgent", key: PoolKey):
+        now = time.monotonic()
+        self.agent = agent
+        self.key = key
+        self.created_at = now
+        self.last_used = now
+        self.healthy = True
+
+class AgentPool:
+    """Keeps long-lived agents around so each turn skips client setup.
+
+    Agents are keyed by (provider, api key hash, system prompt hash). A lease
+    hands out an idle agent for the key, or builds one if none is idle; on
+    release it goes back to the idle list unless it failed or the pool is full.
+    """
+
+    def __init__(
+        self,
+        max_size: int = settings.AGENT_POOL_SIZE,
+        idle_timeout: float = settings.AGENT_POOL_IDLE_TIMEOUT,
+        max_age: float = settings.AGENT_POOL_MAX_AGE,
+        factory: Callable[[str, str, str], "AsyncAgent"] = make_agent
+    ):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.max_age = max_age
+        self.factory = factory
+        # Idle agents per key, least recently used key first
+        self.idle: "OrderedDict[PoolKey, List[PooledAgent]]" = OrderedDict()
+        self.leased = 0
+        self.created = 0
+        self.reused = 0
+
+    @staticmethod
+    def make_key(provider: str, api_key: str, system_prompt: str) -> PoolKey:
+        """Build the pool key for a provider configuration."""
+        prompt_hash = hashlib.sha256(system_prompt.encode()).hexdigest()[:16]
+        return (provider.lower(), hash_api_key(api_key), prompt_hash)
+
+    @property
+    def idle_count(self) -> int:
+        return sum(len(entries) for entries in self.idle.values())
+
+    def is_healthy(self, entry: PooledAgent, now: Optional[float] = None) -> bool:
+        """Check whether a pooled agent can still be handed out."""
+        now = time.monotonic() if now is None else now
+        if not entry.healthy:
+            return False
+        if self.max_age and now - entry.created_at > self.max_age:
+            return False
+        if self.idle_timeout and now - entry.last_used > self.idle_timeout:
+            return False
+        return True
+
+    def evict_idle(self) -> int:
+        """Drop idle agents that are stale or unhealthy. Returns how many were dropped."""
+        now = time.monotonic()
+        evicted = 0
+        for key in list(self.idle):
+            entries = self.idle[key]
+            alive = [entry for entry in entries if self.is_healthy(entry, now)]
+            evicted += len(entries) - len(alive)
+            if alive:
+                self.idle[key] = alive
+            else:
+                del self.idle[key]
+        if evicted:
+            logger.debug(f"Evicted {evicted} idle agents from pool")
+        return evicted
+
+    def acquire(self, provider: str, api_key: str, system_prompt: str) -> PooledAgent:
+        """Take an idle agent for the key, or build a new one."""
+        self.evict_idle()
+        key = self.make_key(provider, api_key, system_prompt)
+        entries = self.idle.get(key)
+        if entries:
+            entry = entries.pop()
+            if not entries:
+                del self.idle[key]
+            self.reused += 1
+        else:
+            entry = PooledAgent(self.factory(system_prompt, api_key, provider), key)
+            self.created += 1
+        self.leased += 1
+        return entry
+
+    def release(self, entry: PooledAgent, healthy: bool = True):
+        """Return a leased agent to the pool."""
+        self.leased -= 1
+        entry.healthy = entry.healthy and healthy
+        entry.last_used = time.monotonic()
+        if not self.is_healthy(entry, entry.last_used):
+            return
+        self.idle.setdefault(entry.key, []).append(entry)
+        self.idle.move_to_end(entry.key)
+        # Enforce the size cap, dropping from the least recently used keys
+        while self.idle_count > self.max_size:
+            oldest_key = next(iter(self.idle))
+            entries = self.idle[oldest_key]
+            entries.pop(0)
+            if not entries:
+                del self.idle[oldest_key]
+
+    @asynccontextmanager
+    async def lease(self, provider: str, api_key: str, system_prompt: str):
+        """Lease an agent for the duration of a request.
+
+        If the body raises, the agent is considered unhealthy and discarded.
+        """
+        entry = self.acquire(provider, api_key, system_prompt)
+        healthy = False
+        try:
+            yield entry.agent
+            healthy = True
+        finally:
+            self.release(entry, healthy)
+
+    async def prewarm(self, provider: str, api_key: str, system_prompt: str):
+        """Build an idle agent for a key ahead of its first request.
+
+        The agent is built in a worker thread, so a first-time SDK import
+        does not block the event loop.
+        """
+        key = self.make_key(provider, api_key, system_prompt)
+        if self.idle.get(key):
+            return
+        agent = await asyncio.to_thread(self.factory, system_prompt, api_key, provider)
+        self.created += 1
+        self.leased += 1
+        self.release(PooledAgent(agent, key))
+
+    def clear(self):
+        """Drop every idle agent."""
+        self.idle.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "idle": self.idle_count,
+            "leased": self.leased,
+            "created": self.created,
+            "reused": self.reused
+        }
+
+# Global agent pool instance
+agent_pool = AgentPool()
@@ -0,0 +1,217 @@
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import posixpath
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import Scope
+from . import settings
+from .bundler import BundleError, bundle_modules, minify_css, minify_js
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+"""
+Static asset pipeline.
+
+The ES modules under static/js are bundled into one minified script and the
+stylesheets are minified; every output gets a content hash in its file name
+and gzip/brotli siblings in static/dist. Fingerprinted files never change, so
+they are served with immutable cache headers; templates look up the current
+names through the manifest.
+"""
+
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = Path(__file__).parent.parent / "static"
+DIST = "dist"
+MANIFEST_NAME = "manifest.json"
+STATIC_URL = "/static"
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# Pre-compressed variants, in order of preference
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+Builder = Callable[[Path], Tuple[str, List[Path]]]
+
+def build_script(path: Path) -> Tuple[str, List[Path]]:
+    script, sources = bundle_modules(path.parent, path.name)
+    return minify_js(script), sources
+
+def build_stylesheet(path: Path) -> Tuple[str, List[Path]]:
+    return minify_css(path.read_text(encoding="utf-8")), [path]
+
+# Built assets, keyed by their path under static/
+ENTRY_POINTS: Dict[str, Builder] = {
+    "js/index.js": build_script,
+    "css/styles.css": build_stylesheet,
+    "css/ai_config.css": build_stylesheet,
+}
+
+def fingerprint(name: str, data: bytes) -> str:
+    """styles.css -> styles.<hash>.css"""
+    stem, suffix = posixpath.splitext(posixpath.basename(name))
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{suffix}"
+
+def compress(data: bytes) -> Dict[str, bytes]:
+    variants = {".gz": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants[".br"] = brotli.compress(data, quality=11)
+    return variants
+
+def accepted_encodings(header: str) -> Set[str]:
+    encodings = set()
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        encodings.add(name.strip().lower())
+    return encodings
+
+class AssetManifest:
+    """Builds the fingerprinted assets and maps source paths to their URLs."""
+
+    def __init__(self, static_dir: Path = STATIC_DIR, enabled: bool = settings.ASSET_BUNDLE):
+        self.static_dir = Path(static_dir)
+        self.dist_dir = self.static_dir / DIST
+        self.path = self.dist_dir / MANIFEST_NAME
+        self.enabled = enabled
+        self.files: Dict[str, str] = {}
+        self.sources: Dict[str, int] = {}
+
+    def load(self) -> bool:
+        """Read the manifest from disk; returns False if there is none."""
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return False
+        self.files = data.get("files", {})
+        self.sources = data.get("sources", {})
+        return True
+
+    def is_stale(self) -> bool:
+        """Whether any source file changed since the manifest was built."""
+        if set(self.files) != set(ENTRY_POINTS) or not self.sources:
+            return True
+        for name, mtime in self.sources.items():
+            try:
+                if (self.static_dir / name).stat().st_mtime_ns != mtime:
+                    return True
+            except OSError:
+                return True
+        return any(not (self.static_dir / path).is_file() for path in self.files.values())
+
+    def _write(self, name: str, data: bytes):
+        path = self.dist_dir / name
+        if path.exists():
+            return  # Same name, same content
+        tmp = path.with_name(f".{name}.{os.getpid()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+    def build(self) -> Dict[str, str]:
+        """Build every entry point and write a new manifest."""
+        self.dist_dir.mkdir(parents=True, exist_ok=True)
+        previous = set(self.files.values())
+        files: Dict[str, str] = {}
+        sources: Dict[str, int] = {}
+        for name, builder in ENTRY_POINTS.items():
+            content, inputs = builder(self.static_dir / name)
+            data = content.encode("utf-8")
+            filename = fingerprint(name, data)
+            self._write(filename, data)
+            for suffix, variant in compress(data).items():
+                self._write(filename + suffix, variant)
+            files[name] = f"{DIST}/{filename}"
+            for source in inputs:
+                sources[source.relative_to(self.static_dir).as_posix()] = source.stat().st_mtime_ns
+
+        manifest = json.dumps({"files": files, "sources": sources}, indent=2).encode("utf-8")
+        tmp = self.path.with_name(f".{MANIFEST_NAME}.{os.getpid()}.tmp")
+        tmp.write_bytes(manifest)
+        os.replace(tmp, self.path)
+        self.files, self.sources = files, sources
+        # Keep the previous build for pages rendered before this one
+        self._prune(set(files.values()) | previous)
+        logger.info(f"Built static assets: {', '.join(files.values())}")
+        return files
+
+    def _prune(self, keep: Set[str]):
+        keep_names = {posixpath.basename(path) for path in keep}
+        for path in self.dist_dir.iterdir():
+            name = path.name
+            for _, suffix in ENCODINGS:
+                name = name[:-len(suffix)] if name.endswith(suffix) else name
+            if name == MANIFEST_NAME or name in keep_names:
+                continue
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    def ensure_built(self):
+        """Load the manifest, rebuilding it if the sources changed."""
+        if not self.enabled:
+            self.files = {}
+            return
+        self.load()
+        if not self.is_stale():
+            return
+        try:
+            self.build()
+        except (BundleError, OSError) as e:
+            # The page still works from the unbundled modules
+            logger.error(f"Static asset build failed, serving source files: {e}")
+            self.files = {}
+
+    def url(self, name: str) -> str:
+        """URL of a static file, fingerprinted when it was built."""
+        return f"{STATIC_URL}/{self.files.get(name, name)}"
+
+class AssetFiles(StaticFiles):
+    """StaticFiles that serves fingerprinted assets pre-compressed and immutable.
+
+    Everything else must be revalidated, so edits to unbundled files show up
+    on the next load.
+    """
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        if not path.startswith(DIST + os.sep) or path.endswith(MANIFEST_NAME):
+            response = await super().get_response(path, scope)
+            response.headers["cache-control"] = REVALIDATE_CACHE_CONTROL
+            return response
+
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        response: Optional[Response] = None
+        for encoding, suffix in ENCODINGS:
+            if encoding in accepted and os.path.isfile(os.path.join(self.directory, path + suffix)):
+                response = await super().get_response(path + suffix, scope)
+                response.headers["content-encoding"] = encoding
+                media_type, _ = mimetypes.guess_type(path)
+                if media_type and response.status_code == 200:
+                    response.headers["content-type"] = f"{media_type}; charset=utf-8" if media_type.startswith("text/") else media_type
+                break
+        if response is None:
+            response = await super().get_response(path, scope)
+        response.headers["cache-control"] = IMMUTABLE_CACHE_CONTROL
+        response.headers["vary"] = "Accept-Encoding"
+        return response
+
+# Global asset manifest instance
+asset_manifest = AssetManifest()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    for source, built in AssetManifest(enabled=True).build().items():
+        print(f"{source} -> {STATIC_URL}/{built}")
@@ -0,0 +1,392 @@
+import json
+import logging
+import posixpath
+import re
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+"""
+A small ES module bundler and minifier for the frontend under static/js.
+
+It understands the module syntax the frontend uses (named imports, side-effect
+imports, `export *`, exported declarations and dynamic `import()` of a local
+module) and fails loudly on anything else, so a bundle is never silently wrong.
+"""
+
+
+logger = logging.getLogger(__name__)
+
+class BundleError(Exception):
+    pass
+
+IDENTIFIER_CHARS = re.compile(r"[\w$]|[^\x00-\x7f]")
+
+# Keywords after which a slash starts a regular expression, not a division
+REGEX_KEYWORDS = {
+    "return", "typeof", "instanceof", "case", "do", "else", "in", "of", "new",
+    "delete", "void", "throw", "yield", "await"
+}
+
+# Keywords whose parenthesised head ends where a statement may start with a regex
+STATEMENT_HEADS = {"if", "while", "for", "with"}
+
+# Code after which a brace opens a block rather than an object literal
+BLOCK_OPENERS = {"", ";", "{", "}", ")", ">", "word", "else", "do", "statement"}
+
+def _is_word(ch: str) -> bool:
+    return bool(ch) and bool(IDENTIFIER_CHARS.match(ch))
+
+def _starts_regex(last: str) -> bool:
+    """Whether a slash after the given significant code starts a regular expression.
+
+    Statement heads and blocks are told apart from parenthesised expressions
+    and object literals by _scan, which passes "statement" after them.
+    """
+    if last in ("literal", "word"):
+        return False
+    return last == "" or last in REGEX_KEYWORDS or last not in (")", "]", "}")
+
+class Token:
+    __slots__ = ("kind", "text")
+
+    def __init__(self, kind: str, text: str):
+        self.kind = kind  # code, space, comment, string, template or regex
+        self.text = text
+
+def _string_end(source: str, i: int) -> int:
+    quote = source[i]
+    i += 1
+    while i < len(source):
+        ch = source[i]
+        if ch == "\\":
+            i += 2
+            continue
+        if ch == quote:
+            return i + 1
+        if ch == "\n":
+            break
+        i += 1
+    raise BundleError(f"Unterminated string at offset {i}")
+
+def _template_end(source: str, i: int) -> int:
+    i += 1
+    while i < len(source):
+        ch = source[i]
+        if ch == "\\":
+            i += 2
+            continue
+        if ch == "`":
+            return i + 1
+        if source.startswith("${", i):
+            _, i = _scan(source, i + 2, in_braces=True)
+            i += 1  # closing brace
+            continue
+        i += 1
+    raise BundleError("Unterminated template literal")
+
+def _regex_end(source: str, i: int) -> int:
+    i += 1
+    in_class = False
+    while i < len(source):
+        ch = source[i]
+        if ch == "\\":
+            i += 2
+            continue
+        if ch == "\n":
+            break
+        if ch == "[":
+            in_class = True
+        elif ch == "]":
+            in_class = False
+        elif ch == "/" and not in_class:
+            i += 1
+            while i < len(source) and _is_word(source[i]):
+                i += 1
+            return i
+        i += 1
+    raise BundleError(f"Unterminated regular expression at offset {i}")
+
+def _scan(source: str, i: int = 0, in_braces: bool = False) -> Tuple[List[Token], int]:
+    """Split JavaScript source into tokens that matter for rewriting and minifying.
+
+    With in_braces, stops at the brace that closes a template `${` expression
+    and returns its offset.
+    """
+    tokens: List[Token] = []
+    depth = 0
+    # Per open parenthesis, whether it holds the head of an if/while/for/with
+    heads: List[bool] = []
+    # Per open brace, whether it is a block
+    blocks: List[bool] = []
+    # The last significant code: "" (start), a punctuator, a keyword, or a word / literal
+    last = ""
+    start = i
+    while i < len(source):
+        ch = source[i]
+        if ch in " \t\r\n":
+            end = i
+            while end < len(source) and source[end] in " \t\r\n":
+                end += 1
+            tokens.append(Token("space", source[i:end]))
+            i = end
+            continue
+        if ch in "'\"":
+            end = _string_end(source, i)
+            tokens.append(Token("string", source[i:end]))
+            last = "literal"
+        elif ch == "`":
+            end = _template_end(source, i)
+            tokens.append(Token("template", source[i:end]))
+            last = "literal"
+        elif source.startswith("//", i):
+            end = source.find("\n", i)
+            end = len(source) if end == -1 else end
+            tokens.append(Token("comment", source[i:end]))
+        elif source.startswith("/*", i):
+            end = source.find("*/", i + 2)
+            if end == -1:
+                raise BundleError("Unterminated comment")
+            end += 2
+            tokens.append(Token("comment", source[i:end]))
+        elif ch == "/" and _starts_regex(last):
+            end = _regex_end(source, i)
+            tokens.append(Token("regex", source[i:end]))
+            last = "literal"
+        elif _is_word(ch):
+            end = i
+            while end < len(source) and _is_word(source[end]):
+                end += 1
+            word = source[i:end]
+            tokens.append(Token("code", word))
+            last = word if word in REGEX_KEYWORDS or word in STATEMENT_HEADS else "word"
+        else:
+            end = i + 1
+            if ch == "}" and in_braces and depth == 0:
+                return tokens, i
+            tokens.append(Token("code", ch))
+            if ch == "{":
+                depth += 1
+                blocks.append(last in BLOCK_OPENERS)
+                last = ch
+            elif ch == "}":
+                depth -= 1
+                # A statement may follow a block, but `{...} / 2` divides an object
+                last = "statement" if blocks and blocks.pop() else ch
+            elif ch == "(":
+                heads.append(last in STATEMENT_HEADS)
+                last = ch
+            elif ch == ")" and heads and heads.pop():
+                last = "statement"  # `if (...) /re/` starts a statement
+            elif ch in "+-" and last == ch and tokens[-2].text == ch:
+                last = "word"  # `i++ / 2` divides an operand
+            else:
+                last = ch
+        i = end
+    if in_braces:
+        raise BundleError(f"Unterminated template expression starting at offset {start}")
+    return tokens, i
+
+def tokenize(source: str) -> List[Token]:
+    return _scan(source)[0]
+
+def mask(source: str) -> str:
+    """Blank out comments and the contents of literals, keeping offsets intact.
+
+    Module syntax is then matched on the masked text, so an `import` inside a
+    string or comment is never rewritten.
+    """
+    parts = []
+    for token in tokenize(source):
+        if token.kind == "comment":
+            parts.append(re.sub(r"[^\n]", " ", token.text))
+        elif token.kind in ("string", "template", "regex"):
+            parts.append(token.text[0] + re.sub(r"[^\n]", "_", token.text[1:-1]) + token.text[-1])
+        else:
+            parts.append(token.text)
+    return "".join(parts)
+
+# --- minification ---
+
+def _needs_space(before: str, after: str) -> bool:
+    """Whether two characters would fuse into a different token without a space."""
+    if _is_word(before) and _is_word(after):
+        return True
+    if before == after and before in "+-":
+        return True
+    if before.isdigit() and after == ".":
+        return True
+    return before == "/" or after == "/"
+
+def minify_js(source: str) -> str:
+    """Drop comments and redundant whitespace; literals are kept byte for byte.
+
+    Line breaks are kept wherever automatic semicolon insertion could depend
+    on them, so the result parses exactly like the input.
+    """
+    out: List[str] = []
+    pending = ""  # whitespace seen since the last emitted token; comments count as whitespace
+    for token in tokenize(source):
+        if token.kind in ("space", "comment"):
+            pending = "\n" if "\n" in token.text or pending == "\n" else " "
+            continue
+        if pending and out:
+            before = out[-1][-1]
+            after = token.text[0]
+            if pending == "\n" and before not in "{;,([" and after not in "})]":
+                out.append("\n")
+            elif _needs_space(before, after):
+                out.append(" ")
+        pending = ""
+        out.append(token.text)
+    return "".join(out) + "\n"
+
+def minify_css(source: str) -> str:
+    """Drop comments and redundant whitespace from a stylesheet."""
+    parts = re.split(r"""("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')""", source)
+    out = []
+    for index, part in enumerate(parts):
+        if index % 2:
+            out.append(part)  # string literal
+            continue
+        part = re.sub(r"/\*.*?\*/", "", part, flags=re.S)
+        part = re.sub(r"\s+", " ", part)
+        part = re.sub(r"\s*([{};,>])\s*", r"\1", part)
+        part = part.replace(";}", "}")
+        out.append(part)
+    return "".join(out).strip() + "\n"
+
+# --- bundling ---
+
+SPECIFIER = r"""(['"][^'"\n]*['"])"""
+IMPORT_NAMED = re.compile(r"^import\s*\{([^}]*)\}\s*from\s*" + SPECIFIER + r"[ \t]*;?", re.M)
+IMPORT_BARE = re.compile(r"^import\s*" + SPECIFIER + r"[ \t]*;?", re.M)
+EXPORT_ALL = re.compile(r"^export\s*\*\s*from\s*" + SPECIFIER + r"[ \t]*;?", re.M)
+# Imports are destructured from the module's exports, so `export let` and
+# `export var`, whose bindings could change afterwards, are not supported
+EXPORT_DECLARATION = re.compile(r"^export\s+((?:async\s+)?function\*?|class|const)\s+([A-Za-z_$][\w$]*)", re.M)
+IMPORT_DYNAMIC = re.compile(r"\bimport\s*\(\s*" + SPECIFIER + r"\s*\)")
+UNSUPPORTED = re.compile(r"^(?:import|export)\b", re.M)
+
+RUNTIME = """(() => {
+"use strict";
+const definitions = {}, cache = {};
+function require(id) {
+if (id in cache) return cache[id];
+const exports = cache[id] = {};
+definitions[id](exports, require);
+return exports;
+}
+function exportBindings(exports, getters) {
+for (const name in getters) Object.defineProperty(exports, name, { get: getters[name], enumerable: true });
+}
+function exportAll(exports, module) {
+for (const name in module) if (name !== "default" && !(name in exports)) Object.defineProperty(exports, name, { get: () => module[name], enumerable: true });
+}
+"""
+
+class ModuleBundler:
+    """Bundles an entry module and everything it imports into one script.
+
+    Each module becomes a function with its own scope, run once on first
+    require in import order; exports are getters on the module's exports
+    object, read when a module imports them.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.modules: Dict[str, str] = {}
+        self.order: List[str] = []
+        self.sources: List[Path] = []
+
+    def _resolve(self, module_id: str, literal: str) -> str:
+        specifier = literal[1:-1]
+        if not specifier.startswith("."):
+            raise BundleError(f"{module_id}: only relative imports can be bundled, got {specifier!r}")
+        resolved = posixpath.normpath(posixpath.join(posixpath.dirname(module_id), specifier))
+        if resolved.startswith(".."):
+            raise BundleError(f"{module_id}: import {specifier!r} leaves the bundle root")
+        return resolved
+
+    def _line(self, source: str, offset: int) -> int:
+        return source.count("\n", 0, offset) + 1
+
+    def _transform(self, module_id: str, source: str, stack: List[str]) -> str:
+        masked = mask(source)
+        edits: List[Tuple[int, int, str]] = []
+        imports: List[str] = []
+        exports: List[str] = []
+
+        def add_import(literal: str) -> str:
+            dependency = self._resolve(module_id, literal)
+            self._add(dependency, stack)
+            return json.dumps(dependency)
+
+        for match in IMPORT_NAMED.finditer(masked):
+            literal = source[match.start(2):match.end(2)]
+            bindings = []
+            for name in source[match.start(1):match.end(1)].split(","):
+                name = name.strip()
+                if not name:
+                    continue
+                imported, _, local = (part.strip() for part in name.partition(" as "))
+                bindings.append(f"{imported}: {local}" if local else imported)
+            imports.append(f"const {{ {', '.join(bindings)} }} = require({add_import(literal)});")
+            edits.append((match.start(), match.end(), ""))
+        for match in IMPORT_BARE.finditer(masked):
+            imports.append(f"require({add_import(source[match.start(1):match.end(1)])});")
+            edits.append((match.start(), match.end(), ""))
+        for match in EXPORT_ALL.finditer(masked):
+            imports.append(f"exportAll(exports, require({add_import(source[match.start(1):match.end(1)])}));")
+            edits.append((match.start(), match.end(), ""))
+        for match in EXPORT_DECLARATION.finditer(masked):
+            exports.append(match.group(2))
+            edits.append((match.start(), match.start(1), ""))
+        for match in IMPORT_DYNAMIC.finditer(masked):
+            dependency = self._resolve(module_id, source[match.start(1):match.end(1)])
+            # Loaded lazily; it may import this module
+            self._add(dependency, [])
+            edits.append((match.start(), match.end(), f"Promise.resolve().then(() => require({json.dumps(dependency)}))"))
+
+        handled = {start for start, _, _ in edits}
+        for match in UNSUPPORTED.finditer(masked):
+            if match.start() not in handled:
+                raise BundleError(f"{module_id}:{self._line(source, match.start())}: unsupported module syntax")
+
+        body = source
+        for start, end, replacement in sorted(edits, reverse=True):
+            body = body[:start] + replacement + body[end:]
+        getters = ", ".join(f"{name}: () => {name}" for name in exports)
+        header = [f"exportBindings(exports, {{ {getters} }});"] if exports else []
+        return "\n".join(header + imports) + "\n" + body
+
+    def _add(self, module_id: str, stack: List[str]):
+        if module_id in stack:
+            cycle = " -> ".join(stack[stack.index(module_id):] + [module_id])
+            raise BundleError(f"Circular import: {cycle}")
+        if module_id in self.modules:
+            return
+        path = self.root / module_id
+        try:
+            source = path.read_text(encoding="utf-8")
+        except OSError as e:
+            raise BundleError(f"Cannot read module {module_id}: {e}")
+        self.modules[module_id] = ""  # placeholder while dependencies are added
+        self.sources.append(path)
+        self.modules[module_id] = self._transform(module_id, source, stack + [module_id])
+        self.order.append(module_id)
+
+    def bundle(self, entry: str) -> str:
+        self._add(entry, [])
+        parts = [RUNTIME]
+        for module_id in self.order:
+            parts.append(f"definitions[{json.dumps(module_id)}] = function (exports, require) {{\n")
+            parts.append(self.modules[module_id])
+            parts.append("\n};\n")
+        parts.append(f"require({json.dumps(entry)});\n}})();\n")
+        return "".join(parts)
+
+def bundle_modules(root: Path, entry: str) -> Tuple[str, List[Path]]:
+    """Bundle an entry module under root; returns the script and the files it read."""
+    bundler = ModuleBundler(root)
+    script = bundler.bundle(entry)
+    return script, bundler.sources
@@ -1,68 +1,138 @@
+import asyncio
 import json
+import time
 from pathlib import Path
-from typing import Optional, Dict
+from typing import Optional, Dict, Tuple
+from . import settings
 
 # Constants
 CONFIG_FILE = Path.home() / ".simplex" / "config.json"
 
-def load_config() -> Optional[Dict]:
+# System prompt for the chat agent
+SYSTEM_PROMPT = """You are a helpful AI assistant."""
+
+def load_config(path: Path = CONFIG_FILE) -> Optional[Dict]:
     """Load configuration from file."""
     try:
-        if CONFIG_FILE.exists():
-            with open(CONFIG_FILE) as f:
+        if path.exists():
+            with open(path) as f:
                 return json.load(f)
     except Exception as e:
         print(f"Error loading config: {e}")
     return None
 
-def save_config(config: Dict) -> bool:
+def save_config(config: Dict, path: Path = CONFIG_FILE) -> bool:
     """Save configuration to file."""
     try:
-        CONFIG_FILE.parent.mkdir(parents=True, exist_ok=True)
-        with open(CONFIG_FILE, 'w') as f:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w') as f:
             json.dump(config, f)
         return True
     except Exception as e:
         print(f"Error saving config: {e}")
         return False
 
+class ConfigService:
+    """Holds the parsed configuration in memory.
+
+    The file is only re-read when its inode, mtime or size change, and that
+    check runs at most once per check interval, off the event loop. Writes
+    through the service update the cache directly.
+    """
+
+    def __init__(self, path: Path = CONFIG_FILE, check_interval: float = settings.CONFIG_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._config: Optional[Dict] = None
+        self._signature: Optional[Tuple[int, int, int]] = None
+        self._checked_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    def _file_signature(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = self.path.stat()
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def refresh(self) -> Optional[Dict]:
+        """Re-read the file if it changed since the last read (blocking)."""
+        signature = self._file_signature()
+        if signature != self._signature:
+            self._config = load_config(self.path) if signature else None
+            self._signature = signature
+        self._checked_at = time.monotonic()
+        return self._config
+
+    def _is_stale(self) -> bool:
+        return self._checked_at is None or time.monotonic() - self._checked_at >= self.check_interval
+
+    async def snapshot(self) -> Optional[Dict]:
+        """Return a copy of the current configuration, or None if not configured."""
+        if self._is_stale():
+            async with self._lock:
+                if self._is_stale():
+                    await asyncio.to_thread(self.refresh)
+        return dict(self._config) if self._config else None
+
+    def _write(self, config: Dict) -> bool:
+        if not save_config(config, self.path):
+            return False
+        self._config = dict(config)
+        self._signature = self._file_signature()
+        self._checked_at = time.monotonic()
+        return True
+
+    async def save(self, config: Dict) -> bool:
+        """Save the configuration and update the cache."""
+        async with self._lock:
+            return await asyncio.to_thread(self._write, config)
+
+    def _delete(self):
+        self.path.unlink(missing_ok=True)
+        self._config = None
+        self._signature = None
+        self._checked_at = time.monotonic()
+
+    async def delete(self):
+        """Delete the configuration file and clear the cache."""
+        async with self._lock:
+            await asyncio.to_thread(self._delete)
+
+    def invalidate(self):
+        """Force the next snapshot to check the file."""
+        self._checked_at = None
+
+# Configuration keys used by provider routing (see webapp/providers.py)
+ROUTING_KEYS = ("weight", "backends", "routing")
+
+# Display details of known providers; others are shown by name
+PROVIDER_INFO = {
+    "gemini": {"vendor": "Google", "model": "Gemini Flash 2.0"},
+}
+
 def get_provider_info(provider: str, api_key: str) -> Dict:
     """Get provider information."""
-    if provider.lower() == "gemini":
-        return {
-            "vendor": "Google",
-            "model": "Gemini Flash 2.0",
-            "api_key_prefix": api_key[:4] if api_key else ""
-        }
-    return {
-        "vendor": provider.upper(),
-        "model": "AI Assistant",
-        "api_key_prefix": api_key[:4] if api_key else ""
-    }
+    info = PROVIDER_INFO.get(provider.lower(), {"vendor": provider.upper(), "model": "AI Assistant"})
+    return {**info, "api_key_prefix": api_key[:4] if api_key else ""}
 
 async def validate_api_key(provider: str, api_key: str) -> tuple[bool, str]:
     """Validate API key with provider by trying to send a simple test message."""
     try:
-        from joao import AsyncAgent
-        
-        # Create agent with the provided config
-        agent = AsyncAgent(
-            "You are an expert software developer",
-            api_key=api_key,
-            tenant_prefix=provider.upper()
-        )
-        
-        # Try to send a test message with streaming
-        stream = await agent.request("hello", stream=True)
-        response = ""
-        try:
+        from .agent_pool import agent_pool
+
+        # Lease a chat agent for the provided config; a valid key leaves it pooled
+        # for the chat that usually follows
+        async with agent_pool.lease(provider, api_key, SYSTEM_PROMPT) as agent:
+            # Try to send a test message with streaming
+            stream = await agent.request("hello", stream=True)
             async for token in stream:
                 if token:
-                    response = token
                     break  # We just need one valid token
-            return True, ""
-        except Exception as e:
-            return False, str(e)
-            
+        return True, ""
+
     except Exception as e:
         return False, str(e)
+
+# Global configuration service instance
+config_service = ConfigService()
@@ -0,0 +1,207 @@
+import asyncio
+import cProfile
+import logging
+import marshal
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from typing import Deque, Dict, Optional
+from fastapi import APIRouter, HTTPException
+from starlette.responses import Response
+from . import metrics, settings
+
+"""
+Opt-in event loop instrumentation.
+
+A monitor task measures how late the loop wakes up from a short sleep; a
+watchdog thread notices when that wake-up is overdue and logs the loop
+thread's stack while it is still blocked, so the offending callback shows up
+in the log. The /debug endpoints report the lag and capture a profile of the
+running server for offline analysis: folded stacks sampled from the loop
+thread (flamegraph.pl, speedscope) or a cProfile dump (pstats, snakeviz).
+"""
+
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/debug")
+
+PROFILE_STACKS = "stacks"
+PROFILE_CPROFILE = "cprofile"
+
+def format_frame(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+
+def folded_stack(frame) -> str:
+    """A thread's stack as one line of folded frames, outermost first."""
+    frames = []
+    while frame is not None:
+        frames.append(format_frame(frame))
+        frame = frame.f_back
+    return ";".join(reversed(frames))
+
+class LoopMonitor:
+    """Measures event loop lag and reports callbacks that block the loop."""
+
+    def __init__(
+        self,
+        interval: float = settings.LOOP_LAG_INTERVAL,
+        slow_threshold: float = settings.SLOW_CALLBACK_THRESHOLD,
+        history: int = 1024
+    ):
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self.samples: Deque[float] = deque(maxlen=history)
+        self.max_lag = 0.0
+        self.slow_callbacks = 0
+        self.loop_thread_id: Optional[int] = None
+        self._due = 0.0  # When the monitor task should next wake up
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    async def start(self):
+        self.loop_thread_id = threading.get_ident()
+        self._due = time.monotonic() + self.interval
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._run())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info(f"Event loop monitor started (slow callback threshold {self.slow_threshold * 1000:.0f} ms)")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stopped.set()
+        self._task.cancel()
+        self._task = None
+        await asyncio.to_thread(self._watchdog.join)
+        self._watchdog = None
+
+    async def _run(self):
+        while True:
+            self._due = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - self._due)
+            self.samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            metrics.loop_lag.observe(value=lag)
+            if lag >= self.slow_threshold:
+                self.slow_callbacks += 1
+                metrics.slow_callbacks_total.inc()
+                logger.warning(f"Event loop was blocked for {lag * 1000:.0f} ms")
+
+    def _watch(self):
+        reported = None
+        while not self._stopped.wait(self.slow_threshold / 2):
+            due = self._due
+            if due == reported or time.monotonic() - due < self.slow_threshold:
+                continue
+            # Still blocked: show what the loop thread is running right now
+            reported = due
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+            stack = "".join(traceback.format_stack(frame))
+            logger.warning(
+                f"Event loop blocked for over {self.slow_threshold * 1000:.0f} ms, loop thread stack:\n{stack}"
+            )
+
+    def stats(self) -> Dict:
+        samples = sorted(self.samples)
+
+        def percentile(p: float) -> Optional[float]:
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 2)
+
+        return {
+            "running": self._task is not None,
+            "interval_ms": self.interval * 1000,
+            "slow_threshold_ms": self.slow_threshold * 1000,
+            "lag_p50_ms": percentile(0.5),
+            "lag_p99_ms": percentile(0.99),
+            "lag_max_ms": round(self.max_lag * 1000, 2),
+            "slow_callbacks": self.slow_callbacks
+        }
+
+class Diagnostics:
+    """Switches the instrumentation on and runs one profile at a time."""
+
+    def __init__(self, sample_interval: float = settings.PROFILE_SAMPLE_INTERVAL, max_seconds: float = settings.PROFILE_MAX_SECONDS):
+        self.enabled = False
+        self.monitor = LoopMonitor()
+        self.sample_interval = sample_interval
+        self.max_seconds = max_seconds
+        self.profile_lock = asyncio.Lock()
+
+    def configure(self, config: Optional[Dict]) -> bool:
+        """Enable from SIMPLEX_DIAGNOSTICS or a "diagnostics": true config entry."""
+        self.enabled = settings.DIAGNOSTICS or bool((config or {}).get("diagnostics"))
+        return self.enabled
+
+    async def start(self):
+        if self.enabled:
+            await self.monitor.start()
+
+    async def stop(self):
+        await self.monitor.stop()
+
+    def sample_stacks(self, seconds: float, thread_id: int) -> str:
+        """Sample a thread's stack for a while (blocking); returns folded stacks with counts."""
+        counts: Counter = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(thread_id)
+            if frame is not None:
+                counts[folded_stack(frame)] += 1
+            del frame
+            time.sleep(self.sample_interval)
+        return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+    async def profile(self, seconds: float, mode: str) -> bytes:
+        seconds = max(0.1, min(seconds, self.max_seconds))
+        logger.info(f"Profiling the event loop for {seconds}s ({mode})")
+        if mode == PROFILE_CPROFILE:
+            # Everything the loop runs while this coroutine sleeps is on this thread
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profiler.disable()
+            profiler.create_stats()
+            return marshal.dumps(profiler.stats)
+        stacks = await asyncio.to_thread(self.sample_stacks, seconds, threading.get_ident())
+        return stacks.encode("utf-8")
+
+# Global diagnostics instance
+diagnostics = Diagnostics()
+
+@router.get("/loop")
+async def get_loop_stats():
+    """Event loop lag and slow callback counts."""
+    return diagnostics.monitor.stats()
+
+@router.get("/profile")
+async def get_profile(seconds: float = 10.0, mode: str = PROFILE_STACKS):
+    """Profile the running server for a number of seconds.
+
+    mode=stacks returns folded stacks sampled from the loop thread;
+    mode=cprofile returns a cProfile dump readable with pstats.
+    """
+    if mode not in (PROFILE_STACKS, PROFILE_CPROFILE):
+        raise HTTPException(status_code=400, detail=f"Unknown profile mode: {mode}")
+    if diagnostics.profile_lock.locked():
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    async with diagnostics.profile_lock:
+        data = await diagnostics.profile(seconds, mode)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    if mode == PROFILE_CPROFILE:
+        filename, media_type = f"simplex-{stamp}.prof", "application/octet-stream"
+    else:
+        filename, media_type = f"simplex-{stamp}.folded", "text/plain"
+    return Response(data, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
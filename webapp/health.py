@@ -0,0 +1,75 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from . import settings
+from .agent_pool import agent_pool, make_agent
+from .config import config_service, SYSTEM_PROMPT
+from .provider_sdk import provider_sdk
+from .providers import backend_configs
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+class Readiness:
+    """Warms a new worker up in the background and reports when it can take traffic.
+
+    The prewarm imports the provider SDK and builds a pooled agent for every
+    configured backend, so the first requests do not pay for either.
+    """
+
+    def __init__(self, prewarm: bool = settings.PREWARM):
+        self.prewarm_enabled = prewarm
+        self.created_at = time.monotonic()
+        self.ready_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_at is not None and provider_sdk.error is None
+
+    def start(self):
+        if not self.prewarm_enabled:
+            self.ready_at = time.monotonic()
+            return
+        self._task = asyncio.create_task(self.prewarm())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def prewarm(self):
+        # A replaced factory (e.g. the benchmark's fake provider) doesn't need the SDK
+        if agent_pool.factory is not make_agent or await provider_sdk.prewarm():
+            config = await config_service.snapshot()
+            for provider, api_key, _ in backend_configs(config or {}):
+                try:
+                    await agent_pool.prewarm(provider, api_key, SYSTEM_PROMPT)
+                except Exception as e:
+                    logger.warning(f"Could not prewarm a {provider} agent: {e}")
+        self.ready_at = time.monotonic()
+        logger.info(f"Worker ready {(self.ready_at - self.created_at) * 1000:.0f} ms after import")
+
+    def status(self) -> dict:
+        if provider_sdk.error is not None:
+            status = "unavailable"
+        else:
+            status = "ready" if self.ready else "starting"
+        return {
+            "status": status,
+            "ready_ms": round((self.ready_at - self.created_at) * 1000, 1) if self.ready_at is not None else None,
+            "sdk": provider_sdk.stats(),
+            "agent_pool": agent_pool.stats()
+        }
+
+# Global readiness tracker
+readiness = Readiness()
+
+@router.get("/healthz")
+async def get_health():
+    """Readiness probe: 200 once the worker is warmed up, 503 until then or if the SDK is missing."""
+    return JSONResponse(readiness.status(), status_code=200 if readiness.ready else 503)
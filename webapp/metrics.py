@@ -0,0 +1,172 @@
+import bisect
+from typing import Dict, List, Sequence, Tuple
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+"""
+Minimal metrics registry rendered in the Prometheus text exposition format.
+"""
+
+
+router = APIRouter()
+
+LabelValues = Tuple[str, ...]
+
+# Latency buckets, in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+def escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Sequence[str]) -> LabelValues:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(str(label) for label in labels)
+
+    def header(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}"
+        ]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def get(self, *labels: str) -> float:
+        return self.values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for key, value in self.values.items():
+            lines.append(f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}")
+        return lines
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels: str, value: float):
+        self.values[self._key(labels)] = value
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., +Inf count], sum
+        self.values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, *labels: str, value: float):
+        key = self._key(labels)
+        if key not in self.values:
+            self.values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        counts, total = self.values[key]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for key, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {format_value(total[0])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+# Global metrics registry
+registry = Registry()
+
+connections = registry.register(Gauge(
+    "simplex_ws_connections", "Open WebSocket connections"))
+streams_in_flight = registry.register(Gauge(
+    "simplex_streams_in_flight", "Chat streams currently being generated"))
+streams_total = registry.register(Counter(
+    "simplex_streams_total", "Finished chat streams", ("provider", "status")))
+stream_ttft = registry.register(Histogram(
+    "simplex_stream_ttft_seconds", "Time from provider request to first token", ("provider",)))
+stream_duration = registry.register(Histogram(
+    "simplex_stream_duration_seconds", "Total chat stream duration", ("provider",)))
+provider_attempts_total = registry.register(Counter(
+    "simplex_provider_attempts_total", "Requests started on provider backends, by outcome", ("backend", "outcome")))
+provider_ttft = registry.register(Histogram(
+    "simplex_provider_ttft_seconds", "Time from a backend request to its first token", ("backend",)))
+provider_hedges_total = registry.register(Counter(
+    "simplex_provider_hedges_total", "Requests that started a second backend because the first was slow"))
+swept_total = registry.register(Counter(
+    "simplex_swept_total", "Leaked connection, task and stream entries removed by the sweeper", ("kind",)))
+cancellations_total = registry.register(Counter(
+    "simplex_stream_cancellations_total", "Stream cancellation requests"))
+cancel_release = registry.register(Histogram(
+    "simplex_stream_cancel_release_seconds", "Time from a cancel request to the upstream stream being released",
+    ("provider",), buckets=FAST_BUCKETS))
+errors_total = registry.register(Counter(
+    "simplex_errors_total", "Error frames sent to clients", ("error_type",)))
+send_queue_depth = registry.register(Gauge(
+    "simplex_ws_send_queue_depth", "Frames waiting to be written to WebSocket clients"))
+sent_bytes_total = registry.register(Counter(
+    "simplex_ws_sent_bytes_total", "Encoded frame bytes (characters for text frames) written to WebSocket clients", ("codec",)))
+loop_lag = registry.register(Histogram(
+    "simplex_event_loop_lag_seconds", "How late the event loop woke up from a timer (with diagnostics enabled)",
+    buckets=FAST_BUCKETS))
+slow_callbacks_total = registry.register(Counter(
+    "simplex_event_loop_slow_callbacks_total", "Times the event loop was blocked for longer than the slow callback threshold"))
+cache_hits_total = registry.register(Counter(
+    "simplex_response_cache_hits_total", "Responses served from the response cache"))
+cache_misses_total = registry.register(Counter(
+    "simplex_response_cache_misses_total", "Response cache lookups that went to the provider"))
+cache_bytes_saved_total = registry.register(Counter(
+    "simplex_response_cache_bytes_saved_total", "Response bytes served from the response cache"))
+
+@router.get("/metrics")
+async def get_metrics():
+    """Expose metrics for scraping."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,90 @@
+import gzip
+import hashlib
+import logging
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+from fastapi import Request
+from fastapi.templating import Jinja2Templates
+from starlette.responses import Response
+from . import settings
+from .assets import AssetManifest, accepted_encodings
+
+logger = logging.getLogger(__name__)
+
+Signature = Tuple[Optional[Tuple[int, int, int]], ...]
+
+def file_signature(path: Path) -> Optional[Tuple[int, int, int]]:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+def etag_matches(header: str, etag: str) -> bool:
+    """Whether an If-None-Match header matches an ETag (weak comparison)."""
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+class CachedPage:
+    """A template without per-request content, rendered once and served from memory.
+
+    The page is re-rendered only when the template file or the asset manifest
+    changes; those files are checked at most once per check interval. Clients
+    revalidate with If-None-Match and get a 304 while the page is unchanged.
+    """
+
+    def __init__(
+        self,
+        templates: Jinja2Templates,
+        name: str,
+        directory: Path,
+        manifest: AssetManifest,
+        check_interval: float = settings.PAGE_CHECK_INTERVAL
+    ):
+        self.templates = templates
+        self.name = name
+        self.path = Path(directory) / name
+        self.manifest = manifest
+        self.check_interval = check_interval
+        self.body = b""
+        self.gzipped = b""
+        self.etag = ""
+        self._signature: Optional[Signature] = None
+        self._checked_at: Optional[float] = None
+
+    def _current_signature(self) -> Signature:
+        return (file_signature(self.path), file_signature(self.manifest.path))
+
+    def refresh(self):
+        """Re-render the page if its template or the asset manifest changed."""
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        signature = self._current_signature()
+        if signature == self._signature:
+            return
+        if self.manifest.enabled and (self._signature is None or signature[1] != self._signature[1]):
+            # Another worker or a deploy step may have rebuilt the assets
+            self.manifest.load()
+        self.body = self.templates.get_template(self.name).render().encode("utf-8")
+        self.gzipped = gzip.compress(self.body, compresslevel=9, mtime=0)
+        self.etag = f'"{hashlib.sha256(self.body).hexdigest()[:16]}"'
+        self._signature = signature
+        logger.info(f"Rendered {self.name} ({len(self.body)} bytes, ETag {self.etag})")
+
+    def response(self, request: Request) -> Response:
+        self.refresh()
+        headers = {
+            "ETag": self.etag,
+            "Cache-Control": "no-cache",
+            "Vary": "Accept-Encoding"
+        }
+        if etag_matches(request.headers.get("if-none-match", ""), self.etag):
+            return Response(status_code=304, headers=headers)
+        body = self.body
+        if "gzip" in accepted_encodings(request.headers.get("accept-encoding", "")):
+            body = self.gzipped
+            headers["Content-Encoding"] = "gzip"
+        return Response(body, media_type="text/html", headers=headers)
@@ -0,0 +1,76 @@
+import asyncio
+import importlib
+import logging
+import threading
+import time
+from types import ModuleType
+from typing import Dict, Optional
+
+"""
+Deferred import of the provider SDK.
+
+Importing joao pulls in the whole provider client stack, which dominates a
+worker's start-up time. Nothing imports it at module level: it is loaded on
+first use, or ahead of that by the lifespan prewarm in a worker thread, so
+the server starts accepting connections without waiting for it.
+"""
+
+
+logger = logging.getLogger(__name__)
+
+SDK_MODULE = "joao"
+
+class ProviderSDK:
+    """Loads the provider SDK module once, from whichever thread needs it first."""
+
+    def __init__(self, module_name: str = SDK_MODULE):
+        self.module_name = module_name
+        self.load_seconds: Optional[float] = None
+        self.error: Optional[str] = None
+        self._module: Optional[ModuleType] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def load(self) -> ModuleType:
+        """Import the SDK (blocking); raises ImportError if it is not installed."""
+        if self._module is not None:
+            return self._module
+        with self._lock:
+            if self._module is None:
+                started = time.perf_counter()
+                try:
+                    self._module = importlib.import_module(self.module_name)
+                except ImportError as e:
+                    self.error = str(e)
+                    raise
+                self.error = None
+                self.load_seconds = time.perf_counter() - started
+                logger.info(f"Loaded provider SDK {self.module_name} in {self.load_seconds * 1000:.0f} ms")
+        return self._module
+
+    def agent_class(self) -> type:
+        """The SDK's AsyncAgent class, importing the SDK if needed."""
+        return self.load().AsyncAgent
+
+    async def prewarm(self) -> bool:
+        """Import the SDK in a worker thread. Returns False if it is not available."""
+        try:
+            await asyncio.to_thread(self.load)
+        except ImportError as e:
+            logger.error(f"Provider SDK {self.module_name} is not available: {e}")
+            return False
+        return True
+
+    def stats(self) -> Dict:
+        return {
+            "module": self.module_name,
+            "loaded": self.loaded,
+            "load_ms": round(self.load_seconds * 1000, 1) if self.load_seconds is not None else None,
+            "error": self.error
+        }
+
+# Global provider SDK loader
+provider_sdk = ProviderSDK()
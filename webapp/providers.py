@@ -0,0 +1,313 @@
+import asyncio
+import logging
+import random
+import time
+from contextlib import aclosing
+from typing import Callable, Dict, List, Optional, Tuple
+from . import metrics, settings
+from .agent_pool import AgentPool, PooledAgent, agent_pool, hash_api_key
+
+"""
+Provider routing.
+
+Besides its primary provider/api_key pair, the configuration may list more
+backends and a routing section:
+
+    {
+        "provider": "gemini", "api_key": "...", "weight": 3,
+        "backends": [{"provider": "openai", "api_key": "...", "weight": 1}],
+        "routing": {"policy": "ttft", "hedge_delay": 0.5}
+    }
+
+Every request is planned over the configured backends by the routing policy;
+a backend that fails before its first token is skipped in favour of the next
+one, and is tried last for a cooldown period afterwards. With a hedge delay,
+a second backend is started when the first has not produced a token in time,
+and whichever answers first is kept while the other is cancelled.
+"""
+
+
+logger = logging.getLogger(__name__)
+
+POLICY_FAILOVER = "failover"  # Configuration order
+POLICY_TTFT = "ttft"  # Lowest observed time to first token first
+POLICY_WEIGHTED = "weighted"  # Random split by weight
+POLICIES = (POLICY_FAILOVER, POLICY_TTFT, POLICY_WEIGHTED)
+
+# Weight of the newest sample in a backend's time-to-first-token average
+TTFT_SMOOTHING = 0.2
+
+# Marks an attempt whose stream ended before its first token
+END = object()
+
+class Backend:
+    """One configured provider and api key, with its observed latency and errors."""
+    __slots__ = ("name", "provider", "api_key", "weight", "ttft", "requests", "errors", "consecutive_errors", "cooldown_until")
+
+    def __init__(self, provider: str, api_key: str, weight: float = 1.0):
+        self.name = f"{provider.lower()}:{hash_api_key(api_key)[:8]}"
+        self.provider = provider
+        self.api_key = api_key
+        self.weight = weight
+        self.ttft: Optional[float] = None  # Moving average, in seconds
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.cooldown_until = 0.0
+
+    def available(self, now: float) -> bool:
+        return now >= self.cooldown_until
+
+    def record_first_token(self, ttft: float):
+        self.requests += 1
+        self.consecutive_errors = 0
+        self.cooldown_until = 0.0
+        self.ttft = ttft if self.ttft is None else self.ttft + TTFT_SMOOTHING * (ttft - self.ttft)
+        metrics.provider_ttft.observe(self.name, value=ttft)
+
+    def record_error(self, cooldown: float):
+        self.requests += 1
+        self.errors += 1
+        self.consecutive_errors += 1
+        # Back off exponentially while the backend keeps failing
+        self.cooldown_until = time.monotonic() + cooldown * 2 ** min(self.consecutive_errors - 1, 5)
+
+class Attempt:
+    """A request to one backend on a leased agent, up to and after its first token."""
+    __slots__ = ("backend", "pool", "entry", "stream", "iterator", "started_at")
+
+    def __init__(self, backend: Backend, pool: AgentPool, system_prompt: str):
+        self.backend = backend
+        self.pool = pool
+        self.entry: Optional[PooledAgent] = pool.acquire(backend.provider, backend.api_key, system_prompt)
+        self.stream = None
+        self.iterator = None
+        self.started_at = time.monotonic()
+
+    async def first(self, prompt: str):
+        """Send the request and wait for the first token, or END."""
+        self.stream = await self.entry.agent.request(prompt, stream=True)
+        self.iterator = self.stream.__aiter__()
+        try:
+            return await self.iterator.__anext__()
+        except StopAsyncIteration:
+            return END
+
+    async def close(self, healthy: bool):
+        """Close the upstream stream and return the agent to the pool."""
+        if self.entry is None:
+            return
+        entry, self.entry = self.entry, None
+        aclose = getattr(self.stream, "aclose", None)
+        if aclose is not None:
+            try:
+                await aclose()
+            except Exception as e:
+                logger.debug(f"Error closing {self.backend.name} stream: {e}")
+        self.pool.release(entry, healthy)
+
+class RoutedStream:
+    """The token stream of the backend that won the race to the first token."""
+
+    def __init__(self, router: "ProviderRouter", attempt: Attempt, first):
+        self.router = router
+        self.attempt = attempt
+        self.backend = attempt.backend
+        self._first = first
+        self._failed = False
+
+    def __aiter__(self) -> "RoutedStream":
+        return self
+
+    async def __anext__(self) -> str:
+        if self._first is not None:
+            token, self._first = self._first, None
+            if token is not END:
+                return token
+            raise StopAsyncIteration
+        try:
+            return await self.attempt.iterator.__anext__()
+        except StopAsyncIteration:
+            raise
+        except Exception:
+            # Too late to fail over without repeating text the client already has
+            self._failed = True
+            self.router.record_error(self.backend, "stream_error")
+            raise
+
+    async def aclose(self):
+        await self.attempt.close(healthy=not self._failed)
+
+BackendConfig = Tuple[str, str, float]
+
+def backend_configs(config: Dict) -> List[BackendConfig]:
+    """(provider, api_key, weight) of the primary backend and any extra ones."""
+    entries = [config] + [entry for entry in config.get("backends", []) if isinstance(entry, dict)]
+    backends = []
+    for entry in entries:
+        if entry.get("provider") and entry.get("api_key"):
+            try:
+                weight = max(float(entry.get("weight", 1.0)), 0.0)
+            except (TypeError, ValueError):
+                weight = 1.0
+            backends.append((entry["provider"], entry["api_key"], weight))
+    return backends
+
+class ProviderRouter:
+    """Picks the backend for each request, failing over and hedging between them.
+
+    Backends are kept by (provider, api key hash) so their statistics survive
+    configuration reloads.
+    """
+
+    def __init__(
+        self,
+        pool: AgentPool = agent_pool,
+        policy: str = settings.ROUTING_POLICY,
+        hedge_delay: float = settings.ROUTING_HEDGE_DELAY,
+        error_cooldown: float = settings.ROUTING_ERROR_COOLDOWN
+    ):
+        self.pool = pool
+        self.policy = policy if policy in POLICIES else POLICY_FAILOVER
+        self.hedge_delay = hedge_delay
+        self.error_cooldown = error_cooldown
+        self.backends: Dict[str, Backend] = {}
+
+    def resolve(self, config: Dict) -> List[Backend]:
+        """The configured backends, in configuration order."""
+        resolved = []
+        for provider, api_key, weight in backend_configs(config):
+            backend = Backend(provider, api_key, weight)
+            backend = self.backends.setdefault(backend.name, backend)
+            backend.weight = weight
+            if backend not in resolved:
+                resolved.append(backend)
+        return resolved
+
+    def routing(self, config: Dict) -> Tuple[str, float]:
+        """(policy, hedge delay) for a configuration, falling back to the settings."""
+        routing = config.get("routing")
+        if not isinstance(routing, dict):
+            return self.policy, self.hedge_delay
+        policy = routing.get("policy", self.policy)
+        try:
+            hedge_delay = float(routing.get("hedge_delay", self.hedge_delay))
+        except (TypeError, ValueError):
+            hedge_delay = self.hedge_delay
+        return (policy if policy in POLICIES else self.policy), hedge_delay
+
+    def plan(self, backends: List[Backend], policy: str) -> List[Backend]:
+        """Order backends for one request; backends cooling down after errors go last."""
+        now = time.monotonic()
+        ready = [backend for backend in backends if backend.available(now)]
+        cooling = sorted((backend for backend in backends if not backend.available(now)), key=lambda backend: backend.cooldown_until)
+        if policy == POLICY_TTFT:
+            # Unmeasured backends first, so every backend gets a latency sample
+            ready.sort(key=lambda backend: (backend.ttft is not None, backend.ttft or 0.0))
+        elif policy == POLICY_WEIGHTED and len(ready) > 1:
+            weights = [backend.weight for backend in ready]
+            if any(weights):
+                chosen = random.choices(ready, weights=weights)[0]
+                ready.remove(chosen)
+                ready.insert(0, chosen)
+        return ready + cooling
+
+    def record_error(self, backend: Backend, outcome: str):
+        backend.record_error(self.error_cooldown)
+        metrics.provider_attempts_total.inc(backend.name, outcome)
+
+    async def open_stream(
+        self,
+        config: Dict,
+        system_prompt: str,
+        prompt: str,
+        on_selected: Optional[Callable[[Backend], None]] = None
+    ) -> RoutedStream:
+        """Start the request and return the stream of the first backend to produce a token.
+
+        Raises the last backend's error when every backend failed.
+        """
+        policy, hedge_delay = self.routing(config)
+        candidates = self.plan(self.resolve(config), policy)
+        if not candidates:
+            raise ValueError("No provider backend configured")
+        attempts: Dict[asyncio.Task, Attempt] = {}
+        hedged = False
+        last_error: Optional[BaseException] = None
+
+        def launch():
+            attempt = Attempt(candidates.pop(0), self.pool, system_prompt)
+            attempts[asyncio.ensure_future(attempt.first(prompt))] = attempt
+
+        launch()
+        try:
+            while True:
+                hedge = hedge_delay > 0 and not hedged and candidates and len(attempts) == 1
+                done, _ = await asyncio.wait(
+                    attempts,
+                    timeout=hedge_delay if hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    hedged = True
+                    metrics.provider_hedges_total.inc()
+                    logger.info(f"No token from {next(iter(attempts.values())).backend.name} after {hedge_delay}s, hedging")
+                    launch()
+                    continue
+
+                winner = None
+                for task in done:
+                    attempt = attempts.pop(task)
+                    error = task.exception()
+                    if error is not None:
+                        last_error = error
+                        logger.warning(f"Provider backend {attempt.backend.name} failed: {error}")
+                        self.record_error(attempt.backend, "error")
+                        await attempt.close(healthy=False)
+                    elif winner is None:
+                        winner = (attempt, task.result())
+                    else:
+                        # Finished in the same wakeup as the winner; its agent is fine
+                        metrics.provider_attempts_total.inc(attempt.backend.name, "cancelled")
+                        await attempt.close(healthy=True)
+                if winner is not None:
+                    break
+                if not attempts:
+                    if not candidates:
+                        raise last_error
+                    launch()  # Fail over to the next backend
+        finally:
+            # Cancel the losers and everything still pending on error or cancellation
+            for task in attempts:
+                task.cancel()
+            if attempts:
+                await asyncio.wait(attempts)
+            for task, attempt in attempts.items():
+                await self._discard(task, attempt)
+
+        attempt, first = winner
+        backend = attempt.backend
+        backend.record_first_token(time.monotonic() - attempt.started_at)
+        metrics.provider_attempts_total.inc(backend.name, "won")
+        if on_selected is not None:
+            on_selected(backend)
+        return RoutedStream(self, attempt, first)
+
+    async def _discard(self, task: asyncio.Task, attempt: Attempt):
+        """Close a losing attempt; only one that failed on its own gives up its agent."""
+        error = None if task.cancelled() else task.exception()
+        if error is None:
+            metrics.provider_attempts_total.inc(attempt.backend.name, "cancelled")
+        else:
+            logger.debug(f"Losing provider backend {attempt.backend.name} failed: {error}")
+            metrics.provider_attempts_total.inc(attempt.backend.name, "error")
+        await attempt.close(healthy=error is None)
+
+    async def complete(self, config: Dict, system_prompt: str, prompt: str) -> str:
+        """Run a request to completion and return the whole response."""
+        stream = await self.open_stream(config, system_prompt, prompt)
+        async with aclosing(stream):
+            return "".join([token async for token in stream])
+
+# Global provider router instance
+provider_router = ProviderRouter()
@@ -0,0 +1,76 @@
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+from . import metrics, settings
+
+logger = logging.getLogger(__name__)
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace so trivially different prompts share an entry."""
+    return " ".join(prompt.split())
+
+class ResponseCache:
+    """TTL + size-bounded LRU cache of complete responses to identical prompts."""
+
+    def __init__(
+        self,
+        enabled: bool = settings.RESPONSE_CACHE_ENABLED,
+        ttl: float = settings.RESPONSE_CACHE_TTL,
+        max_entries: int = settings.RESPONSE_CACHE_MAX_ENTRIES,
+        max_bytes: int = settings.RESPONSE_CACHE_MAX_BYTES
+    ):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # key -> (expires_at, response)
+        self.entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self.size = 0
+
+    @staticmethod
+    def make_key(provider: str, model: str, system_prompt: str, prompt: str, history_hash: str = "") -> str:
+        parts = (provider.lower(), model, system_prompt, normalize_prompt(prompt), history_hash)
+        return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return a cached response, or None on a miss."""
+        if not self.enabled:
+            return None
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] < time.monotonic():
+            self._pop(key)
+            entry = None
+        if entry is None:
+            metrics.cache_misses_total.inc()
+            return None
+        self.entries.move_to_end(key)
+        response = entry[1]
+        saved = len(response.encode())
+        metrics.cache_hits_total.inc()
+        metrics.cache_bytes_saved_total.inc(amount=saved)
+        return response
+
+    def put(self, key: str, response: str):
+        """Store a complete response."""
+        if not self.enabled or not response or len(response) > self.max_bytes:
+            return
+        self._pop(key)
+        self.entries[key] = (time.monotonic() + self.ttl, response)
+        self.size += len(response)
+        while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+            oldest = next(iter(self.entries))
+            self._pop(oldest)
+
+    def _pop(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+# Global response cache instance
+response_cache = ResponseCache()
@@ -0,0 +1,226 @@
+import hashlib
+import logging
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Deque, Optional, Tuple
+from . import settings
+from .state import state_backend
+from .transcripts import ROLE_ASSISTANT, ROLE_USER, transcript_store
+
+logger = logging.getLogger(__name__)
+
+USER = "User"
+ASSISTANT = "Assistant"
+
+# Compare-and-set rounds before a session save gives up
+SAVE_ATTEMPTS = 5
+
+# (role, text, estimated tokens)
+Turn = Tuple[str, str, int]
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count, good enough for budgeting history."""
+    return len(text) // 4 + 1
+
+class Session:
+    """Conversation history for one session, kept within a token budget.
+
+    When the budget is exceeded the oldest turns are dropped and the user
+    prompts among them are folded into a short running summary.
+    """
+    __slots__ = ("session_id", "turns", "tokens", "size", "summary", "last_used", "version")
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.turns: Deque[Turn] = deque()
+        self.tokens = 0
+        self.size = 0
+        self.summary = ""
+        self.last_used = time.monotonic()
+        # Version of the shared copy this one matches; 0 if there is none
+        self.version = 0
+
+    def add_turn(self, role: str, text: str, token_budget: int, summary_chars: int):
+        """Append a turn, then trim the oldest turns to fit the token budget."""
+        turn = (role, text, estimate_tokens(text))
+        self.turns.append(turn)
+        self.tokens += turn[2]
+        self.size += len(text)
+        while self.tokens > token_budget and len(self.turns) > 1:
+            self._drop_oldest(summary_chars)
+
+    def _drop_oldest(self, summary_chars: int):
+        role, text, tokens = self.turns.popleft()
+        self.tokens -= tokens
+        self.size -= len(text)
+        if role == USER and summary_chars:
+            topic = " ".join(text.split())[:80]
+            summary = f"{self.summary}; {topic}" if self.summary else topic
+            # Keep the most recent topics
+            self.summary = summary[-summary_chars:]
+
+    def render_prompt(self, message: str) -> str:
+        """Build the prompt for a new message, prefixed with the history."""
+        if not self.turns and not self.summary:
+            return message
+        lines = []
+        if self.summary:
+            lines.append(f"(Earlier topics: {self.summary})")
+        for role, text, _ in self.turns:
+            lines.append(f"{role}: {text}")
+        lines.append(f"{USER}: {message}")
+        lines.append(f"{ASSISTANT}:")
+        return "\n".join(lines)
+
+    def history_hash(self) -> str:
+        """Fingerprint of the history, so cached answers are only reused in the same context."""
+        if not self.turns and not self.summary:
+            return ""
+        digest = hashlib.sha256(self.summary.encode())
+        for role, text, _ in self.turns:
+            digest.update(f"\0{role}\0{text}".encode())
+        return digest.hexdigest()
+
+    @property
+    def memory(self) -> int:
+        return self.size + len(self.summary)
+
+    def to_dict(self) -> dict:
+        return {
+            "summary": self.summary,
+            "turns": [[role, text] for role, text, _ in self.turns]
+        }
+
+    @classmethod
+    def from_dict(cls, session_id: str, data: dict) -> "Session":
+        session = cls(session_id)
+        session.summary = data.get("summary", "")
+        for role, text in data.get("turns", []):
+            tokens = estimate_tokens(text)
+            session.turns.append((role, text, tokens))
+            session.tokens += tokens
+            session.size += len(text)
+        return session
+
+class SessionStore:
+    """Holds conversation sessions with LRU eviction under a global memory cap."""
+
+    def __init__(
+        self,
+        max_sessions: int = settings.SESSION_MAX_COUNT,
+        memory_limit: int = settings.SESSION_MEMORY_LIMIT,
+        token_budget: int = settings.SESSION_TOKEN_BUDGET,
+        summary_chars: int = settings.SESSION_SUMMARY_CHARS
+    ):
+        self.max_sessions = max_sessions
+        self.memory_limit = memory_limit
+        self.token_budget = token_budget
+        self.summary_chars = summary_chars
+        self.sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.memory = 0
+        self.evicted = 0
+
+    @staticmethod
+    def new_session_id() -> str:
+        return uuid.uuid4().hex
+
+    def get(self, session_id: str) -> Session:
+        """Return the session for an id, creating it if needed."""
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = Session(session_id)
+            self.sessions[session_id] = session
+            self._evict()
+        else:
+            self.sessions.move_to_end(session_id)
+        session.last_used = time.monotonic()
+        return session
+
+    def find(self, session_id: str) -> Optional[Session]:
+        return self.sessions.get(session_id)
+
+    async def load(self, session_id: str, new: bool = False) -> Session:
+        """Return a session, refreshed from the shared state backend if another worker changed it.
+
+        A session that is nowhere in memory, e.g. after a restart, is rebuilt
+        from the most recent page of its transcript. A session the server has
+        just minted (new=True) has no history anywhere, so it skips both.
+        """
+        if new:
+            return self.get(session_id)
+        if state_backend.shared:
+            data, version = await state_backend.load_session(session_id)
+            session = self.sessions.get(session_id)
+            if data and (session is None or session.version != version):
+                self._replace(session_id, data, version)
+        if session_id not in self.sessions:
+            entries, _ = await transcript_store.page(session_id)
+            if entries and session_id not in self.sessions:
+                session = self.get(session_id)
+                roles = {ROLE_USER: USER, ROLE_ASSISTANT: ASSISTANT}
+                for entry in entries:
+                    if entry["content"]:
+                        session.add_turn(roles.get(entry["role"], USER), entry["content"], self.token_budget, self.summary_chars)
+                self.memory += session.memory
+                self._evict()
+        return self.get(session_id)
+
+    async def add_exchange(self, session_id: str, user_message: str, response: str):
+        """Record a user message and the assistant's response.
+
+        With a shared backend the session is only saved if no other worker
+        saved it since this copy was loaded; otherwise the exchange is added
+        to their copy and saved again, so neither worker's turns are lost.
+        """
+        session = self.get(session_id)
+        self._add_exchange(session, user_message, response)
+        if not state_backend.shared:
+            return
+        for _ in range(SAVE_ATTEMPTS):
+            saved, data, version = await state_backend.save_session(session_id, session.to_dict(), session.version)
+            if saved:
+                session.version = version
+                return
+            if data:
+                session = self._replace(session_id, data, version)
+                self._add_exchange(session, user_message, response)
+            else:
+                session.version = version  # The shared copy expired; write this one
+        logger.warning(f"Session {session_id} kept changing in other workers, giving up saving it")
+
+    def _add_exchange(self, session: Session, user_message: str, response: str):
+        before = session.memory
+        session.add_turn(USER, user_message, self.token_budget, self.summary_chars)
+        if response:
+            session.add_turn(ASSISTANT, response, self.token_budget, self.summary_chars)
+        self.memory += session.memory - before
+        self._evict()
+
+    def _replace(self, session_id: str, data: dict, version: int) -> Session:
+        """Swap in the shared copy of a session."""
+        self.remove(session_id)
+        session = Session.from_dict(session_id, data)
+        session.version = version
+        self.sessions[session_id] = session
+        self.memory += session.memory
+        self._evict()
+        return session
+
+    def remove(self, session_id: str):
+        session = self.sessions.pop(session_id, None)
+        if session is not None:
+            self.memory -= session.memory
+
+    def _evict(self):
+        # Never evict the most recently used session
+        while len(self.sessions) > 1 and (
+            len(self.sessions) > self.max_sessions or self.memory > self.memory_limit
+        ):
+            session_id, session = self.sessions.popitem(last=False)
+            self.memory -= session.memory
+            self.evicted += 1
+            logger.debug(f"Evicted conversation session {session_id}")
+
+# Global session store instance
+session_store = SessionStore()
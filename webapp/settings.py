@@ -0,0 +1,116 @@
+import os
+
+"""
+Runtime tunables, overridable through SIMPLEX_* environment variables.
+"""
+
+
+def env_int(name: str, default: int) -> int:
+    """Read an integer setting from the environment."""
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+def env_float(name: str, default: float) -> float:
+    """Read a float setting from the environment."""
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+def env_bool(name: str, default: bool) -> bool:
+    """Read a boolean setting from the environment."""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+# Agent pool
+AGENT_POOL_SIZE = env_int("SIMPLEX_AGENT_POOL_SIZE", 32)
+AGENT_POOL_IDLE_TIMEOUT = env_float("SIMPLEX_AGENT_POOL_IDLE_TIMEOUT", 300.0)
+AGENT_POOL_MAX_AGE = env_float("SIMPLEX_AGENT_POOL_MAX_AGE", 3600.0)
+
+# Provider routing across the configured backends; policy is one of failover, ttft, weighted.
+# A hedge delay above 0 starts a second backend when the first has no token after that many seconds.
+ROUTING_POLICY = os.environ.get("SIMPLEX_ROUTING_POLICY", "failover")
+ROUTING_HEDGE_DELAY = env_float("SIMPLEX_ROUTING_HEDGE_DELAY", 0.0)
+ROUTING_ERROR_COOLDOWN = env_float("SIMPLEX_ROUTING_ERROR_COOLDOWN", 30.0)
+
+# Start-up: import the provider SDK and build agents for the configured backends in the background
+PREWARM = env_bool("SIMPLEX_PREWARM", True)
+
+# Configuration cache
+CONFIG_CHECK_INTERVAL = env_float("SIMPLEX_CONFIG_CHECK_INTERVAL", 1.0)
+
+# Chunk coalescing
+COALESCE_MAX_BYTES = env_int("SIMPLEX_COALESCE_MAX_BYTES", 1024)
+COALESCE_MAX_DELAY = env_float("SIMPLEX_COALESCE_MAX_DELAY", 0.03)
+
+# Stream telemetry: emit a debug event for one in every N tokens (0 disables)
+TELEMETRY_SAMPLE_EVERY = env_int("SIMPLEX_TELEMETRY_SAMPLE_EVERY", 0)
+
+# Conversation sessions
+SESSION_TOKEN_BUDGET = env_int("SIMPLEX_SESSION_TOKEN_BUDGET", 2000)
+SESSION_SUMMARY_CHARS = env_int("SIMPLEX_SESSION_SUMMARY_CHARS", 400)
+SESSION_MAX_COUNT = env_int("SIMPLEX_SESSION_MAX_COUNT", 10000)
+SESSION_MEMORY_LIMIT = env_int("SIMPLEX_SESSION_MEMORY_LIMIT", 64 * 1024 * 1024)
+
+# Response cache for repeated prompts
+RESPONSE_CACHE_ENABLED = env_bool("SIMPLEX_RESPONSE_CACHE", False)
+RESPONSE_CACHE_TTL = env_float("SIMPLEX_RESPONSE_CACHE_TTL", 300.0)
+RESPONSE_CACHE_MAX_ENTRIES = env_int("SIMPLEX_RESPONSE_CACHE_MAX_ENTRIES", 1024)
+RESPONSE_CACHE_MAX_BYTES = env_int("SIMPLEX_RESPONSE_CACHE_MAX_BYTES", 16 * 1024 * 1024)
+
+# API key validation cache
+VALIDATION_TTL = env_float("SIMPLEX_VALIDATION_TTL", 600.0)
+VALIDATION_NEGATIVE_TTL = env_float("SIMPLEX_VALIDATION_NEGATIVE_TTL", 30.0)
+VALIDATION_MAX_ENTRIES = env_int("SIMPLEX_VALIDATION_MAX_ENTRIES", 1024)
+
+# Request scheduler; weights are "api_key_hash:weight" pairs separated by commas
+SCHEDULER_MAX_CONCURRENT = env_int("SIMPLEX_SCHEDULER_MAX_CONCURRENT", 64)
+SCHEDULER_MAX_PER_CONNECTION = env_int("SIMPLEX_SCHEDULER_MAX_PER_CONNECTION", 2)
+SCHEDULER_MAX_QUEUED = env_int("SIMPLEX_SCHEDULER_MAX_QUEUED", 1024)
+SCHEDULER_WEIGHTS = os.environ.get("SIMPLEX_SCHEDULER_WEIGHTS", "")
+
+# Shared state backend: "memory" or "unix:/path/to/broker.sock" for multiple workers
+STATE_BACKEND = os.environ.get("SIMPLEX_STATE_BACKEND", "memory")
+STATE_SESSION_TTL = env_float("SIMPLEX_STATE_SESSION_TTL", 86400.0)
+STATE_MAX_ENTRIES = env_int("SIMPLEX_STATE_MAX_ENTRIES", 10000)
+STATE_MEMORY_LIMIT = env_int("SIMPLEX_STATE_MEMORY_LIMIT", 64 * 1024 * 1024)
+
+# Seconds between sweeps for connection and stream state whose owner is gone (0 disables)
+SWEEP_INTERVAL = env_float("SIMPLEX_SWEEP_INTERVAL", 60.0)
+
+# Per-connection send queue; policy is one of coalesce, drop, pause
+SEND_QUEUE_SIZE = env_int("SIMPLEX_SEND_QUEUE_SIZE", 256)
+SEND_QUEUE_POLICY = os.environ.get("SIMPLEX_SEND_QUEUE_POLICY", "coalesce")
+
+# HTTP batch chat: most messages per request, and messages answered at once per batch
+BATCH_MAX_MESSAGES = env_int("SIMPLEX_BATCH_MAX_MESSAGES", 1000)
+BATCH_CONCURRENCY = env_int("SIMPLEX_BATCH_CONCURRENCY", 8)
+
+# Static assets: serve bundled, fingerprinted and pre-compressed files from static/dist
+ASSET_BUNDLE = env_bool("SIMPLEX_ASSET_BUNDLE", True)
+
+# Rendered pages: minimum seconds between checks of their template and the asset manifest
+PAGE_CHECK_INTERVAL = env_float("SIMPLEX_PAGE_CHECK_INTERVAL", 1.0)
+
+# Resumable streams: seconds a stream keeps running without a client, and chunk frames buffered for resume
+RESUME_GRACE_PERIOD = env_float("SIMPLEX_RESUME_GRACE_PERIOD", 30.0)
+RESUME_BUFFER_FRAMES = env_int("SIMPLEX_RESUME_BUFFER_FRAMES", 512)
+
+# Conversation transcripts (SQLite in WAL mode); an empty path disables them
+TRANSCRIPT_PATH = os.environ.get("SIMPLEX_TRANSCRIPT_PATH", os.path.join(os.path.expanduser("~"), ".simplex", "transcripts.db"))
+TRANSCRIPT_BATCH_SIZE = env_int("SIMPLEX_TRANSCRIPT_BATCH_SIZE", 256)
+TRANSCRIPT_FLUSH_INTERVAL = env_float("SIMPLEX_TRANSCRIPT_FLUSH_INTERVAL", 0.05)
+TRANSCRIPT_MAX_PENDING = env_int("SIMPLEX_TRANSCRIPT_MAX_PENDING", 10000)
+TRANSCRIPT_MMAP_SIZE = env_int("SIMPLEX_TRANSCRIPT_MMAP_SIZE", 64 * 1024 * 1024)
+TRANSCRIPT_PAGE_SIZE = env_int("SIMPLEX_TRANSCRIPT_PAGE_SIZE", 50)
+
+# Opt-in event loop instrumentation and /debug profiler endpoints (also enabled by "diagnostics": true in the config)
+DIAGNOSTICS = env_bool("SIMPLEX_DIAGNOSTICS", False)
+LOOP_LAG_INTERVAL = env_float("SIMPLEX_LOOP_LAG_INTERVAL", 0.05)
+SLOW_CALLBACK_THRESHOLD = env_float("SIMPLEX_SLOW_CALLBACK_THRESHOLD", 0.1)
+PROFILE_SAMPLE_INTERVAL = env_float("SIMPLEX_PROFILE_SAMPLE_INTERVAL", 0.005)
+PROFILE_MAX_SECONDS = env_float("SIMPLEX_PROFILE_MAX_SECONDS", 60.0)
@@ -0,0 +1,388 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from . import settings
+
+"""
+Pluggable backends for state that must be visible to every worker process:
+stream cancellation and conversation session lookup.
+
+The in-memory backend keeps the single-process behaviour. The broker backend
+lets `uvicorn --workers N` share that state over a Unix socket: the first
+worker to take the broker lock runs a tiny broker on the socket, the others
+connect to it, and a new broker is elected if its worker goes away.
+"""
+
+
+logger = logging.getLogger(__name__)
+
+CancelHandler = Callable[[str], object]
+
+class StateBackend:
+    """In-process state; cancellations are delivered to local handlers only."""
+    shared = False
+
+    def __init__(self):
+        self.cancel_handlers: List[CancelHandler] = []
+
+    def on_cancel(self, handler: CancelHandler):
+        """Register a callback invoked with the stream ID of every cancellation."""
+        self.cancel_handlers.append(handler)
+
+    def dispatch_cancel(self, stream_id: str):
+        for handler in self.cancel_handlers:
+            try:
+                handler(stream_id)
+            except Exception as e:
+                logger.error(f"Cancel handler failed for stream {stream_id}: {e}")
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def publish_cancel(self, stream_id: str):
+        """Cancel a stream wherever it is running."""
+        self.dispatch_cancel(stream_id)
+
+    async def load_session(self, session_id: str) -> Tuple[Optional[dict], int]:
+        """Return a session's shared copy and its version, or (None, 0)."""
+        return None, 0
+
+    async def save_session(self, session_id: str, data: dict, version: int) -> Tuple[bool, Optional[dict], int]:
+        """Store a session unless another worker changed it since version.
+
+        Returns (True, None, new version) when it was stored, or (False, data,
+        version) of the newer shared copy when it was not.
+        """
+        return True, None, version
+
+class MemoryStateBackend(StateBackend):
+    pass
+
+class Broker:
+    """Newline-delimited JSON broker: a shared key/value store plus cancel fan-out.
+
+    The store is an LRU bounded by entry count and by the size of the stored
+    messages; expired entries are dropped by a periodic sweep as well as on read.
+    Every write gets a new version, which `cas` compares before writing.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = settings.STATE_MAX_ENTRIES,
+        memory_limit: int = settings.STATE_MEMORY_LIMIT,
+        sweep_interval: float = settings.SWEEP_INTERVAL
+    ):
+        self.max_entries = max_entries
+        self.memory_limit = memory_limit
+        self.sweep_interval = sweep_interval
+        # key -> (expires, size, value, version), least recently used first
+        self.values: "OrderedDict[str, Tuple[float, int, object, int]]" = OrderedDict()
+        # Never reused, so a key that expired and was written again gets a new version
+        self.version = 0
+        self.memory = 0
+        self.evicted = 0
+        self.clients: Set[asyncio.StreamWriter] = set()
+        self._sweeper: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.sweep_interval > 0:
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    def stop(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+
+    def _set(self, key: str, value: object, ttl: float, size: int) -> int:
+        self._delete(key)
+        self.version += 1
+        expires = time.monotonic() + ttl if ttl else 0
+        self.values[key] = (expires, size, value, self.version)
+        self.memory += size
+        # Never evict the entry just written
+        while len(self.values) > 1 and (len(self.values) > self.max_entries or self.memory > self.memory_limit):
+            _, (_, evicted_size, _, _) = self.values.popitem(last=False)
+            self.memory -= evicted_size
+            self.evicted += 1
+        return self.version
+
+    def _delete(self, key: str):
+        entry = self.values.pop(key, None)
+        if entry is not None:
+            self.memory -= entry[1]
+
+    def _get(self, key: str) -> Tuple[object, int]:
+        """(value, version) of a key; (None, 0) when it is missing or expired."""
+        entry = self.values.get(key)
+        if entry is None:
+            return None, 0
+        if entry[0] and entry[0] < time.monotonic():
+            self._delete(key)
+            return None, 0
+        self.values.move_to_end(key)
+        return entry[2], entry[3]
+
+    def sweep(self) -> int:
+        """Drop expired entries. Returns how many were dropped."""
+        now = time.monotonic()
+        expired = [key for key, entry in self.values.items() if entry[0] and entry[0] < now]
+        for key in expired:
+            self._delete(key)
+        return len(expired)
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            expired = self.sweep()
+            if expired:
+                logger.info(f"State broker dropped {expired} expired entries")
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.clients.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    self.reply_error(writer, None, "invalid JSON")
+                    continue
+                self.handle(message, writer, len(line))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+
+    def reply_error(self, writer: asyncio.StreamWriter, request_id: object, error: str):
+        logger.warning(f"State broker rejected a message: {error}")
+        writer.write(json.dumps({"op": "error", "req": request_id, "error": error}).encode() + b"\n")
+
+    def handle(self, message: object, writer: asyncio.StreamWriter, size: int = 0):
+        if not isinstance(message, dict):
+            self.reply_error(writer, None, "message is not an object")
+            return
+        op = message.get("op")
+        request_id = message.get("req")
+        key = message.get("key")
+        ttl = message.get("ttl") or 0
+        if op in ("set", "cas", "del", "get") and not isinstance(key, str):
+            self.reply_error(writer, request_id, f"{op} needs a string key")
+        elif op in ("set", "cas") and (not isinstance(ttl, (int, float)) or ttl < 0):
+            self.reply_error(writer, request_id, "ttl must be a non-negative number")
+        elif op == "set":
+            self._set(key, message.get("value"), ttl, size)
+        elif op == "cas":
+            # Write only if the key is still at the version the client read
+            expected = message.get("version")
+            if not isinstance(expected, int):
+                self.reply_error(writer, request_id, "cas needs an integer version")
+                return
+            value, version = self._get(key)
+            if version == expected:
+                reply = {"op": "value", "req": request_id, "ok": True, "version": self._set(key, message.get("value"), ttl, size)}
+            else:
+                reply = {"op": "value", "req": request_id, "ok": False, "value": value, "version": version}
+            writer.write(json.dumps(reply).encode() + b"\n")
+        elif op == "del":
+            self._delete(key)
+        elif op == "get":
+            value, version = self._get(key)
+            reply = {"op": "value", "req": request_id, "value": value, "version": version}
+            writer.write(json.dumps(reply).encode() + b"\n")
+        elif op == "cancel":
+            if not isinstance(message.get("id"), str):
+                self.reply_error(writer, request_id, "cancel needs a string id")
+                return
+            line = json.dumps({"op": "cancel", "id": message["id"]}).encode() + b"\n"
+            for client in list(self.clients):
+                client.write(line)
+        else:
+            self.reply_error(writer, request_id, f"unknown op {op!r}")
+
+class BrokerStateBackend(StateBackend):
+    """State shared between worker processes through a Unix-socket broker."""
+    shared = True
+
+    def __init__(
+        self,
+        path: Path,
+        session_ttl: float = settings.STATE_SESSION_TTL,
+        request_timeout: float = 1.0
+    ):
+        super().__init__()
+        self.path = Path(path)
+        self.session_ttl = session_ttl
+        self.request_timeout = request_timeout
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.broker: Optional[Broker] = None
+        self.lock_file = None
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.next_request = 0
+        self.connected = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_broker(self) -> bool:
+        return self.server is not None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(self.connected.wait(), timeout=5)
+        except asyncio.TimeoutError:
+            logger.error(f"Could not reach state broker at {self.path}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        if self.writer is not None:
+            self.writer.close()
+        if self.server is not None:
+            self.broker.stop()
+            self.server.close()
+            # Let the broker's connection handlers see EOF and finish
+            for client in list(self.broker.clients):
+                client.close()
+            await asyncio.sleep(0.1)
+            try:
+                self.path.unlink()
+            except OSError:
+                pass
+        if self.lock_file is not None:
+            self.lock_file.close()
+
+    def _try_lock(self) -> bool:
+        """Take the broker lock; the OS releases it if this worker dies."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        lock_file = open(self.path.with_suffix(".lock"), "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self.lock_file = lock_file
+        return True
+
+    async def _elect(self):
+        """Become the broker if nobody holds the broker lock, then connect to it."""
+        if self.server is None and self._try_lock():
+            try:
+                # Stale socket file from a dead broker
+                self.path.unlink()
+            except OSError:
+                pass
+            self.broker = Broker()
+            self.broker.start()
+            self.server = await asyncio.start_unix_server(self.broker.handle_client, str(self.path))
+            logger.info(f"Worker {os.getpid()} is serving the state broker at {self.path}")
+        self.reader, self.writer = await asyncio.open_unix_connection(str(self.path))
+
+    async def _run(self):
+        while True:
+            try:
+                await self._elect()
+                self.connected.set()
+                await self._read_loop()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"State broker connection failed: {e}")
+            self.connected.clear()
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_result(None)
+            self.pending.clear()
+            await asyncio.sleep(0.5)
+
+    async def _read_loop(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                raise ConnectionError("state broker closed the connection")
+            message = json.loads(line)
+            op = message.get("op")
+            if op == "cancel":
+                self.dispatch_cancel(message.get("id"))
+            elif op in ("value", "error"):
+                if op == "error":
+                    logger.warning(f"State broker error: {message.get('error')}")
+                future = self.pending.pop(message.get("req"), None)
+                if future is not None and not future.done():
+                    future.set_result(message if op == "value" else None)
+
+    def _send(self, message: dict) -> bool:
+        """Write a message to the broker without waiting; messages are small."""
+        if not self.connected.is_set():
+            return False
+        try:
+            self.writer.write(json.dumps(message).encode() + b"\n")
+            return True
+        except (ConnectionError, RuntimeError) as e:
+            logger.warning(f"State broker write failed: {e}")
+            return False
+
+    async def _request(self, message: dict) -> Optional[dict]:
+        """Send a request and wait for the broker's reply; None if it failed or timed out."""
+        self.next_request += 1
+        request_id = self.next_request
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        if not self._send({**message, "req": request_id}):
+            self.pending.pop(request_id, None)
+            return None
+        try:
+            return await asyncio.wait_for(future, timeout=self.request_timeout)
+        except asyncio.TimeoutError:
+            self.pending.pop(request_id, None)
+            return None
+
+    def publish_cancel(self, stream_id: str):
+        # The broker echoes the cancel to every worker, this one included
+        if not self._send({"op": "cancel", "id": stream_id}):
+            self.dispatch_cancel(stream_id)
+
+    async def load_session(self, session_id: str) -> Tuple[Optional[dict], int]:
+        reply = await self._request({"op": "get", "key": f"session:{session_id}"})
+        if reply is None:
+            return None, 0
+        return reply.get("value"), reply.get("version", 0)
+
+    async def save_session(self, session_id: str, data: dict, version: int) -> Tuple[bool, Optional[dict], int]:
+        reply = await self._request({
+            "op": "cas",
+            "key": f"session:{session_id}",
+            "value": data,
+            "version": version,
+            "ttl": self.session_ttl
+        })
+        if reply is None:
+            # Broker unreachable; keep the local copy as it is
+            return True, None, version
+        if reply.get("ok"):
+            return True, None, reply["version"]
+        return False, reply.get("value"), reply.get("version", 0)
+
+def create_backend(spec: str) -> StateBackend:
+    """Build a backend from a spec: "memory" or "unix:/path/to/broker.sock"."""
+    if spec.startswith("unix:"):
+        return BrokerStateBackend(Path(spec[len("unix:"):]).expanduser())
+    if spec != "memory":
+        logger.warning(f"Unknown state backend {spec!r}, using memory")
+    return MemoryStateBackend()
+
+# Global state backend instance
+state_backend = create_backend(settings.STATE_BACKEND)
@@ -0,0 +1,139 @@
+import json
+import logging
+import time
+from typing import AsyncIterator, Dict, List, Optional
+from . import metrics, settings
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in milliseconds, of the inter-token latency histogram buckets
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+def bucket_index(value_ms: float) -> int:
+    """Return the histogram bucket for a latency; the last bucket is unbounded."""
+    for index, bound in enumerate(LATENCY_BUCKETS_MS):
+        if value_ms <= bound:
+            return index
+    return len(LATENCY_BUCKETS_MS)
+
+def bucket_labels() -> List[str]:
+    return [f"le_{bound}ms" for bound in LATENCY_BUCKETS_MS] + ["inf"]
+
+class StreamTelemetry:
+    """Per-stream counters, summarized in a single structured log record.
+
+    Token-level work is limited to a few counter updates. Per-token debug
+    events are only emitted for one in every sample_every tokens, and only
+    when debug logging is enabled.
+    """
+    __slots__ = (
+        "stream_id", "provider", "started_at", "admitted_at", "first_token_at", "last_token_at",
+        "ended_at", "cancelled_at", "tokens", "bytes", "frames", "histogram", "sample_every", "debug"
+    )
+
+    def __init__(self, stream_id: Optional[str], provider: str = "", sample_every: int = settings.TELEMETRY_SAMPLE_EVERY):
+        self.stream_id = stream_id
+        self.provider = provider
+        self.started_at = time.monotonic()
+        self.admitted_at: Optional[float] = None
+        self.first_token_at: Optional[float] = None
+        self.last_token_at: Optional[float] = None
+        self.ended_at: Optional[float] = None
+        self.cancelled_at: Optional[float] = None
+        self.tokens = 0
+        self.bytes = 0
+        self.frames = 0
+        self.histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.sample_every = sample_every
+        self.debug = sample_every > 0 and logger.isEnabledFor(logging.DEBUG)
+
+    def record_admitted(self):
+        """Mark the moment the request left the scheduler queue."""
+        self.admitted_at = time.monotonic()
+
+    def record_token(self, token: str):
+        """Account for one token received from the provider."""
+        now = time.monotonic()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        else:
+            self.histogram[bucket_index((now - self.last_token_at) * 1000)] += 1
+        self.last_token_at = now
+        self.tokens += 1
+        self.bytes += len(token.encode())
+
+        if self.debug and self.tokens % self.sample_every == 0:
+            logger.debug(f"Stream token sample (ID: {self.stream_id}, n={self.tokens}): {token[:50]!r}")
+
+    def record_frame(self):
+        """Account for one frame sent to the client."""
+        self.frames += 1
+
+    async def observe(self, stream: AsyncIterator[str]) -> AsyncIterator[str]:
+        """Pass a token stream through, recording every token."""
+        async for token in stream:
+            self.record_token(token)
+            yield token
+
+    @property
+    def ttft(self) -> Optional[float]:
+        """Time from admission to first token, in seconds."""
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - (self.admitted_at or self.started_at)
+
+    @property
+    def queue_time(self) -> float:
+        """Time spent waiting for a scheduler slot, in seconds."""
+        if self.admitted_at is None:
+            return 0.0
+        return self.admitted_at - self.started_at
+
+    @property
+    def cancel_release(self) -> Optional[float]:
+        """Time from the cancel request to the end of the stream, in seconds."""
+        if self.cancelled_at is None:
+            return None
+        end = self.ended_at if self.ended_at is not None else time.monotonic()
+        return max(end - self.cancelled_at, 0.0)
+
+    @property
+    def duration(self) -> float:
+        end = self.ended_at if self.ended_at is not None else time.monotonic()
+        return end - self.started_at
+
+    def summary(self, status: str) -> Dict:
+        duration = self.duration
+        ttft = self.ttft
+        cancel_release = self.cancel_release
+        return {
+            "event": "stream_summary",
+            "stream_id": self.stream_id,
+            "provider": self.provider,
+            "status": status,
+            "tokens": self.tokens,
+            "bytes": self.bytes,
+            "frames": self.frames,
+            "queue_ms": round(self.queue_time * 1000, 1),
+            "ttft_ms": round(ttft * 1000, 1) if ttft is not None else None,
+            "duration_ms": round(duration * 1000, 1),
+            "cancel_release_ms": round(cancel_release * 1000, 2) if cancel_release is not None else None,
+            "tokens_per_s": round(self.tokens / duration, 1) if duration > 0 else 0.0,
+            "frames_per_s": round(self.frames / duration, 1) if duration > 0 else 0.0,
+            "bytes_per_s": round(self.bytes / duration, 1) if duration > 0 else 0.0,
+            "inter_token_ms": dict(zip(bucket_labels(), self.histogram))
+        }
+
+    def finish(self, status: str = "complete") -> Dict:
+        """Close the stream and emit its summary."""
+        if self.ended_at is None:
+            self.ended_at = time.monotonic()
+        summary = self.summary(status)
+        metrics.streams_total.inc(self.provider, status)
+        metrics.stream_duration.observe(self.provider, value=self.duration)
+        if self.ttft is not None:
+            metrics.stream_ttft.observe(self.provider, value=self.ttft)
+        if self.cancel_release is not None:
+            metrics.cancel_release.observe(self.provider, value=self.cancel_release)
+        logger.info(json.dumps(summary), extra={"stream_summary": summary})
+        return summary
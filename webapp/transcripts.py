@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+from . import settings
+
+"""
+Server-side conversation transcripts, so a reconnecting or reloaded client can
+get its history back.
+
+Entries are appended to a SQLite database in WAL mode by a background writer
+that commits in batches, so handlers never wait on disk. Reads are keyset-paged
+range queries over the (session_id, id) index and go through SQLite's
+memory-mapped I/O, so even a long history is loaded one page at a time.
+Reads never wait for the writer: entries it has not committed yet are merged
+into the newest page from memory.
+"""
+
+
+logger = logging.getLogger(__name__)
+
+ROLE_USER = "user"
+ROLE_ASSISTANT = "assistant"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcript (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    user_input_id TEXT,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    status TEXT,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transcript_session ON transcript (session_id, id);
+"""
+
+# (session_id, user_input_id, role, content, status, created)
+Entry = Tuple[str, Optional[str], str, str, Optional[str], float]
+
+class TranscriptStore:
+    """Append-only transcript log with a batched background writer."""
+
+    def __init__(
+        self,
+        path: Optional[Path],
+        batch_size: int = settings.TRANSCRIPT_BATCH_SIZE,
+        flush_interval: float = settings.TRANSCRIPT_FLUSH_INTERVAL,
+        max_pending: int = settings.TRANSCRIPT_MAX_PENDING,
+        mmap_size: int = settings.TRANSCRIPT_MMAP_SIZE
+    ):
+        self.path = Path(path).expanduser() if path else None
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.mmap_size = mmap_size
+        self.pending: List[Tuple[int, Entry]] = []  # (seq, entry), oldest first
+        self.inflight: List[Tuple[int, Entry]] = []  # The batch being written
+        self.appended = 0  # seq of the newest queued entry
+        self.committed = 0  # seq of the newest committed entry
+        self.dropped = 0
+        self._writer_db: Optional[sqlite3.Connection] = None
+        self._reader_db: Optional[sqlite3.Connection] = None
+        self._reader_lock = threading.Lock()
+        # Held while a batch commits, so a read sees it either fully written or not at all
+        self._commit_lock = threading.Lock()
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._task is not None
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("PRAGMA busy_timeout=5000")
+        db.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        return db
+
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._writer_db = self._connect()
+        self._writer_db.executescript(SCHEMA)
+        self._reader_db = self._connect()
+
+    async def start(self):
+        if self.path is None:
+            return
+        try:
+            await asyncio.to_thread(self._open)
+        except (OSError, sqlite3.Error) as e:
+            logger.error(f"Transcript store disabled, cannot open {self.path}: {e}")
+            return
+        self._task = asyncio.create_task(self._write_loop())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        await self.flush()
+        self._task.cancel()
+        self._task = None
+        for db in (self._writer_db, self._reader_db):
+            db.close()
+
+    def append(
+        self,
+        session_id: str,
+        user_input_id: Optional[str],
+        role: str,
+        content: str,
+        status: Optional[str] = None
+    ):
+        """Queue an entry for the background writer; never blocks."""
+        if self._task is None:
+            return
+        if len(self.pending) >= self.max_pending:
+            self.dropped += 1
+            logger.warning(f"Transcript writer is behind, dropping entry for session {session_id}")
+            return
+        self.appended += 1
+        self.pending.append((self.appended, (session_id, user_input_id, role, content, status, time.time())))
+        self._idle.clear()
+        self._wakeup.set()
+
+    def _write(self, batch: List[Tuple[int, Entry]]):
+        db = self._writer_db
+        with self._commit_lock:
+            db.execute("BEGIN")
+            try:
+                db.executemany(
+                    "INSERT INTO transcript (session_id, user_input_id, role, content, status, created) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [entry for _, entry in batch]
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            finally:
+                # A failed batch is dropped, so it counts as done either way
+                self.committed = batch[-1][0]
+
+    async def _write_loop(self):
+        while True:
+            await self._wakeup.wait()
+            if len(self.pending) < self.batch_size:
+                # Let more entries join this transaction
+                await asyncio.sleep(self.flush_interval)
+            self._wakeup.clear()
+            batch, self.pending = self.pending[:self.batch_size], self.pending[self.batch_size:]
+            self.inflight = batch
+            try:
+                await asyncio.to_thread(self._write, batch)
+            except sqlite3.Error as e:
+                self.dropped += len(batch)
+                logger.error(f"Failed to write {len(batch)} transcript entries: {e}")
+            self.inflight = []
+            if self.pending:
+                self._wakeup.set()
+            else:
+                self._idle.set()
+
+    async def flush(self):
+        """Wait until every queued entry has been written."""
+        if self._task is not None:
+            await self._idle.wait()
+
+    def _read(
+        self,
+        session_id: str,
+        before: Optional[int],
+        limit: int,
+        unwritten: List[Tuple[int, Entry]]
+    ) -> Tuple[List[tuple], List[Entry]]:
+        """Committed rows of a page, plus those of the unwritten entries that are still not committed."""
+        with self._reader_lock, self._commit_lock:
+            rows = self._reader_db.execute(
+                "SELECT id, user_input_id, role, content, status, created FROM transcript "
+                "WHERE session_id = ? AND id < ? ORDER BY id DESC LIMIT ?",
+                (session_id, before if before is not None else 2 ** 63 - 1, limit)
+            ).fetchall()
+            committed = self.committed
+        return rows, [entry for seq, entry in unwritten if seq > committed]
+
+    async def page(
+        self,
+        session_id: str,
+        before: Optional[int] = None,
+        limit: int = settings.TRANSCRIPT_PAGE_SIZE
+    ) -> Tuple[List[dict], Optional[int]]:
+        """Return up to limit entries older than the `before` cursor, oldest first.
+
+        The second value is the cursor for the next (older) page, or None when
+        the start of the conversation was reached. The newest page also carries
+        the entries the writer has not committed yet; they have no id.
+        """
+        if self._task is None:
+            return [], None
+        limit = max(1, min(limit, settings.TRANSCRIPT_PAGE_SIZE))
+        unwritten = []
+        if before is None:
+            # Entries still waiting for the writer belong on the newest page
+            unwritten = [item for item in self.inflight + self.pending if item[1][0] == session_id]
+        rows, unwritten = await asyncio.to_thread(self._read, session_id, before, limit, unwritten)
+        entries = [
+            {
+                "id": row[0],
+                "user_input_id": row[1],
+                "role": row[2],
+                "content": row[3],
+                "status": row[4],
+                "created": row[5]
+            }
+            for row in reversed(rows)
+        ]
+        entries.extend(
+            {
+                "id": None,
+                "user_input_id": entry[1],
+                "role": entry[2],
+                "content": entry[3],
+                "status": entry[4],
+                "created": entry[5]
+            }
+            for entry in unwritten
+        )
+        cursor = entries[0]["id"] if len(rows) == limit else None
+        return entries, cursor
+
+# Global transcript store instance
+transcript_store = TranscriptStore(settings.TRANSCRIPT_PATH or None)
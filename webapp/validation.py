@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from . import settings
+from .agent_pool import hash_api_key
+from .config import validate_api_key
+
+logger = logging.getLogger(__name__)
+
+ValidationResult = Tuple[bool, str]
+ValidationKey = Tuple[str, str]
+
+class KeyValidator:
+    """Caches API key validation results per (provider, key hash).
+
+    Successful checks are kept for ttl seconds and failures for the shorter
+    negative_ttl. Concurrent validations of the same key share one in-flight
+    provider check.
+    """
+
+    def __init__(
+        self,
+        ttl: float = settings.VALIDATION_TTL,
+        negative_ttl: float = settings.VALIDATION_NEGATIVE_TTL,
+        max_entries: int = settings.VALIDATION_MAX_ENTRIES,
+        check: Callable[[str, str], Awaitable[ValidationResult]] = validate_api_key
+    ):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.check = check
+        # key -> (expires_at, valid, error)
+        self.results: Dict[ValidationKey, Tuple[float, bool, str]] = {}
+        self.in_flight: Dict[ValidationKey, asyncio.Task] = {}
+
+    def cached(self, provider: str, api_key: str) -> Optional[ValidationResult]:
+        """The cached result for a key, or None if it has none that is still fresh."""
+        cached = self.results.get((provider.lower(), hash_api_key(api_key)))
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1], cached[2]
+        return None
+
+    def record(self, provider: str, api_key: str, is_valid: bool, error_msg: str = ""):
+        """Cache the outcome of a real request made with a key, saving a separate check."""
+        ttl = self.ttl if is_valid else self.negative_ttl
+        self._prune()
+        self.results[(provider.lower(), hash_api_key(api_key))] = (time.monotonic() + ttl, is_valid, error_msg)
+
+    async def validate(self, provider: str, api_key: str) -> ValidationResult:
+        """Validate an API key, reusing a cached or in-flight result when possible."""
+        cached = self.cached(provider, api_key)
+        if cached is not None:
+            return cached
+
+        key = (provider.lower(), hash_api_key(api_key))
+
+        task = self.in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._check(key, provider, api_key))
+            self.in_flight[key] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        # Shielded, so one caller going away does not cancel the check for the others
+        return await asyncio.shield(task)
+
+    async def _check(self, key: ValidationKey, provider: str, api_key: str) -> ValidationResult:
+        is_valid, error_msg = await self.check(provider, api_key)
+        self.record(provider, api_key, is_valid, error_msg)
+        return is_valid, error_msg
+
+    def _prune(self):
+        if len(self.results) < self.max_entries:
+            return
+        now = time.monotonic()
+        for key in [key for key, entry in self.results.items() if entry[0] <= now]:
+            del self.results[key]
+        # Still full: drop the entries closest to expiry
+        while len(self.results) >= self.max_entries:
+            del self.results[min(self.results, key=lambda k: self.results[k][0])]
+
+    def invalidate(self, provider: str, api_key: str):
+        """Forget the cached result for a key, e.g. once it is replaced."""
+        self.results.pop((provider.lower(), hash_api_key(api_key)), None)
+
+# Global key validator instance
+key_validator = KeyValidator()
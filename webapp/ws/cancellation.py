@@ -0,0 +1,60 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+async def _race(awaitable: Awaitable, cancel_wait: asyncio.Future):
+    """Run an awaitable until it finishes or the cancel future fires.
+
+    Returns (True, result) when it finished, or (False, None) when it was
+    cancelled; a cancelled awaitable is fully unwound before returning.
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        await asyncio.wait({task, cancel_wait}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        # Unwind the awaitable too, so the caller can close what it was reading
+        task.cancel()
+        await asyncio.wait({task})
+        raise
+    if task.done():
+        return True, task.result()
+    task.cancel()
+    await asyncio.wait({task})
+    return False, None
+
+async def cancellable_stream(
+    open_stream: Callable[[], Awaitable[AsyncIterator[str]]],
+    cancel_event: asyncio.Event
+) -> AsyncIterator[str]:
+    """Open an agent stream and yield its tokens until the cancel event is set.
+
+    Both the initial provider request and every wait for the next token race
+    against the cancel event, so a cancellation closes the upstream stream
+    right away instead of after the next token arrives.
+    """
+    cancel_wait = asyncio.ensure_future(cancel_event.wait())
+    stream = None
+    try:
+        finished, stream = await _race(open_stream(), cancel_wait)
+        if not finished:
+            return
+        iterator = stream.__aiter__()
+        while True:
+            try:
+                finished, token = await _race(iterator.__anext__(), cancel_wait)
+            except StopAsyncIteration:
+                return
+            if not finished:
+                return
+            yield token
+    finally:
+        cancel_wait.cancel()
+        aclose = getattr(stream, "aclose", None)
+        if aclose is not None:
+            try:
+                # Release the upstream provider connection
+                await aclose()
+            except Exception as e:
+                logger.debug(f"Error closing agent stream: {e}")
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+from contextlib import aclosing
+from typing import AsyncIterator, List, Tuple
+from .. import settings
+
+logger = logging.getLogger(__name__)
+
+class ChunkCoalescer:
+    """Merges streamed tokens into fewer, larger chunk frames.
+
+    The first token is sent right away, so coalescing never delays the time
+    to first token. Later text is flushed when it reaches max_bytes, when
+    max_delay seconds have passed since the first buffered token, or at the
+    end of the stream. A disabled coalescer passes every token through as its
+    own frame.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        max_bytes: int = settings.COALESCE_MAX_BYTES,
+        max_delay: float = settings.COALESCE_MAX_DELAY
+    ):
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+
+    async def batches(self, stream: AsyncIterator[str]) -> AsyncIterator[Tuple[str, int]]:
+        """Yield (text, token_count) batches from a token stream."""
+        if not self.enabled:
+            async for token in stream:
+                yield token, 1
+            return
+
+        async with aclosing(self._coalesce(stream)) as batches:
+            async for batch in batches:
+                yield batch
+
+    async def _coalesce(self, stream: AsyncIterator[str]) -> AsyncIterator[Tuple[str, int]]:
+        loop = asyncio.get_running_loop()
+        iterator = stream.__aiter__()
+        buffer: List[str] = []
+        buffered_bytes = 0
+        buffered_tokens = 0
+        deadline = 0.0
+        pending = None
+        first = True
+
+        try:
+            while True:
+                if pending is None:
+                    pending = asyncio.ensure_future(iterator.__anext__())
+
+                timeout = max(deadline - loop.time(), 0) if buffer else None
+                done, _ = await asyncio.wait({pending}, timeout=timeout)
+
+                if not done:
+                    # Time window elapsed while waiting for the next token
+                    yield "".join(buffer), buffered_tokens
+                    buffer, buffered_bytes, buffered_tokens = [], 0, 0
+                    continue
+
+                finished, pending = pending, None
+                try:
+                    token = finished.result()
+                except StopAsyncIteration:
+                    break
+
+                if not buffer:
+                    deadline = loop.time() + self.max_delay
+                buffer.append(token)
+                buffered_bytes += len(token)
+                buffered_tokens += 1
+
+                if first or buffered_bytes >= self.max_bytes or loop.time() >= deadline:
+                    first = False
+                    yield "".join(buffer), buffered_tokens
+                    buffer, buffered_bytes, buffered_tokens = [], 0, 0
+
+            if buffer:
+                yield "".join(buffer), buffered_tokens
+        finally:
+            if pending is not None and not pending.done():
+                # Wait for the read to unwind, so the stream can be closed after this
+                pending.cancel()
+                await asyncio.wait({pending})
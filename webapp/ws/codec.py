@@ -0,0 +1,109 @@
+import json
+import logging
+from functools import lru_cache
+from typing import Dict, Optional, Sequence, Tuple, Union
+from fastapi import WebSocket
+from starlette.websockets import WebSocketDisconnect
+
+try:
+    import msgpack
+except ImportError:  # optional dependency
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+JSON_SUBPROTOCOL = "simplex.json"
+MSGPACK_SUBPROTOCOL = "simplex.msgpack"
+
+# Same output as starlette's send_json, without re-creating the encoder per frame
+_encode_json = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), check_circular=False).encode
+
+# Pre-encoded envelope fragments for the hot chunk frame
+CHUNK_PREFIX = '{"type":"chunk","content":'
+CHUNK_METADATA = ',"metadata":{"user_input_id":'
+CHUNK_METADATA_KEYS = {"user_input_id", "tokens", "seq"}
+
+@lru_cache(maxsize=4096)
+def _encode_id(user_input_id) -> str:
+    return _encode_json(user_input_id)
+
+class Codec:
+    """Encodes outbound frames and decodes inbound messages for one subprotocol."""
+    name = ""
+    subprotocol: Optional[str] = None
+    binary = False
+
+    def encode(self, frame: dict) -> Union[str, bytes]:
+        raise NotImplementedError
+
+    def decode(self, data: Union[str, bytes]) -> dict:
+        raise NotImplementedError
+
+class JsonCodec(Codec):
+    name = "json"
+    subprotocol = JSON_SUBPROTOCOL
+
+    def encode(self, frame: dict) -> str:
+        metadata = frame.get("metadata")
+        if (
+            frame.get("type") == "chunk" and len(frame) == 3 and
+            isinstance(frame.get("content"), str) and
+            isinstance(metadata, dict) and "user_input_id" in metadata and
+            metadata.keys() <= CHUNK_METADATA_KEYS
+        ):
+            tokens = metadata.get("tokens")
+            seq = metadata.get("seq")
+            return "".join((
+                CHUNK_PREFIX,
+                _encode_json(frame["content"]),
+                CHUNK_METADATA,
+                _encode_id(metadata["user_input_id"]),
+                f',"tokens":{int(tokens)}' if tokens is not None else "",
+                f',"seq":{int(seq)}' if seq is not None else "",
+                "}}"
+            ))
+        return _encode_json(frame)
+
+    def decode(self, data: Union[str, bytes]) -> dict:
+        return json.loads(data)
+
+class MsgpackCodec(Codec):
+    name = "msgpack"
+    subprotocol = MSGPACK_SUBPROTOCOL
+    binary = True
+
+    def encode(self, frame: dict) -> bytes:
+        return msgpack.packb(frame, use_bin_type=True)
+
+    def decode(self, data: Union[str, bytes]) -> dict:
+        if isinstance(data, str):
+            return json.loads(data)  # Text frames are always JSON
+        return msgpack.unpackb(data, raw=False)
+
+JSON_CODEC = JsonCodec()
+CODECS: Dict[str, Codec] = {JSON_SUBPROTOCOL: JSON_CODEC}
+if msgpack is not None:
+    CODECS[MSGPACK_SUBPROTOCOL] = MsgpackCodec()
+
+def negotiate(requested: Sequence[str]) -> Tuple[Codec, Optional[str]]:
+    """Pick the first supported subprotocol the client asked for.
+
+    Returns the codec and the subprotocol to accept. A client that offered
+    none we support gets JSON and no subprotocol in the handshake, since
+    browsers abort a handshake that answers with one they did not offer.
+    """
+    for subprotocol in requested:
+        codec = CODECS.get(subprotocol)
+        if codec is not None:
+            return codec, subprotocol
+    return JSON_CODEC, None
+
+async def receive_frame(websocket: WebSocket, codec: Codec) -> dict:
+    """Receive and decode one client message."""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+    data = message.get("text")
+    if data is None:
+        data = message.get("bytes")
+    return codec.decode(data)
@@ -1,57 +1,267 @@
 import asyncio
 import logging
-from typing import Dict, Set
+import time
+import weakref
+from typing import Callable, Dict, List, Optional, Set
 from fastapi import WebSocket
-from starlette.websockets import WebSocketDisconnect
+from starlette.websockets import WebSocketState
+from .. import metrics, settings
+from ..sessions import session_store
+from ..state import state_backend
+from .codec import Codec, JSON_CODEC
+from .send_queue import SendQueue
 
 logger = logging.getLogger(__name__)
 
+def stream_key(session_id: str, user_input_id: str) -> str:
+    """Worker-wide ID of a stream: client IDs are only unique within a session."""
+    return f"{session_id}:{user_input_id}"
+
+class StreamRecord:
+    """Everything the manager tracks about one chat stream.
+
+    Owned by the task generating the stream; connections and the manager
+    only hold weak references to it, so a stream that ends without cleanup
+    still frees its record with its task.
+    """
+    __slots__ = (
+        "user_input_id", "session_id", "task", "connection", "cancel_event", "cancelled_at", "ended", "finalizer", "__weakref__"
+    )
+
+    def __init__(self, user_input_id: Optional[str], session_id: str, connection: Optional["Connection"]):
+        self.user_input_id = user_input_id
+        self.session_id = session_id
+        self.task = asyncio.current_task()
+        self.connection = weakref.ref(connection) if connection is not None else None
+        self.cancel_event = asyncio.Event()
+        self.cancelled_at: Optional[float] = None  # Monotonic time of the cancel request
+        self.ended = False
+        self.finalizer: Optional[weakref.finalize] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancelled_at is not None
+
+    @property
+    def key(self) -> str:
+        return stream_key(self.session_id, self.user_input_id)
+
+    def owner(self) -> Optional["Connection"]:
+        """The connection the stream currently belongs to, if it is still open."""
+        return self.connection() if self.connection is not None else None
+
+class Connection:
+    """Per-socket state: its session, send queue, tasks and streams.
+
+    Streams are namespaced per connection, so two clients that pick the
+    same user_input_id never see each other's streams; elsewhere they are
+    only found by their session and ID together.
+    """
+    __slots__ = ("websocket", "session_id", "session_used", "send_queue", "tasks", "streams", "__weakref__")
+
+    def __init__(self, websocket: WebSocket, session_id: str, send_queue: SendQueue):
+        self.websocket = websocket
+        self.session_id = session_id  # Default conversation session, minted for this connection
+        self.session_used = False
+        self.send_queue = send_queue
+        self.tasks: Set[asyncio.Task] = set()
+        self.streams: "weakref.WeakValueDictionary[str, StreamRecord]" = weakref.WeakValueDictionary()
+
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections = set()
-        self.active_streams = {}  # Map of user_input_id to cancellation flag
-        self.cancel_events: Dict[str, asyncio.Event] = {}  # Map of user_input_id to cancel event
-        self.active_tasks: Dict[WebSocket, Set[asyncio.Task]] = {}  # Track tasks per connection
+    def __init__(self, sweep_interval: float = settings.SWEEP_INTERVAL):
+        self.connections: Dict[WebSocket, Connection] = {}
+        # Latest stream per stream_key, for cancellations published by any worker
+        self.streams: "weakref.WeakValueDictionary[str, StreamRecord]" = weakref.WeakValueDictionary()
+        self.in_flight = 0  # Live stream records, including ones without an ID
+        self.sweep_interval = sweep_interval
+        self._sweeper: Optional[asyncio.Task] = None
+        self.close_handlers: List[Callable[[WebSocket], None]] = []
+        # Cancellations published by any worker
+        state_backend.on_cancel(self.cancel_stream)
+
+    def on_close(self, handler: Callable[[WebSocket], None]):
+        """Register a callback run with each closing connection before its tasks are cancelled."""
+        self.close_handlers.append(handler)
+
+    def add_connection(self, websocket: WebSocket, codec: Codec = JSON_CODEC) -> str:
+        """Add a new WebSocket connection and return its session ID."""
+        session_id = session_store.new_session_id()
+        self.connections[websocket] = Connection(websocket, session_id, SendQueue(websocket, codec))
+        metrics.connections.set(value=len(self.connections))
+        return session_id
+
+    def is_connected(self, websocket: WebSocket) -> bool:
+        return websocket in self.connections
+
+    async def send(self, websocket: WebSocket, frame: dict) -> bool:
+        """Queue a frame for a connection. Returns False if the client is gone."""
+        connection = self.connections.get(websocket)
+        if connection is None:
+            return False
+        return await connection.send_queue.send(frame)
+
+    def get_session_id(self, websocket: WebSocket, requested: str = None) -> str:
+        """Resolve the conversation session for a message.
+
+        Clients may continue an earlier session (e.g. after a reconnect) by
+        sending its ID; otherwise the connection's own session is used.
+        """
+        if isinstance(requested, str) and 0 < len(requested) <= 64:
+            return requested
+        return self.connections[websocket].session_id
 
-    def add_connection(self, websocket: WebSocket):
-        """Add a new WebSocket connection."""
-        self.active_connections.add(websocket)
-        self.active_tasks[websocket] = set()
+    def claim_new_session(self, websocket: WebSocket, session_id: str) -> bool:
+        """True the first time the session minted for this connection is used: it has no history yet."""
+        connection = self.connections.get(websocket)
+        if connection is None or connection.session_used or session_id != connection.session_id:
+            return False
+        connection.session_used = True
+        return True
+
+    def add_task(self, websocket: WebSocket, task: asyncio.Task):
+        """Tie a task to a connection; it is cancelled when the connection goes away."""
+        connection = self.connections.get(websocket)
+        if connection is not None:
+            connection.tasks.add(task)
+
+    def discard_task(self, websocket: WebSocket, task: asyncio.Task):
+        connection = self.connections.get(websocket)
+        if connection is not None:
+            connection.tasks.discard(task)
 
     def remove_connection(self, websocket: WebSocket):
         """Remove and cleanup a WebSocket connection."""
-        self.active_connections.remove(websocket)
+        if websocket not in self.connections:
+            return
+        for handler in self.close_handlers:
+            try:
+                handler(websocket)
+            except Exception as e:
+                logger.error(f"Connection close handler failed: {e}")
+        connection = self.connections.pop(websocket)
+        connection.send_queue.close()
+        metrics.connections.set(value=len(self.connections))
         # Cancel all tasks for this connection
-        if websocket in self.active_tasks:
-            for task in self.active_tasks[websocket]:
-                if not task.done():
-                    task.cancel()
-            del self.active_tasks[websocket]
-
-    def start_stream(self, user_input_id: str):
-        """Track a new active stream."""
-        self.active_streams[user_input_id] = False
-        self.cancel_events[user_input_id] = asyncio.Event()
-
-    def cancel_stream(self, user_input_id: str):
-        """Mark a stream as cancelled."""
-        if user_input_id in self.active_streams:
-            self.active_streams[user_input_id] = True
-            if user_input_id in self.cancel_events:
-                self.cancel_events[user_input_id].set()
-            logger.info(f"Stream cancelled for user input ID: {user_input_id}")
-
-    def is_cancelled(self, user_input_id: str) -> bool:
-        """Check if a stream has been cancelled."""
-        return self.active_streams.get(user_input_id, False)
-
-    def end_stream(self, user_input_id: str):
-        """Clean up a completed stream."""
-        if user_input_id in self.active_streams:
-            del self.active_streams[user_input_id]
-            if user_input_id in self.cancel_events:
-                del self.cancel_events[user_input_id]
-            logger.info(f"Stream ended for user input ID: {user_input_id}")
+        for task in connection.tasks:
+            if not task.done():
+                task.cancel()
+        connection.tasks.clear()
+        connection.streams.clear()
+
+    def find_stream(self, websocket: WebSocket, user_input_id: str) -> Optional[StreamRecord]:
+        """A running stream of this connection."""
+        connection = self.connections.get(websocket)
+        return connection.streams.get(user_input_id) if connection is not None else None
+
+    def start_stream(self, websocket: WebSocket, session_id: str, user_input_id: Optional[str]) -> StreamRecord:
+        """Track a new stream of a connection, owned by the current task.
+
+        A stream without an ID cannot be cancelled or resumed, so it is
+        counted but not indexed.
+        """
+        connection = self.connections.get(websocket)
+        record = StreamRecord(user_input_id, session_id, connection)
+        if user_input_id is not None:
+            if connection is not None:
+                connection.streams[user_input_id] = record
+            self.streams[record.key] = record
+        # Count the stream out even if its task dies without calling end_stream
+        record.finalizer = weakref.finalize(record, self._forget_stream)
+        self.in_flight += 1
+        metrics.streams_in_flight.set(value=self.in_flight)
+        return record
+
+    def attach_stream(self, websocket: WebSocket, record: StreamRecord):
+        """Move a running stream to another connection, e.g. one that resumed it."""
+        connection = self.connections.get(websocket)
+        if connection is None or record.ended:
+            return
+        previous = record.owner()
+        if previous is not None:
+            if previous.streams.get(record.user_input_id) is record:
+                del previous.streams[record.user_input_id]
+            previous.tasks.discard(record.task)
+        record.connection = weakref.ref(connection)
+        if record.user_input_id is not None:
+            connection.streams[record.user_input_id] = record
+        if record.task is not None:
+            connection.tasks.add(record.task)
+
+    def cancel(self, record: StreamRecord) -> bool:
+        """Cancel a stream. Returns False if it already ended."""
+        if record.ended:
+            return False
+        if not record.cancelled:
+            metrics.cancellations_total.inc()
+            record.cancelled_at = time.monotonic()
+            record.cancel_event.set()
+            logger.info(f"Stream cancelled for user input ID: {record.user_input_id}")
+        return True
+
+    def cancel_connection_stream(self, websocket: WebSocket, user_input_id: str) -> bool:
+        """Cancel a stream of this connection. Returns False if it has none by that ID."""
+        record = self.find_stream(websocket, user_input_id)
+        return record is not None and self.cancel(record)
+
+    def cancel_stream(self, key: str) -> bool:
+        """Cancel a stream running in this worker by its stream_key. Returns False if it isn't here."""
+        record = self.streams.get(key)
+        return record is not None and self.cancel(record)
+
+    def end_stream(self, record: StreamRecord):
+        """Clean up a finished stream."""
+        if record.ended:
+            return
+        record.ended = True
+        record.finalizer.detach()
+        connection = record.owner()
+        if connection is not None and connection.streams.get(record.user_input_id) is record:
+            del connection.streams[record.user_input_id]
+        if self.streams.get(record.key) is record:
+            del self.streams[record.key]
+        self.in_flight -= 1
+        metrics.streams_in_flight.set(value=self.in_flight)
+        logger.info(f"Stream ended for user input ID: {record.user_input_id}")
+
+    def _forget_stream(self):
+        self.in_flight -= 1
+        metrics.streams_in_flight.set(value=self.in_flight)
+
+    def sweep(self) -> Dict[str, int]:
+        """Drop state that outlived its owner: closed sockets, finished tasks and streams."""
+        swept = {"connections": 0, "tasks": 0, "streams": 0}
+        for websocket, connection in list(self.connections.items()):
+            # The endpoint removes a connection as soon as it sees the disconnect
+            if websocket.client_state == WebSocketState.DISCONNECTED:
+                self.remove_connection(websocket)
+                swept["connections"] += 1
+                continue
+            finished = {task for task in connection.tasks if task.done()}
+            connection.tasks -= finished
+            swept["tasks"] += len(finished)
+        for record in list(self.streams.values()):
+            if record.task is not None and record.task.done() and not record.ended:
+                self.end_stream(record)
+                swept["streams"] += 1
+        for kind, count in swept.items():
+            if count:
+                metrics.swept_total.inc(kind, amount=count)
+                logger.warning(f"Swept {count} leaked {kind}")
+        return swept
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self.sweep()
+
+    async def start(self):
+        if self.sweep_interval > 0:
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
 
 # Global connection manager instance
 manager = ConnectionManager()
@@ -1,92 +1,234 @@
 import logging
-import traceback
+from contextlib import aclosing
 from fastapi import WebSocket
-from joao import AsyncAgent
-from ..config import load_config, get_provider_info
-from .connection import manager
+from .. import metrics, settings
+from ..agent_pool import hash_api_key
+from ..config import config_service, get_provider_info, ROUTING_KEYS, SYSTEM_PROMPT
+from ..providers import Backend, provider_router
+from ..response_cache import response_cache
+from ..sessions import session_store
+from ..state import state_backend
+from ..telemetry import StreamTelemetry
+from ..transcripts import ROLE_ASSISTANT, ROLE_USER, transcript_store
+from .cancellation import cancellable_stream
+from .coalescer import ChunkCoalescer
+from ..validation import key_validator
+from .connection import manager, stream_key
+from .protocol import ChatFrame, ConfigFrame, Frame, HistoryFrame, ResumeFrame, message_router
+from .resume import resumable_streams
+from .scheduler import scheduler, QueueCancelled, QueueFull
 
 logger = logging.getLogger(__name__)
 
-# System prompt for the agent
-SYSTEM_PROMPT = """You are a helpful AI assistant."""
-
-async def handle_chat_message(websocket: WebSocket, data: dict):
+@message_router.register("message", ChatFrame, background=True)
+async def handle_chat_message(websocket: WebSocket, frame: ChatFrame):
     """Handle a chat message."""
-    config = load_config()
+    config = await config_service.snapshot()
     if not config:
-        await websocket.send_json({
+        metrics.errors_total.inc("configuration")
+        await manager.send(websocket, {
             "type": "error",
             "content": "AI not configured",
             "metadata": {"error_type": "configuration"}
         })
         return
 
-    agent = AsyncAgent(
-        SYSTEM_PROMPT,
-        api_key=config["api_key"],
-        tenant_prefix=config["provider"].upper()
-    )
-
-    metadata = data.get("metadata", {})
-    user_input_id = metadata.get("user_input_id")
-    user_message = data["content"]
+    metadata = frame.metadata
+    user_input_id = metadata.user_input_id
+    user_message = frame.content
+    session_id = manager.get_session_id(websocket, metadata.session_id)
+    session = await session_store.load(session_id, new=manager.claim_new_session(websocket, session_id))
+    prompt = session.render_prompt(user_message)
+    model = get_provider_info(config["provider"], config["api_key"])["model"]
+    cache_key = response_cache.make_key(config["provider"], model, SYSTEM_PROMPT, user_message, session.history_hash())
+    response_parts = []
+    # Clients opt in to receiving coalesced chunk frames
+    coalescer = ChunkCoalescer(enabled=metadata.coalesce)
 
     logger.info(f"Sending message to agent (ID: {user_input_id}): {user_message[:100]}...")
 
     # Send acknowledgment
-    await websocket.send_json({
+    await manager.send(websocket, {
         "type": "ack",
         "metadata": {"user_input_id": user_input_id}
     })
+    transcript_store.append(session_id, user_input_id, ROLE_USER, user_message)
 
-    # Start tracking the stream
-    manager.start_stream(user_input_id)
+    telemetry = StreamTelemetry(user_input_id, config["provider"])
+
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        await replay_response(websocket, user_input_id, cached, coalescer.enabled, telemetry)
+        await session_store.add_exchange(session_id, user_message, cached)
+        transcript_store.append(session_id, user_input_id, ROLE_ASSISTANT, cached, "complete")
+        return
+
+    # Start tracking the stream; it can outlive this connection for the resume grace period
+    record = manager.start_stream(websocket, session_id, user_input_id)
+    stream_buffer = resumable_streams.open(websocket, record)
+    status = "error"
+
+    async def notify_queued(position: int, queued: int):
+        await resumable_streams.deliver(stream_buffer, {
+            "type": "queued",
+            "content": {"position": position, "queued": queued},
+            "metadata": {"user_input_id": user_input_id}
+        })
 
     try:
-        # Process message using streaming
-        stream = await agent.request(user_message, stream=True)
-        try:
-            async for token in stream:
-                # Check if cancelled
-                if manager.is_cancelled(user_input_id):
-                    logger.info(f"Stream cancelled, stopping for user input ID: {user_input_id}")
-                    break
-
-                logger.info(f"Received token from agent (ID: {user_input_id}): {token[:50]}...")
-                await websocket.send_json({
-                    "type": "chunk",
-                    "content": token,
-                    "metadata": {"user_input_id": user_input_id}
-                })
-
-        except Exception as e:
-            logger.error(f"Error in stream processing: {e}")
-            if not manager.is_cancelled(user_input_id):
-                raise  # Only re-raise if not cancelled
-        finally:
-            # Clean up stream state
-            manager.end_stream(user_input_id)
-            if not manager.is_cancelled(user_input_id):
-                await websocket.send_json({
-                    "type": "end_stream",
-                    "metadata": {"user_input_id": user_input_id}
-                })
+        def on_selected(backend: Backend):
+            telemetry.provider = backend.provider
+
+        # Wait for a scheduler slot, then stream the response from the routed provider backend
+        async with scheduler.slot(
+            websocket,
+            hash_api_key(config["api_key"]),
+            on_queued=notify_queued,
+            cancel_event=record.cancel_event
+        ):
+            telemetry.record_admitted()
+            # Races backend selection and the stream against cancel_stream, closing it as soon as it is cancelled
+            stream = cancellable_stream(
+                lambda: provider_router.open_stream(config, SYSTEM_PROMPT, prompt, on_selected),
+                record.cancel_event
+            )
+            try:
+                # Closed outermost first, so leaving early, e.g. when the client is gone,
+                # closes the upstream stream before this handler moves on
+                async with (
+                    aclosing(stream),
+                    aclosing(telemetry.observe(stream)) as observed,
+                    aclosing(coalescer.batches(observed)) as batches
+                ):
+                    async for token, token_count in batches:
+                        # Check if cancelled
+                        if record.cancelled:
+                            logger.info(f"Stream cancelled, stopping for user input ID: {user_input_id}")
+                            break
 
+                        chunk_metadata = {"user_input_id": user_input_id}
+                        if coalescer.enabled:
+                            chunk_metadata["tokens"] = token_count
+                        sent = await resumable_streams.send(stream_buffer, {
+                            "type": "chunk",
+                            "content": token,
+                            "metadata": chunk_metadata
+                        })
+                        if not sent:
+                            logger.info(f"Client gone, stopping stream for user input ID: {user_input_id}")
+                            status = "disconnected"
+                            break
+                        telemetry.record_frame()
+                        response_parts.append(token)
+                if stream_buffer.abandoned:
+                    status = "disconnected"
+                elif record.cancelled:
+                    status = "cancelled"
+                elif status != "disconnected":
+                    status = "complete"
+
+            except Exception as e:
+                logger.error(f"Error in stream processing: {e}")
+                if not record.cancelled:
+                    raise  # Only re-raise if not cancelled
+                status = "disconnected" if stream_buffer.abandoned else "cancelled"
+            finally:
+                # Keep the exchange, including partial answers, in the session history
+                response = "".join(response_parts)
+                await session_store.add_exchange(session_id, user_message, response)
+                if response:
+                    transcript_store.append(session_id, user_input_id, ROLE_ASSISTANT, response, status)
+                if status == "complete":
+                    response_cache.put(cache_key, response)
+                # Clean up stream state
+                telemetry.cancelled_at = record.cancelled_at
+                manager.end_stream(record)
+                if not record.cancelled:
+                    await resumable_streams.finish(stream_buffer, {
+                        "type": "end_stream",
+                        "metadata": {"user_input_id": user_input_id}
+                    })
+
+    except QueueCancelled:
+        # Cancelled before it started; the cancel handler already confirmed it
+        status = "disconnected" if stream_buffer.abandoned else "cancelled"
+        manager.end_stream(record)
+    except QueueFull:
+        status = "rejected"
+        manager.end_stream(record)
+        metrics.errors_total.inc("busy")
+        await resumable_streams.finish(stream_buffer, {
+            "type": "error",
+            "content": "Server is busy, please try again later",
+            "metadata": {
+                "error_type": "busy",
+                "user_input_id": user_input_id
+            }
+        })
     except Exception as e:
         error_msg = f"Error processing message: {str(e)}"
         logger.error(error_msg)
-        await websocket.send_json({
+        metrics.errors_total.inc("agent")
+        await resumable_streams.finish(stream_buffer, {
             "type": "error",
             "content": error_msg,
+            "metadata": {
+                "error_type": "agent",
+                "user_input_id": user_input_id
+            }
+        })
+    finally:
+        resumable_streams.release(stream_buffer)
+        telemetry.finish(status)
+
+async def replay_response(websocket: WebSocket, user_input_id: str, response: str, coalesce: bool, telemetry: StreamTelemetry):
+    """Send a cached response as regular chunk frames."""
+    size = max(settings.COALESCE_MAX_BYTES, 1)
+    for start in range(0, len(response), size):
+        chunk = response[start:start + size]
+        telemetry.record_token(chunk)
+        chunk_metadata = {"user_input_id": user_input_id, "cached": True}
+        if coalesce:
+            chunk_metadata["tokens"] = 1
+        if not await manager.send(websocket, {
+            "type": "chunk",
+            "content": chunk,
+            "metadata": chunk_metadata
+        }):
+            telemetry.finish("disconnected")
+            return
+        telemetry.record_frame()
+    await manager.send(websocket, {
+        "type": "end_stream",
+        "metadata": {"user_input_id": user_input_id}
+    })
+    telemetry.finish("cached")
+
+@message_router.register("cancel_stream")
+async def handle_cancel_request(websocket: WebSocket, frame: Frame):
+    """Cancel a stream; handled in the receive loop so it is never queued behind other work."""
+    metadata = frame.metadata
+    user_input_id = metadata.user_input_id
+    if user_input_id:
+        logger.info(f"Canceling stream for user input ID: {user_input_id}")
+        if not manager.cancel_connection_stream(websocket, user_input_id):
+            # Otherwise only a stream of the requester's session, e.g. one started before a reconnect
+            key = stream_key(manager.get_session_id(websocket, metadata.session_id), user_input_id)
+            if not manager.cancel_stream(key):
+                # The stream may be running in another worker
+                state_backend.publish_cancel(key)
+        await manager.send(websocket, {
+            "type": "stream_cancelled",
             "metadata": {"user_input_id": user_input_id}
         })
 
-async def handle_config_request(websocket: WebSocket):
+@message_router.register("get_config")
+async def handle_config_request(websocket: WebSocket, frame: Frame):
     """Handle get config request."""
-    config = load_config()
+    config = await config_service.snapshot()
     if config:
         provider_info = get_provider_info(config["provider"], config["api_key"])
-        await websocket.send_json({
+        await manager.send(websocket, {
             "type": "config",
             "content": {
                 "configured": True,
@@ -95,7 +237,119 @@ async def handle_config_request(websocket: WebSocket):
             }
         })
     else:
-        await websocket.send_json({
+        await manager.send(websocket, {
             "type": "config",
             "content": {"configured": False}
         })
+
+@message_router.register("validate_config", ConfigFrame)
+async def handle_validate_config(websocket: WebSocket, frame: ConfigFrame):
+    """Handle validate config request."""
+    provider = frame.content.provider
+    api_key = frame.content.api_key
+    is_valid, error_msg = await key_validator.validate(provider, api_key)
+    
+    if is_valid:
+        await manager.send(websocket, {
+            "type": "validation_result",
+            "content": {
+                "valid": True,
+                "provider_info": get_provider_info(provider, api_key)
+            }
+        })
+    else:
+        await manager.send(websocket, {
+            "type": "validation_result",
+            "content": {
+                "valid": False,
+                "error": error_msg
+            }
+        })
+
+@message_router.register("set_config", ConfigFrame)
+async def handle_set_config(websocket: WebSocket, frame: ConfigFrame):
+    """Handle set config request."""
+    config = frame.content.model_dump()
+    current = await config_service.snapshot() or {}
+    # The dialog only edits the primary backend; keep the routing setup
+    for key in ROUTING_KEYS:
+        if key in current and key not in config:
+            config[key] = current[key]
+    if await config_service.save(config):
+        # A replaced key may be revoked later; check it afresh if it comes back
+        replaced = (current.get("provider"), current.get("api_key"))
+        if all(replaced) and replaced != (config["provider"], config["api_key"]):
+            key_validator.invalidate(*replaced)
+        await manager.send(websocket, {
+            "type": "config_set",
+            "content": {
+                "success": True,
+                "provider_info": get_provider_info(config["provider"], config["api_key"])
+            }
+        })
+    else:
+        await manager.send(websocket, {
+            "type": "config_set",
+            "content": {
+                "success": False,
+                "error": "Failed to save configuration"
+            }
+        })
+
+@message_router.register("delete_config")
+async def handle_delete_config(websocket: WebSocket, frame: Frame):
+    """Handle delete config request."""
+    try:
+        current = await config_service.snapshot() or {}
+        await config_service.delete()
+        if current.get("provider") and current.get("api_key"):
+            key_validator.invalidate(current["provider"], current["api_key"])
+        await manager.send(websocket, {
+            "type": "config_deleted",
+            "content": {"success": True}
+        })
+    except Exception as e:
+        await manager.send(websocket, {
+            "type": "config_deleted",
+            "content": {
+                "success": False,
+                "error": str(e)
+            }
+        })
+
+@message_router.register("history", HistoryFrame)
+async def handle_history_request(websocket: WebSocket, frame: HistoryFrame):
+    """Send one page of a session's transcript, newest page first."""
+    metadata = frame.metadata
+    session_id = manager.get_session_id(websocket, metadata.session_id)
+    entries, cursor = await transcript_store.page(
+        session_id,
+        before=metadata.before,
+        limit=metadata.limit if metadata.limit is not None else settings.TRANSCRIPT_PAGE_SIZE
+    )
+    await manager.send(websocket, {
+        "type": "history",
+        "content": {
+            "session_id": session_id,
+            "entries": entries,
+            "before": cursor
+        }
+    })
+
+@message_router.register("resume", ResumeFrame)
+async def handle_resume_request(websocket: WebSocket, frame: ResumeFrame):
+    """Reattach a stream that outlived its connection and replay what the client missed."""
+    metadata = frame.metadata
+    user_input_id = metadata.user_input_id
+    session_id = manager.get_session_id(websocket, metadata.session_id)
+    resumed = await resumable_streams.resume(websocket, user_input_id, session_id, metadata.last_seq)
+    if not resumed:
+        metrics.errors_total.inc("resume")
+        await manager.send(websocket, {
+            "type": "error",
+            "content": "The stream can no longer be resumed",
+            "metadata": {
+                "error_type": "resume",
+                "user_input_id": user_input_id
+            }
+        })
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import traceback
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional, Type
+from fastapi import WebSocket
+from pydantic import BaseModel, ConfigDict, ValidationError
+from .. import metrics
+from .connection import manager
+
+"""
+Inbound WebSocket protocol: one pydantic model per message type and a table
+of registered handlers.
+
+Every frame is validated once against its type's model before its handler
+runs, so handlers read typed fields instead of checking the raw dict.
+"""
+
+
+logger = logging.getLogger(__name__)
+
+class Metadata(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    user_input_id: Optional[str] = None
+    session_id: Optional[str] = None
+
+class Frame(BaseModel):
+    """A client message without content."""
+    model_config = ConfigDict(extra="allow")
+
+    type: str
+    metadata: Metadata = Metadata()
+
+class ChatMetadata(Metadata):
+    coalesce: bool = False
+
+class ChatFrame(Frame):
+    content: str
+    metadata: ChatMetadata = ChatMetadata()
+
+class ProviderConfig(BaseModel):
+    # The stored configuration may carry routing keys besides the primary backend
+    model_config = ConfigDict(extra="allow")
+
+    provider: str
+    api_key: str
+
+class ConfigFrame(Frame):
+    content: ProviderConfig
+
+class HistoryMetadata(Metadata):
+    before: Optional[int] = None
+    limit: Optional[int] = None
+
+class HistoryFrame(Frame):
+    metadata: HistoryMetadata = HistoryMetadata()
+
+class ResumeMetadata(Metadata):
+    user_input_id: str
+    last_seq: int = 0
+
+class ResumeFrame(Frame):
+    metadata: ResumeMetadata
+
+Handler = Callable[[WebSocket, Any], Awaitable[None]]
+
+class Route(NamedTuple):
+    handler: Handler
+    model: Type[Frame]
+    background: bool
+
+class MessageRouter:
+    """Dispatches client messages to the handler registered for their type.
+
+    Background handlers run in their own task, tracked per connection, so
+    the receive loop can read the next message (e.g. a cancel) right away.
+    """
+
+    def __init__(self):
+        self.routes: Dict[str, Route] = {}
+
+    def register(self, message_type: str, model: Type[Frame] = Frame, background: bool = False):
+        """Decorator registering the handler of a message type."""
+        def decorator(handler: Handler) -> Handler:
+            self.routes[message_type] = Route(handler, model, background)
+            return handler
+        return decorator
+
+    async def reject(self, websocket: WebSocket, error: str, metadata: Optional[dict] = None):
+        metrics.errors_total.inc("invalid_message")
+        await manager.send(websocket, {
+            "type": "error",
+            "content": error,
+            "metadata": {"error_type": "invalid_message", **(metadata or {})}
+        })
+
+    async def dispatch(self, websocket: WebSocket, data: Any):
+        """Validate a decoded message and run its handler."""
+        route = self.routes.get(data.get("type")) if isinstance(data, dict) else None
+        if route is None:
+            await self.reject(websocket, "Unknown message type")
+            return
+        try:
+            frame = route.model.model_validate(data)
+        except ValidationError as e:
+            metadata = data.get("metadata")
+            user_input_id = metadata.get("user_input_id") if isinstance(metadata, dict) else None
+            await self.reject(websocket, f"Invalid {data['type']} frame: {e.errors()[0]['msg']}", {"user_input_id": user_input_id})
+            return
+
+        if route.background:
+            task = asyncio.create_task(route.handler(websocket, frame))
+            manager.add_task(websocket, task)
+            task.add_done_callback(lambda t: manager.discard_task(websocket, t))
+            return
+
+        try:
+            await route.handler(websocket, frame)
+        except Exception as e:
+            error_detail = f"Error processing message: {str(e)}\nTraceback:\n{traceback.format_exc()}"
+            logger.error(error_detail)
+            metrics.errors_total.inc("processing")
+            await manager.send(websocket, {
+                "type": "error",
+                "content": str(e),
+                "metadata": {"error_type": "processing"}
+            })
+
+# Global message router instance
+message_router = MessageRouter()
@@ -0,0 +1,179 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+from fastapi import WebSocket
+from .. import settings
+from .connection import manager, stream_key, StreamRecord
+
+logger = logging.getLogger(__name__)
+
+class StreamBuffer:
+    """The recent chunk frames of one stream, numbered so a client can resume.
+
+    Frames are kept in a ring of max_frames; a client that fell further behind
+    than that cannot resume.
+    """
+    __slots__ = ("user_input_id", "record", "session_id", "websocket", "task", "frames", "seq", "final", "abandoned", "timer")
+
+    def __init__(self, record: StreamRecord, websocket: Optional[WebSocket], max_frames: int):
+        self.user_input_id = record.user_input_id
+        self.record = record  # Keeps the stream's record alive for late resumes
+        self.session_id = record.session_id
+        self.websocket = websocket
+        self.task = record.task
+        self.frames: Deque[Tuple[int, dict]] = deque(maxlen=max_frames)
+        self.seq = 0
+        self.final: Optional[dict] = None  # end_stream or error frame, once finished
+        self.abandoned = False  # no client came back within the grace period
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.final is not None
+
+    def first_seq(self) -> int:
+        return self.frames[0][0] if self.frames else self.seq + 1
+
+class ResumableStreams:
+    """Keeps streams running for a grace period after their client disconnects.
+
+    While detached, a stream keeps reading from the provider into its ring
+    buffer. A client that reconnects within the grace period sends `resume`
+    with the last sequence number it received and gets the missed frames, then
+    the live stream. Without a resume the stream is cancelled when the grace
+    period ends; a grace period of 0 cancels streams on disconnect as before.
+    """
+
+    def __init__(
+        self,
+        grace_period: float = settings.RESUME_GRACE_PERIOD,
+        max_frames: int = settings.RESUME_BUFFER_FRAMES
+    ):
+        self.grace_period = grace_period
+        self.max_frames = max_frames
+        # By stream_key: client IDs are only unique within a session
+        self.buffers: Dict[str, StreamBuffer] = {}
+        manager.on_close(self.detach)
+
+    def open(self, websocket: WebSocket, record: StreamRecord) -> StreamBuffer:
+        """Start buffering a stream for the current task.
+
+        A stream without a user_input_id cannot be resumed; it is buffered
+        but not registered, so it ends with its connection.
+        """
+        buffer = StreamBuffer(record, websocket, self.max_frames)
+        if record.user_input_id is not None:
+            self.buffers[record.key] = buffer
+        if not manager.is_connected(websocket):
+            self._detach(buffer)
+        return buffer
+
+    async def send(self, buffer: StreamBuffer, frame: dict) -> bool:
+        """Number and buffer a chunk frame, then deliver it to the attached client.
+
+        Returns False once the stream has no client and will not get one back.
+        """
+        buffer.seq += 1
+        frame["metadata"]["seq"] = buffer.seq
+        buffer.frames.append((buffer.seq, frame))
+        await self.deliver(buffer, frame)
+        return not buffer.abandoned
+
+    async def deliver(self, buffer: StreamBuffer, frame: dict):
+        """Send a frame to the attached client, if any, without buffering it."""
+        websocket = buffer.websocket
+        if websocket is not None and not await manager.send(websocket, frame):
+            if buffer.websocket is websocket:
+                self._detach(buffer)
+
+    async def finish(self, buffer: StreamBuffer, frame: dict):
+        """Send the stream's final frame; it is replayed to a client that resumes later."""
+        buffer.final = frame
+        await self.deliver(buffer, frame)
+
+    def release(self, buffer: StreamBuffer):
+        """Called when the stream task ends; keeps a finished, detached stream for late resumes."""
+        if buffer.websocket is not None:
+            # The task may have moved to a resuming connection's task set
+            manager.discard_task(buffer.websocket, buffer.task)
+        if buffer.finished and buffer.websocket is None and not buffer.abandoned and self.grace_period > 0:
+            return  # The grace timer removes it
+        self._remove(buffer)
+
+    def _remove(self, buffer: StreamBuffer):
+        if buffer.timer is not None:
+            buffer.timer.cancel()
+            buffer.timer = None
+        if self.buffers.get(buffer.record.key) is buffer:
+            del self.buffers[buffer.record.key]
+
+    def _detach(self, buffer: StreamBuffer):
+        buffer.websocket = None
+        if self.grace_period <= 0:
+            # Not resumable; the handler stops once it sees the stream abandoned
+            buffer.abandoned = True
+            self._remove(buffer)
+            return
+        if buffer.timer is None:
+            loop = asyncio.get_running_loop()
+            buffer.timer = loop.call_later(self.grace_period, self._expire, buffer)
+            logger.info(f"Stream {buffer.user_input_id} detached, resumable for {self.grace_period}s")
+
+    def _expire(self, buffer: StreamBuffer):
+        buffer.timer = None
+        if not buffer.finished:
+            logger.info(f"No client resumed stream {buffer.user_input_id}, cancelling it")
+            buffer.abandoned = True
+            if not manager.cancel(buffer.record) and buffer.task is not None:
+                # Not streaming yet, e.g. still waiting for a scheduler slot
+                buffer.task.cancel()
+        self._remove(buffer)
+
+    def detach(self, websocket: WebSocket):
+        """Detach a closing connection's streams, keeping their tasks alive."""
+        for buffer in list(self.buffers.values()):
+            if buffer.websocket is websocket:
+                if self.grace_period > 0:
+                    # Out of the connection's task set, so remove_connection doesn't cancel it
+                    manager.discard_task(websocket, buffer.task)
+                self._detach(buffer)
+
+    async def resume(self, websocket: WebSocket, user_input_id: str, session_id: str, last_seq: int) -> bool:
+        """Attach a stream to a connection and replay the frames after last_seq.
+
+        Returns False if the stream is unknown in this session, or frames it
+        missed are no longer buffered.
+        """
+        buffer = self.buffers.get(stream_key(session_id, user_input_id))
+        if buffer is None or buffer.abandoned or buffer.session_id != session_id:
+            return False
+        if buffer.timer is not None:
+            buffer.timer.cancel()
+            buffer.timer = None
+        # A client may resume before the server noticed its old connection drop
+        buffer.websocket = None
+        next_seq = last_seq + 1
+        while True:
+            if buffer.first_seq() > next_seq:
+                logger.info(f"Cannot resume stream {user_input_id} from {last_seq}, frames were dropped")
+                self._expire(buffer)
+                return False
+            missed = [(seq, frame) for seq, frame in buffer.frames if seq >= next_seq]
+            if not missed:
+                break
+            for seq, frame in missed:
+                await manager.send(websocket, frame)
+                next_seq = seq + 1
+        # Caught up with no await since the last check: attach to the live stream
+        if buffer.finished:
+            self._remove(buffer)
+            await manager.send(websocket, buffer.final)
+            return True
+        buffer.websocket = websocket
+        manager.attach_stream(websocket, buffer.record)
+        logger.info(f"Stream {user_input_id} resumed from {last_seq}")
+        return True
+
+# Global resumable stream registry
+resumable_streams = ResumableStreams()
@@ -0,0 +1,193 @@
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Deque, Dict, Hashable, Optional
+from .. import settings
+
+logger = logging.getLogger(__name__)
+
+# Called with (position, queued_total) whenever a waiting request's position changes
+QueuedCallback = Callable[[int, int], Awaitable[None]]
+
+class QueueCancelled(Exception):
+    """Raised when a request is cancelled while waiting for a slot."""
+
+class QueueFull(Exception):
+    """Raised when too many requests are already waiting."""
+
+class Waiter:
+    __slots__ = ("key", "connection", "granted", "changed")
+
+    def __init__(self, key: str, connection: Hashable):
+        self.key = key
+        self.connection = connection
+        self.granted = False
+        self.changed = asyncio.Event()
+
+def parse_weights(spec: str) -> Dict[str, int]:
+    """Parse "key_hash:weight,key_hash:weight" into a weight map."""
+    weights = {}
+    for item in spec.split(","):
+        key, _, weight = item.strip().partition(":")
+        if key and weight.isdigit() and int(weight) > 0:
+            weights[key] = int(weight)
+    return weights
+
+class RequestScheduler:
+    """Admits agent requests under a global and a per-connection concurrency cap.
+
+    Waiting requests are queued per fairness key (the API key hash) and keys
+    are served in weighted round-robin order: a key with weight N may be
+    granted up to N slots before the next key gets its turn. With a single
+    configured API key all requests share one queue, so only the caps apply.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = settings.SCHEDULER_MAX_CONCURRENT,
+        max_per_connection: int = settings.SCHEDULER_MAX_PER_CONNECTION,
+        max_queued: int = settings.SCHEDULER_MAX_QUEUED,
+        weights: Optional[Dict[str, int]] = None
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_per_connection = max_per_connection
+        self.max_queued = max_queued
+        self.weights = weights if weights is not None else parse_weights(settings.SCHEDULER_WEIGHTS)
+        self.running = 0
+        self.running_per_connection: Dict[Hashable, int] = {}
+        # Waiting requests per key, in round-robin order
+        self.queues: "OrderedDict[str, Deque[Waiter]]" = OrderedDict()
+        self.credits: Dict[str, int] = {}
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
+
+    def position(self, waiter: Waiter) -> int:
+        """1-based position of a waiter within its key's queue."""
+        queue = self.queues.get(waiter.key)
+        if not queue:
+            return 0
+        return queue.index(waiter) + 1
+
+    def _can_run(self, connection: Hashable) -> bool:
+        return (
+            self.running < self.max_concurrent and
+            self.running_per_connection.get(connection, 0) < self.max_per_connection
+        )
+
+    def _grant(self, waiter: Waiter):
+        self.running += 1
+        self.running_per_connection[waiter.connection] = self.running_per_connection.get(waiter.connection, 0) + 1
+        waiter.granted = True
+        waiter.changed.set()
+
+    def _release(self, connection: Hashable):
+        self.running -= 1
+        remaining = self.running_per_connection.get(connection, 1) - 1
+        if remaining:
+            self.running_per_connection[connection] = remaining
+        else:
+            self.running_per_connection.pop(connection, None)
+        self._dispatch()
+
+    def _dispatch(self):
+        """Grant free slots to waiting requests in weighted round-robin order."""
+        granted_any = False
+        while self.running < self.max_concurrent and self.queues:
+            granted = False
+            for key in list(self.queues):
+                queue = self.queues[key]
+                waiter = next((w for w in queue if self._can_run(w.connection)), None)
+                if waiter is None:
+                    continue
+                queue.remove(waiter)
+                self._grant(waiter)
+                granted = granted_any = True
+
+                # Stay on this key until its credits run out, then rotate it to the back
+                credits = self.credits.get(key, self.weights.get(key, 1)) - 1
+                if credits <= 0 or not queue:
+                    self.credits.pop(key, None)
+                    self.queues.move_to_end(key)
+                else:
+                    self.credits[key] = credits
+                if not queue:
+                    del self.queues[key]
+                break
+            if not granted:
+                break  # Everything waiting is blocked by its per-connection cap
+
+        if granted_any:
+            # Let the remaining waiters report their new positions
+            for queue in self.queues.values():
+                for waiter in queue:
+                    waiter.changed.set()
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        connection: Hashable,
+        key: str,
+        on_queued: Optional[QueuedCallback] = None,
+        cancel_event: Optional[asyncio.Event] = None
+    ):
+        """Hold a concurrency slot for the duration of a request."""
+        waiter = Waiter(key, connection)
+        if not self.queues and self._can_run(connection):
+            self._grant(waiter)
+        else:
+            if self.queued >= self.max_queued:
+                raise QueueFull()
+            self.queues.setdefault(key, deque()).append(waiter)
+            self._dispatch()
+            try:
+                await self._wait(waiter, on_queued, cancel_event)
+            except BaseException:
+                if waiter.granted:
+                    self._release(connection)
+                else:
+                    self._remove(waiter)
+                raise
+
+        try:
+            yield
+        finally:
+            self._release(connection)
+
+    async def _wait(self, waiter: Waiter, on_queued: Optional[QueuedCallback], cancel_event: Optional[asyncio.Event]):
+        last_position = None
+        while not waiter.granted:
+            if cancel_event is not None and cancel_event.is_set():
+                raise QueueCancelled()
+            position = self.position(waiter)
+            if on_queued is not None and position != last_position:
+                last_position = position
+                await on_queued(position, self.queued)
+                continue  # Re-check, the queue may have moved while notifying
+            waiter.changed.clear()
+            if cancel_event is None:
+                await waiter.changed.wait()
+            else:
+                changed = asyncio.ensure_future(waiter.changed.wait())
+                cancelled = asyncio.ensure_future(cancel_event.wait())
+                try:
+                    await asyncio.wait({changed, cancelled}, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    changed.cancel()
+                    cancelled.cancel()
+
+    def _remove(self, waiter: Waiter):
+        queue = self.queues.get(waiter.key)
+        if queue and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self.queues[waiter.key]
+                self.credits.pop(waiter.key, None)
+            for other in queue:
+                other.changed.set()
+            self._dispatch()
+
+# Global request scheduler instance
+scheduler = RequestScheduler()
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Optional
+from fastapi import WebSocket
+from .. import metrics, settings
+from .codec import Codec, JSON_CODEC
+
+logger = logging.getLogger(__name__)
+
+# What to do when a client's queue is full
+POLICY_COALESCE = "coalesce"  # merge the chunk into the last queued chunk, else pause
+POLICY_DROP = "drop"  # disconnect the slow client
+POLICY_PAUSE = "pause"  # block the sender, which stops reading the agent stream
+POLICIES = (POLICY_COALESCE, POLICY_DROP, POLICY_PAUSE)
+
+# Close code sent to clients dropped for being too slow ("try again later")
+SLOW_CLIENT_CLOSE_CODE = 1013
+
+def merge_chunks(last: dict, frame: dict) -> Optional[dict]:
+    """Merge two chunk frames of the same stream, or return None if they can't be merged."""
+    if last.get("type") != "chunk" or frame.get("type") != "chunk":
+        return None
+    last_metadata = last.get("metadata", {})
+    metadata = frame.get("metadata", {})
+    if last_metadata.get("user_input_id") != metadata.get("user_input_id"):
+        return None
+    merged_metadata = dict(last_metadata)
+    if "tokens" in last_metadata or "tokens" in metadata:
+        merged_metadata["tokens"] = last_metadata.get("tokens", 1) + metadata.get("tokens", 1)
+    if "seq" in metadata:
+        # The merged frame stands for everything up to the later frame
+        merged_metadata["seq"] = metadata["seq"]
+    return {
+        "type": "chunk",
+        "content": last.get("content", "") + frame.get("content", ""),
+        "metadata": merged_metadata
+    }
+
+class SendQueue:
+    """Bounded outbound queue for one WebSocket, drained by a single writer task.
+
+    Handlers enqueue frames instead of writing to the socket, so concurrent
+    tasks never interleave writes and a slow client only holds up to max_size
+    frames in memory. The policy decides what happens when the queue is full.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        codec: Codec = JSON_CODEC,
+        max_size: int = settings.SEND_QUEUE_SIZE,
+        policy: str = settings.SEND_QUEUE_POLICY
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown send queue policy: {policy}")
+        self.websocket = websocket
+        self.codec = codec
+        self.max_size = max_size
+        self.policy = policy
+        self.frames: Deque[dict] = deque()
+        self.closed = False
+        self.coalesced = 0
+        self._ready = asyncio.Event()
+        self._space = asyncio.Event()
+        self._space.set()
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def _enqueue(self, frame: dict):
+        self.frames.append(frame)
+        metrics.send_queue_depth.inc()
+        self._ready.set()
+        if len(self.frames) >= self.max_size:
+            self._space.clear()
+
+    async def send(self, frame: dict) -> bool:
+        """Queue a frame. Returns False if the connection is closed or was dropped."""
+        while not self.closed:
+            if len(self.frames) < self.max_size:
+                self._enqueue(frame)
+                return True
+
+            if self.policy == POLICY_COALESCE and self.frames:
+                merged = merge_chunks(self.frames[-1], frame)
+                if merged is not None:
+                    self.frames[-1] = merged
+                    self.coalesced += 1
+                    return True
+
+            if self.policy == POLICY_DROP:
+                logger.warning("Send queue full, dropping slow client")
+                await self._drop()
+                return False
+
+            # Wait until the writer makes room
+            await self._space.wait()
+        return False
+
+    async def _write_loop(self):
+        try:
+            while True:
+                await self._ready.wait()
+                while self.frames:
+                    frame = self.frames.popleft()
+                    metrics.send_queue_depth.dec()
+                    if len(self.frames) < self.max_size:
+                        self._space.set()
+                    data = self.codec.encode(frame)
+                    metrics.sent_bytes_total.inc(self.codec.name, amount=len(data))
+                    if self.codec.binary:
+                        await self.websocket.send_bytes(data)
+                    else:
+                        await self.websocket.send_text(data)
+                self._ready.clear()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.info(f"Send queue writer stopped: {e}")
+            self._close()
+
+    def _close(self):
+        if self.closed:
+            return
+        self.closed = True
+        metrics.send_queue_depth.dec(amount=len(self.frames))
+        self.frames.clear()
+        # Release any senders waiting for room
+        self._space.set()
+
+    async def _drop(self):
+        self._close()
+        self._writer.cancel()
+        try:
+            await self.websocket.close(code=SLOW_CLIENT_CLOSE_CODE)
+        except Exception:
+            pass  # Connection might be already closed
+
+    def close(self):
+        """Stop the writer and discard any queued frames."""
+        self._close()
+        self._writer.cancel()